@@ -1,25 +1,6 @@
 import os
 import sys
 
-# Use ujson if available
-try:
-    from ujson import dumps as ujson_dumps
-
-    try:
-        assert (ujson_dumps('http://example.com/',
-                            escape_forward_slashes=False) ==
-                '"http://example.com/"')
-    except Exception as e:  # pragma: no cover
-        sys.stderr.write('ujson w/o forward-slash escaping not available,\
-defaulting to regular json\n')
-        raise
-
-    def json_encode(obj):
-        return ujson_dumps(obj, escape_forward_slashes=False)
-
-except:  # pragma: no cover
-    from json import dumps as json_encode
-
 try:  # pragma: no cover
     from collections import OrderedDict
 except ImportError:  # pragma: no cover
@@ -32,6 +13,8 @@ from bisect import insort
 from six import StringIO
 
 from pywb.indexer.archiveindexer import DefaultRecordParser
+from pywb.utils.jsoncodec import json_encode
+from pywb.warcserver.index.sqliteindex import SqliteIndexWriter, SQLITE_EXT
 import codecs
 import six
 
@@ -159,6 +142,30 @@ class SortedCDXWriter(BaseCDXWriter):
         return False
 
 
+#=================================================================
+class SqliteCDXWriter(BaseCDXWriter):
+    """ Add cdx lines to a new or existing sqlite index,
+    instead of writing to an output file
+    """
+    def __init__(self, out):
+        self.index_writer = SqliteIndexWriter(out)
+
+    def __enter__(self):
+        self.out = StringIO()
+        return self
+
+    def write(self, entry, filename):
+        self.out = StringIO()
+        super(SqliteCDXWriter, self).write(entry, filename)
+        line = self.out.getvalue()
+        if line:
+            self.index_writer.add_line(line.encode('utf-8'))
+
+    def __exit__(self, *args):
+        self.index_writer.close()
+        return False
+
+
 #=================================================================
 ALLOWED_EXT = ('.arc', '.arc.gz', '.warc', '.warc.gz')
 
@@ -270,6 +277,10 @@ def write_multi_cdx_index(output, inputs, **options):
                 outfile = sys.stdout.buffer
             else:
                 outfile = sys.stdout
+        elif output.endswith(SQLITE_EXT):
+            outfile = output
+            options['writer_cls'] = SqliteCDXWriter
+            options['writer_add_mixin'] = True
         else:
             outfile = open(output, 'wb')
 
@@ -365,6 +376,8 @@ Output file or directory.
 - If directory, each input file is written to a seperate output file
   with a .cdx extension
 - If output is '-', output is written to stdout
+- If output ends with .sqlite, lines are added to a new or existing
+  sqlite index
 """
 
     input_help = """
@@ -395,6 +395,30 @@ def test_cdxj_middle_empty_records():
     assert len(lines) == 2, lines
 
 
+def test_cdxj_sqlite_append():
+    from pywb.warcserver.index.sqliteindex import SqliteIndexSource
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sqlite_file = os.path.join(tmp_dir, 'index.sqlite')
+
+        main(['-j', sqlite_file, TEST_WARC_DIR + 'example.warc.gz'])
+        main(['-j', sqlite_file, TEST_WARC_DIR + 'iana.warc.gz'])
+
+        # same lines added again are ignored
+        main(['-j', sqlite_file, TEST_WARC_DIR + 'example.warc.gz'])
+
+        source = SqliteIndexSource(sqlite_file)
+        lines = [str(cdx) for cdx in source.load_index(dict(key=b'', end_key=b'~'))]
+
+        expected = (cdx_index('example.warc.gz', cdxj=True, sort=True) +
+                    cdx_index('iana.warc.gz', cdxj=True, sort=True))
+
+        assert lines == sorted(expected.decode('utf-8').rstrip().split('\n'))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
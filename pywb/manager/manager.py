@@ -34,6 +34,8 @@ directory structure expected by pywb
     """
     DEF_INDEX_FILE = 'index.cdxj'
 
+    DEF_SQLITE_INDEX_FILE = 'index.sqlite'
+
     COLL_RX = re.compile('^[\w][-\w]*$')
 
     COLLS_DIR = 'collections'
@@ -119,10 +121,41 @@ directory structure expected by pywb
         self._index_merge_warcs(full_paths, self.DEF_INDEX_FILE)
 
     def reindex(self):
-        cdx_file = os.path.join(self.indexes_dir, self.DEF_INDEX_FILE)
+        cdx_file = self._get_sqlite_index()
+        if cdx_file:
+            os.remove(cdx_file)
+        else:
+            cdx_file = os.path.join(self.indexes_dir, self.DEF_INDEX_FILE)
+
         logging.info('Indexing ' + self.archive_dir + ' to ' + cdx_file)
         self._cdx_index(cdx_file, [self.archive_dir])
 
+    def _get_sqlite_index(self):
+        sqlite_file = os.path.join(self.indexes_dir, self.DEF_SQLITE_INDEX_FILE)
+        if os.path.isfile(sqlite_file):
+            return sqlite_file
+
+    def sqlite_index(self):
+        """ Move all captures in the collection's cdx and cdxj indexes to
+        a sqlite index, to which new captures are then added directly
+        """
+        from pywb.warcserver.index.sqliteindex import SqliteIndexWriter
+
+        sqlite_file = os.path.join(self.indexes_dir, self.DEF_SQLITE_INDEX_FILE)
+
+        cdx_files = [os.path.join(self.indexes_dir, name)
+                     for name in sorted(os.listdir(self.indexes_dir))
+                     if name.endswith(('.cdx', '.cdxj'))]
+
+        with SqliteIndexWriter(sqlite_file) as writer:
+            for cdx_file in cdx_files:
+                logging.info('Adding ' + cdx_file + ' to ' + sqlite_file)
+                with open(cdx_file, 'rb') as fh:
+                    writer.add_lines(fh)
+
+        for cdx_file in cdx_files:
+            os.remove(cdx_file)
+
     def _cdx_index(self, out, input_, rel_root=None):
         from pywb.indexer.cdxindexer import write_multi_cdx_index
 
@@ -157,6 +190,12 @@ directory structure expected by pywb
         self._index_merge_warcs(filtered_warcs, index_file, abs_archive_dir)
 
     def _index_merge_warcs(self, new_warcs, index_file, rel_root=None):
+        # sqlite index is added to in place, no merge needed
+        sqlite_file = self._get_sqlite_index()
+        if sqlite_file and index_file == self.DEF_INDEX_FILE:
+            self._cdx_index(sqlite_file, new_warcs, rel_root)
+            return
+
         cdx_file = os.path.join(self.indexes_dir, index_file)
 
         temp_file = cdx_file + '.tmp.' + timestamp20_now()
@@ -329,6 +368,28 @@ directory structure expected by pywb
 
         migrate.convert_to_cdxj()
 
+    def convert_binary_cdx(self, path, force=False, keep=False):
+        from pywb.manager.migrate import MigrateBinaryCDX
+
+        migrate = MigrateBinaryCDX(path, keep=keep)
+        count = migrate.count_cdx()
+        if count == 0:
+            print('No CDX or CDXJ index files found, nothing to convert')
+            return
+
+        msg = 'Convert {0} index files to binary index? (y/n)'.format(count)
+        if not force:
+            res = get_input(msg)
+            try:
+                res = strtobool(res)
+            except ValueError:
+                res = False
+
+            if not res:
+                return
+
+        migrate.convert_to_binary()
+
 
 #=============================================================================
 def main(args=None):
@@ -398,6 +459,16 @@ Create manage file based web archive collections
     indexwarcs.add_argument('files', nargs='+')
     indexwarcs.set_defaults(func=do_index)
 
+    # Move to sqlite index
+    def do_sqlite(r):
+        m = CollectionsManager(r.coll_name)
+        m.sqlite_index()
+
+    sqlite_help = 'Move collection index to a sqlite index, which new ARCS/WARCS are then added to'
+    sqlite = subparsers.add_parser('sqlite', help=sqlite_help)
+    sqlite.add_argument('coll_name')
+    sqlite.set_defaults(func=do_sqlite)
+
     # Set metadata
     def do_metadata(r):
         m = CollectionsManager(r.coll_name)
@@ -439,6 +510,19 @@ Create manage file based web archive collections
     migrate.add_argument('-f', '--force', action='store_true')
     migrate.set_defaults(func=do_migrate)
 
+    # Convert CDX to binary index
+    def do_binary(r):
+        m = CollectionsManager('', must_exist=False)
+        m.convert_binary_cdx(r.path, r.force, r.keep)
+
+    binary_help = 'Convert sorted CDX and CDXJ indexes to binary (.cdxb) indexes'
+    binary = subparsers.add_parser('cdx-binary', help=binary_help)
+    binary.add_argument('path', default='./', nargs='?')
+    binary.add_argument('-f', '--force', action='store_true')
+    binary.add_argument('-k', '--keep', action='store_true',
+                        help='Keep original index files')
+    binary.set_defaults(func=do_binary)
+
     # Parse
     r = parser.parse_args(args=args)
     r.func(r)
@@ -1,6 +1,7 @@
 from pywb.utils.canonicalize import canonicalize
 from pywb.warcserver.index.cdxobject import CDXObject, URLKEY, ORIGINAL
 from pywb.indexer.cdxindexer import CDXJ
+from pywb.warcserver.index.binaryindex import BinaryCDXFormat, write_binary_cdx
 
 import os
 import shutil
@@ -44,3 +45,35 @@ class MigrateCDX(object):
             os.remove(filename)
 
 
+
+
+#=============================================================================
+class MigrateBinaryCDX(MigrateCDX):
+    CDX_EXT = ('.cdx', '.cdxj')
+
+    def __init__(self, path, keep=False):
+        super(MigrateBinaryCDX, self).__init__(path)
+        self.keep = keep
+
+    def iter_cdx_files(self):
+        if os.path.isfile(self.cdx_dir):
+            if self.cdx_dir.endswith(self.CDX_EXT):
+                yield self.cdx_dir
+            return
+
+        for root, dirs, files in os.walk(self.cdx_dir):
+            for filename in files:
+                if filename.endswith(self.CDX_EXT):
+                    full_path = os.path.join(root, filename)
+                    yield full_path
+
+    def convert_to_binary(self):
+        for filename in list(self.iter_cdx_files()):
+            outfile = os.path.splitext(filename)[0] + BinaryCDXFormat.EXT
+
+            print('Converting {0} -> {1}'.format(filename, outfile))
+
+            write_binary_cdx(filename, outfile)
+
+            if not self.keep:
+                os.remove(filename)
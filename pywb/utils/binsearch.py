@@ -4,10 +4,14 @@ Utility functions for performing binary search over a sorted text file
 
 from collections import deque
 import itertools
+import mmap
 import six
 
+import os
 import sys
 
+from pywb.utils.cache import LRUCache
+
 if six.PY3:
     def cmp(a, b):
         return (a > b) - (a < b)
@@ -50,6 +54,8 @@ def binsearch(reader, key, compare_func=cmp, block_size=8192):
     Perform a binary search for a specified key to within a 'block_size'
     (default 8192) granularity, and return first full line found.
     """
+    if is_buffer(reader):
+        return buffer_binsearch(reader, key, compare_func, block_size)
 
     min_ = binsearch_offset(reader, key, compare_func, block_size)
 
@@ -129,6 +135,124 @@ def iter_range(reader, start, end, prev_size=0):
     return end_iter
 
 
+#=================================================================
+def iter_distinct_keys(reader, start, end, search_func=search, max_scan=16):
+    """
+    Creates an iterator over the first line of each distinct key (first
+    field) where start <= line < end (end exclusive).
+
+    After a line is yielded, up to 'max_scan' lines are read looking for
+    the next key, after which the rest of the key is skipped with a new
+    search for key + '!'
+    """
+    lines = search_func(reader, start)
+    line = next(lines, None)
+
+    while line is not None and line < end:
+        yield line
+
+        next_key = line.split(b' ', 1)[0] + b'!'
+
+        for line in itertools.islice(lines, max_scan):
+            if line >= next_key:
+                break
+        else:
+            lines = search_func(reader, next_key)
+            line = next(lines, None)
+
+
+#=================================================================
+def search_offset(reader, key, compare_func=cmp, block_size=8192):
+    """
+    Return offset of the first line >= 'key', or the end of the
+    file or buffer if there is no such line
+    """
+    if is_buffer(reader):
+        offset = buffer_binsearch_offset(reader, key, compare_func, block_size)
+        if offset > 0:
+            offset = _next_line_offset(reader, offset)  # skip partial line
+
+        size = len(reader)
+        while offset < size:
+            if compare_func is cmp:
+                if _compare_key_at(reader, offset, key) <= 0:
+                    break
+            else:
+                end = _next_line_offset(reader, offset)
+                if compare_func(reader[offset:end].rstrip(), key) >= 0:
+                    break
+
+            offset = _next_line_offset(reader, offset)
+
+        return offset
+
+    offset = binsearch_offset(reader, key, compare_func, block_size)
+    reader.seek(offset)
+
+    if offset > 0:
+        reader.readline()  # skip partial line
+
+    while True:
+        offset = reader.tell()
+        line = reader.readline()
+        if not line or compare_func(line.rstrip(), key) >= 0:
+            return offset
+
+
+#=================================================================
+def iter_lines_reverse(reader, offset, block_size=8192):
+    """
+    Iterate over all lines ending before 'offset' in reverse order,
+    reading backwards one block at a time
+    """
+    remainder = b''
+
+    while offset > 0:
+        size = min(block_size, offset)
+        offset -= size
+
+        if is_buffer(reader):
+            buff = reader[offset:offset + size]
+        else:
+            reader.seek(offset)
+            buff = reader.read(size)
+
+        lines = (buff + remainder).split(b'\n')
+
+        # first line may continue in previous block
+        remainder = lines[0]
+
+        for line in reversed(lines[1:]):
+            line = line.rstrip()
+            if line:
+                yield line
+
+    remainder = remainder.rstrip()
+    if remainder:
+        yield remainder
+
+
+#=================================================================
+def reverse_search(reader, key, compare_func=cmp, block_size=8192):
+    """
+    Perform a binary search for a specified key, and return an
+    iterator over all lines < key, in reverse order
+    """
+    offset = search_offset(reader, key, compare_func, block_size)
+    return iter_lines_reverse(reader, offset, block_size)
+
+
+#=================================================================
+def iter_range_reverse(reader, start, end):
+    """
+    Creates an iterator which iterates over lines where
+    start <= line < end (end exclusive), in reverse order
+    """
+    return itertools.takewhile(
+        lambda line: line >= start,
+        reverse_search(reader, end))
+
+
 #=================================================================
 def iter_prefix(reader, key):
     """
@@ -150,3 +274,138 @@ def iter_exact(reader, key, token=b' '):
     """
 
     return iter_prefix(reader, key + token)
+
+
+#=================================================================
+# Memory-mapped search: same semantics as above, but probes are
+# done directly over an mmap (or bytes) buffer, without seek()/readline()
+#=================================================================
+def is_buffer(reader):
+    return isinstance(reader, (mmap.mmap, bytes))
+
+
+#=================================================================
+def _next_line_offset(buff, offset):
+    """
+    Return offset of the start of the line following 'offset'
+    """
+    end = buff.find(b'\n', offset)
+    if end < 0:
+        return len(buff)
+
+    return end + 1
+
+
+#=================================================================
+def _compare_key_at(buff, offset, key):
+    """
+    Equivalent to cmp(key, line) for the line (with newline) at 'offset',
+    but only slicing out up to len(key) bytes of the line: any difference
+    is within that prefix, and if there is none, the line is longer
+    """
+    end = offset + len(key)
+    prefix = buff[offset:end]
+    if prefix != key:
+        return cmp(key, prefix)
+
+    return -1 if end < len(buff) else 0
+
+
+#=================================================================
+def buffer_binsearch_offset(buff, key, compare_func=cmp, block_size=8192):
+    """
+    Find offset of the line which matches a given 'key' using binary search
+    over an in-memory or memory-mapped buffer.
+    If key is not found, the offset is of the line after the key
+    """
+    min_ = 0
+    max_ = int(len(buff) / block_size)
+
+    while max_ - min_ > 1:
+        mid = int(min_ + ((max_ - min_) / 2))
+        offset = mid * block_size
+
+        if mid > 0:
+            offset = _next_line_offset(buff, offset)  # skip partial line
+
+        if compare_func is cmp:
+            res = _compare_key_at(buff, offset, key)
+        else:
+            res = compare_func(key, buff[offset:_next_line_offset(buff, offset)])
+
+        if res > 0:
+            min_ = mid
+        else:
+            max_ = mid
+
+    return min_ * block_size
+
+
+#=================================================================
+def iter_buffer_lines(buff, offset=0):
+    """
+    Iterate over lines in buffer starting at 'offset',
+    only slicing out each line as it is needed
+    """
+    size = len(buff)
+    while offset < size:
+        end = _next_line_offset(buff, offset)
+        yield buff[offset:end].rstrip()
+        offset = end
+
+
+#=================================================================
+def buffer_binsearch(buff, key, compare_func=cmp, block_size=8192):
+    """
+    Buffer equivalent of binsearch(): return iterator starting at the
+    first full line of the block which may contain the key
+    """
+    min_ = buffer_binsearch_offset(buff, key, compare_func, block_size)
+
+    if min_ > 0:
+        min_ = _next_line_offset(buff, min_)  # skip partial line
+
+    return iter_buffer_lines(buff, min_)
+
+
+#=================================================================
+class MMapCache(object):
+    """
+    Keeps a long-lived read-only memory mapping for each index file,
+    and remaps the file if its mtime or size have changed.
+
+    Up to max_size mappings are kept, least recently used first, and
+    the mapping for a file is dropped once the file is removed.
+
+    The buffer returned from get() may be passed in place of a reader
+    to search(), iter_range(), iter_prefix() and iter_exact()
+    """
+    DEFAULT_MAX_SIZE = 256
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.mappings = LRUCache(max_size)
+
+    def get(self, filename):
+        try:
+            stat = os.stat(filename)
+        except (IOError, OSError):
+            self.mappings.remove(filename)
+            raise
+
+        file_key = (stat.st_mtime, stat.st_size)
+
+        result = self.mappings.get(filename)
+        if result and result[0] == file_key:
+            return result[1]
+
+        # mmap() does not support empty files
+        if stat.st_size == 0:
+            buff = b''
+        else:
+            with open(filename, 'rb') as fh:
+                buff = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # any previous or evicted mapping is not closed explicitly, as it may
+        # still be in use by an active iterator, and is released once unreferenced
+        self.mappings.put(filename, (file_key, buff))
+        return buff
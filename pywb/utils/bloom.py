@@ -0,0 +1,58 @@
+"""
+Simple Bloom filter, for testing set membership with no false negatives
+and a small, configurable rate of false positives.
+
+>>> bloom = BloomFilter(100)
+>>> for x in range(100):
+...     bloom.add(str(x).encode('utf-8'))
+
+>>> all(str(x).encode('utf-8') in bloom for x in range(100))
+True
+
+>>> sum(1 for x in range(100, 10100) if str(x).encode('utf-8') in bloom) < 200
+True
+
+>>> b'' in BloomFilter(0)
+False
+
+>>> bloom.num_bits, bloom.num_hashes
+(959, 7)
+"""
+
+import hashlib
+import math
+import struct
+
+
+#=================================================================
+class BloomFilter(object):
+    DEFAULT_ERROR_RATE = 0.01
+
+    HASH = struct.Struct('<QQ')
+
+    def __init__(self, num_items, error_rate=DEFAULT_ERROR_RATE):
+        num_items = max(num_items, 1)
+
+        # optimal size and number of hashes for expected num items
+        self.num_bits = int(math.ceil(-num_items * math.log(error_rate) /
+                                      (math.log(2) ** 2)))
+
+        self.num_hashes = max(int(round(self.num_bits / float(num_items) *
+                                        math.log(2))), 1)
+
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _iter_bits(self, item):
+        # double hashing from two halves of one digest
+        h1, h2 = self.HASH.unpack(hashlib.md5(item).digest())
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item):
+        for bit in self._iter_bits(item):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[bit >> 3] & (1 << (bit & 7))
+                   for bit in self._iter_bits(item))
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+
+#=============================================================================
+class LRUCache(object):
+    """
+    Simple size-bounded LRU cache.
+
+    Size of each entry is computed with 'size_func' (default: 1 per entry),
+    and least recently used entries are evicted once the total exceeds
+    'max_size'. Hit, miss and eviction counts are tracked for tuning.
+    """
+    def __init__(self, max_size, size_func=None):
+        self.max_size = max_size
+        self.size_func = size_func or (lambda value: 1)
+
+        self.cache = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value, size = self.cache.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        # reinsert as most recently used
+        self.cache[key] = (value, size)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = self.size_func(value)
+
+        # too large to ever fit
+        if size > self.max_size:
+            return
+
+        self.remove(key)
+
+        self.cache[key] = (value, size)
+        self.size += size
+
+        while self.size > self.max_size:
+            self._evict()
+
+    def remove(self, key):
+        try:
+            value, size = self.cache.pop(key)
+        except KeyError:
+            return False
+
+        self.size -= size
+        return True
+
+    def clear(self):
+        self.cache.clear()
+        self.size = 0
+
+    def _evict(self):
+        key, (value, size) = self.cache.popitem(last=False)
+        self.size -= size
+        self.evictions += 1
+        return key, value
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def stats(self):
+        return dict(size=self.size,
+                    max_size=self.max_size,
+                    count=len(self.cache),
+                    hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions)
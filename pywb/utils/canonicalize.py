@@ -4,6 +4,8 @@
 import surt
 import six.moves.urllib.parse as urlparse
 
+from warcio.timeutils import pad_timestamp, PAD_14_DOWN, PAD_14_UP
+
 from pywb.utils.wbexception import BadRequestException
 
 
@@ -85,7 +87,8 @@ index.html?a=b?c=)/')
 
 
 #=================================================================
-def calc_search_range(url, match_type, surt_ordered=True, url_canon=None):
+def calc_search_range(url, match_type, surt_ordered=True, url_canon=None,
+                      from_ts=None, to_ts=None):
     """
     Canonicalize a url (either with custom canonicalizer or
     standard canonicalizer with or without surt)
@@ -93,6 +96,9 @@ def calc_search_range(url, match_type, surt_ordered=True, url_canon=None):
     Then, compute a start and end search url search range
     for a given match type.
 
+    For exact match, the range is also narrowed to captures
+    between from_ts and to_ts timestamps, if specified.
+
     Support match types:
     * exact
     * prefix
@@ -118,6 +124,20 @@ def calc_search_range(url, match_type, surt_ordered=True, url_canon=None):
     >>> calc_search_range('com', 'domain')
     ('com,', 'com-')
 
+    # exact range, narrowed by timestamp
+    >>> calc_search_range('http://example.com/path/file.html', 'exact', from_ts='2014', to_ts='201506')
+    ('com,example)/path/file.html 20140101000000', 'com,example)/path/file.html 20150631235959!')
+
+    >>> calc_search_range('http://example.com/path/file.html', 'exact', from_ts='20140102030405')
+    ('com,example)/path/file.html 20140102030405', 'com,example)/path/file.html!')
+
+    >>> calc_search_range('http://example.com/path/file.html', 'exact', to_ts='2014')
+    ('com,example)/path/file.html', 'com,example)/path/file.html 20141231235959!')
+
+    # timestamp ignored for other match types
+    >>> calc_search_range('http://example.com/path/file.html', 'prefix', from_ts='2014')
+    ('com,example)/path/file.html', 'com,example)/path/file.htmm')
+
     # non-surt ranges
     >>> calc_search_range('http://example.com/path/file.html', 'exact', False)
     ('example.com/path/file.html', 'example.com/path/file.html!')
@@ -151,7 +171,21 @@ def calc_search_range(url, match_type, surt_ordered=True, url_canon=None):
     start_key = url_canon(url)
 
     if match_type == 'exact':
-        end_key = start_key + '!'
+        urlkey = start_key
+        end_key = urlkey + '!'
+
+        # timestamp follows urlkey, padded as in cdx_clamp()
+        if from_ts:
+            if len(from_ts) < 14:
+                from_ts = pad_timestamp(from_ts, PAD_14_DOWN)
+
+            start_key = urlkey + ' ' + from_ts
+
+        if to_ts:
+            if len(to_ts) < 14:
+                to_ts = pad_timestamp(to_ts, PAD_14_UP)
+
+            end_key = urlkey + ' ' + to_ts + '!'
 
     elif match_type == 'prefix':
         # add trailing slash if url has it
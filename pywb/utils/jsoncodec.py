@@ -0,0 +1,155 @@
+"""
+JSON encoding and decoding for cdx lines and cdx api output.
+
+The fastest available library (orjson, ujson or the standard json module)
+is selected for encoding and decoding, but only if it produces the same
+output as the standard json module: same key order, ', ' and ': '
+separators, non-ascii escaped and no escaping of forward slashes.
+
+Run as a script for a micro-benchmark of available codecs:
+
+    python -m pywb.utils.jsoncodec [cdxj file]
+"""
+
+import json
+import sys
+
+
+#=============================================================================
+# libraries in order of preference
+ENCODERS = ['ujson', 'json']
+DECODERS = ['orjson', 'ujson', 'json']
+
+# fast decoders return a plain dict, which only preserves key order on 3.7+
+ORDERED_DICTS = sys.version_info >= (3, 7)
+
+SAMPLE = {'urlkey': 'com,example)/path?a=b', 'timestamp': '20140101000000',
+          'url': 'http://example.com/path?a=b&c="d"', 'mime': 'text/html',
+          'status': '200', 'filename': u'caf\xe9/\U0001f600.warc.gz',
+          'length': 1234, 'offset': 0, 'empty': '', 'esc': '\t\n\\\x00'}
+
+
+#=============================================================================
+def _load_json():
+    return json.dumps, json.loads
+
+
+def _load_ujson():
+    import ujson
+
+    def json_encode(obj):
+        return ujson.dumps(obj, ensure_ascii=True,
+                           escape_forward_slashes=False,
+                           separators=(', ', ': '))
+
+    return json_encode, ujson.loads
+
+
+def _load_orjson():
+    import orjson
+
+    # orjson is stricter than json (no NaN, 64-bit ints only),
+    # so fall back to json for anything it rejects
+    def json_decode(string):
+        try:
+            return orjson.loads(string)
+        except orjson.JSONDecodeError:
+            return json.loads(string)
+
+    # orjson always writes compact utf-8, so only used for decoding
+    return None, json_decode
+
+
+LOADERS = {'json': _load_json,
+           'ujson': _load_ujson,
+           'orjson': _load_orjson,
+          }
+
+
+#=============================================================================
+def get_json_codec(name):
+    """ Return (encoder, decoder) for json library 'name', either of which
+    is None if not available or if not identical to the json module
+    """
+    try:
+        encoder, decoder = LOADERS[name]()
+    except Exception:
+        return None, None
+
+    if name == 'json':
+        return encoder, decoder
+
+    if not _is_same_encoder(encoder):
+        encoder = None
+
+    if not ORDERED_DICTS or not _is_same_decoder(decoder):
+        decoder = None
+
+    return encoder, decoder
+
+
+def _is_same_encoder(encoder):
+    try:
+        return encoder is not None and encoder(SAMPLE) == json.dumps(SAMPLE)
+    except Exception:
+        return False
+
+
+def _is_same_decoder(decoder):
+    string = json.dumps(SAMPLE)
+    try:
+        res = decoder(string)
+        return (res == SAMPLE and list(res.keys()) == list(SAMPLE.keys()) and
+                decoder(string.encode('utf-8')) == SAMPLE)
+    except Exception:
+        return False
+
+
+def _select(names, index):
+    for name in names:
+        func = get_json_codec(name)[index]
+        if func:
+            return name, func
+
+
+#=============================================================================
+json_encoder_name, json_encode = _select(ENCODERS, 0)
+json_decoder_name, json_decode = _select(DECODERS, 1)
+
+
+#=============================================================================
+def benchmark(lines, number=5):  # pragma: no cover
+    import timeit
+
+    blocks = [line.split(b' ', 2)[-1].decode('utf-8') for line in lines]
+    blocks = [block for block in blocks if block.startswith('{')]
+    objs = [json.loads(block) for block in blocks]
+
+    print('{0} json blocks, best of {1}\n'.format(len(blocks), number))
+
+    for name in ('json', 'ujson', 'orjson'):
+        encoder, decoder = get_json_codec(name)
+        for label, func, data in (('decode', decoder, blocks),
+                                  ('encode', encoder, objs)):
+            if not func:
+                print('{0:8} {1}: not available'.format(name, label))
+                continue
+
+            secs = min(timeit.repeat(lambda: [func(x) for x in data],
+                                     number=1, repeat=number))
+
+            print('{0:8} {1}: {2:.1f} ms'.format(name, label, secs * 1000))
+
+    print('\nusing {0} encoder, {1} decoder'.format(json_encoder_name,
+                                                    json_decoder_name))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as fh:
+            lines = fh.readlines()
+    else:
+        line = b'com,example)/ 20140101000000 ' + json.dumps(SAMPLE).encode('utf-8')
+        lines = [line] * 100000
+
+    benchmark(lines)
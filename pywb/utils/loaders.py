@@ -139,6 +139,13 @@ class BaseLoader(object):
     def load(self, url, offset=0, length=-1):
         raise NotImplemented()
 
+    def get_stamp(self, url):
+        """
+        Return a value (eg. ETag) which changes whenever the resource
+        changes, if available without loading it, or None
+        """
+        return None
+
 
 #=================================================================
 class BlockLoader(BaseLoader):
@@ -159,6 +166,10 @@ class BlockLoader(BaseLoader):
         loader, url = self._get_loader_for_url(url)
         return loader.load(url, offset, length)
 
+    def get_stamp(self, url):
+        loader, url = self._get_loader_for_url(url)
+        return loader.get_stamp(url)
+
     def _get_loader_for_url(self, url):
         """
         Determine loading method based on uri
@@ -295,22 +306,38 @@ class HttpLoader(BaseLoader):
         Load a file-like reader over http using range requests
         and an optional cookie created via a cookie_maker
         """
-        headers = {}
+        headers = self._get_headers()
         if offset != 0 or length != -1:
             headers['Range'] = BlockLoader._make_range_header(offset, length)
 
+        r = self._get_session().get(url, headers=headers, stream=True)
+        r.raise_for_status()
+        return r.raw
+
+    def get_stamp(self, url):
+        """
+        Return the ETag or Last-Modified header from a HEAD request
+        """
+        r = self._get_session().head(url, headers=self._get_headers(),
+                                     allow_redirects=True)
+        r.raise_for_status()
+        return r.headers.get('ETag') or r.headers.get('Last-Modified')
+
+    def _get_headers(self):
+        headers = {}
         if self.cookie_maker:
             if isinstance(self.cookie_maker, six.string_types):
                 headers['Cookie'] = self.cookie_maker
             else:
                 headers['Cookie'] = self.cookie_maker.make()
 
+        return headers
+
+    def _get_session(self):
         if not self.session:
             self.session = requests.Session()
 
-        r = self.session.get(url, headers=headers, stream=True)
-        r.raise_for_status()
-        return r.raw
+        return self.session
 
 
 #=================================================================
@@ -321,6 +348,26 @@ class S3Loader(BaseLoader):
         self.aws_secret_access_key = kwargs.get('aws_secret_access_key')
 
     def load(self, url, offset, length):
+        key = self._get_key(url)
+
+        if offset == 0 and length == -1:
+            headers = {}
+        else:
+            headers = {'Range': BlockLoader._make_range_header(offset, length)}
+
+        # Read range
+        key.open_read(headers=headers)
+        return key
+
+    def get_stamp(self, url):
+        """
+        Return the ETag or Last-Modified of the key, from the HEAD request
+        made when looking up the key
+        """
+        key = self._get_key(url)
+        return key.etag or key.last_modified
+
+    def _get_key(self, url):
         if not s3_avail:  #pragma: no cover
            raise IOError('To load from s3 paths, ' +
                           'you must install boto: pip install boto')
@@ -345,16 +392,7 @@ class S3Loader(BaseLoader):
 
         bucket = self.s3conn.get_bucket(bucket_name)
 
-        key = bucket.get_key(parts.path)
-
-        if offset == 0 and length == -1:
-            headers = {}
-        else:
-            headers = {'Range': BlockLoader._make_range_header(offset, length)}
-
-        # Read range
-        key.open_read(headers=headers)
-        return key
+        return bucket.get_key(parts.path)
 
 
 #=================================================================
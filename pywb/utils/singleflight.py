@@ -0,0 +1,49 @@
+from gevent.event import AsyncResult
+
+
+#=============================================================================
+class SingleFlight(object):
+    """
+    Coalesce concurrent calls for the same key: the first caller runs
+    the function, and any callers for the same key arriving while it is
+    still running wait for and share its result (or exception).
+
+    Nothing is kept once the call completes, so this is not a cache:
+    only calls overlapping in time are coalesced.
+    """
+    def __init__(self):
+        self.flights = {}
+
+        self.calls = 0
+        self.shared = 0
+
+    def __call__(self, key, func):
+        """ Return (result, shared), where shared is True if the result
+        is from another caller's call of func
+        """
+        self.calls += 1
+
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            return flight.get(), True
+
+        flight = AsyncResult()
+        self.flights[key] = flight
+
+        try:
+            result = func()
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set(result)
+        finally:
+            self.flights.pop(key, None)
+
+        return result, False
+
+    def stats(self):
+        return dict(calls=self.calls,
+                    shared=self.shared,
+                    in_flight=len(self.flights))
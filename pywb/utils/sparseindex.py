@@ -0,0 +1,286 @@
+"""
+In-memory sparse key index over a sorted text (CDX/CDXJ) file.
+
+The index stores the 'urlkey timestamp' prefix and byte offset of the first
+full line of every block_size bytes of the file, allowing a lookup to bisect
+in memory and then read from a single block, instead of binary searching
+the file itself.
+
+The index is persisted in a sidecar file (<filename>.sidx) and rebuilt
+when the size or mtime of the indexed file changes.
+"""
+
+from array import array
+
+import itertools
+import logging
+import os
+import struct
+import sys
+
+import six
+
+from pywb.utils.binsearch import is_buffer, iter_buffer_lines, linearsearch
+from pywb.utils.cache import LRUCache
+
+
+#=================================================================
+OFFSET_TYPE = 'Q' if six.PY3 else 'L'
+
+logger = logging.getLogger(__name__)
+
+
+#=================================================================
+class SparseIndex(object):
+    MAGIC = b'PYWB-SIDX1\n'
+
+    # indexed file size, indexed file mtime, block size, num entries
+    HEADER = struct.Struct('<qdqq')
+
+    SIDECAR_EXT = '.sidx'
+
+    DEFAULT_BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, file_key, block_size, offsets, key_ends, key_table):
+        self.file_key = file_key
+        self.block_size = block_size
+        self.offsets = offsets
+        self.key_ends = key_ends
+        self.key_table = key_table
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_key(self, i):
+        start = self.key_ends[i - 1] if i > 0 else 0
+        return self.key_table[start:self.key_ends[i]]
+
+    def find_offset(self, key):
+        """
+        Return offset of the block from which a linear search for
+        'key' should start
+        """
+        lo = 0
+        hi = len(self)
+
+        # first entry >= key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        i = lo - 1
+
+        # only the line prefix is stored: if it is also a prefix of the key,
+        # the full line may sort after the key, so start from the previous block
+        while i > 0 and key.startswith(self.get_key(i)):
+            i -= 1
+
+        if i <= 0:
+            return 0
+
+        return self.offsets[i]
+
+    def search(self, reader, key):
+        """
+        Return iterator of lines >= key, reading from a file
+        or buffer starting at the block found in the sparse index
+        """
+        offset = self.find_offset(key)
+
+        if is_buffer(reader):
+            iter_ = iter_buffer_lines(reader, offset)
+        else:
+            iter_ = self._iter_file_lines(reader, offset)
+
+        return linearsearch(iter_, key)
+
+    def iter_range(self, reader, start, end):
+        """
+        Creates an iterator which iterates over lines where
+        start <= line < end (end exclusive)
+        """
+        return itertools.takewhile(lambda line: line < end,
+                                   self.search(reader, start))
+
+    @staticmethod
+    def _iter_file_lines(reader, offset):
+        reader.seek(offset)
+        line = reader.readline()
+        while line:
+            yield line.rstrip()
+            line = reader.readline()
+
+    @staticmethod
+    def get_file_key(filename):
+        stat = os.stat(filename)
+        return (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def get_line_key(line):
+        return b' '.join(line.rstrip().split(b' ', 2)[:2])
+
+    @classmethod
+    def build(cls, filename, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Build sparse index by reading the first full line of each block
+        """
+        file_key = cls.get_file_key(filename)
+
+        offsets = array(OFFSET_TYPE)
+        key_ends = array(OFFSET_TYPE)
+        key_table = bytearray()
+
+        last_offset = -1
+
+        with open(filename, 'rb') as fh:
+            for block_start in six.moves.range(0, file_key[0], block_size):
+                fh.seek(block_start)
+
+                if block_start > 0:
+                    fh.readline()  # skip partial line
+
+                offset = fh.tell()
+
+                # line spans more than one block, already indexed
+                if offset <= last_offset:
+                    continue
+
+                line = fh.readline()
+                if not line:
+                    break
+
+                last_offset = offset
+
+                offsets.append(offset)
+                key_table.extend(cls.get_line_key(line))
+                key_ends.append(len(key_table))
+
+        return cls(file_key, block_size, offsets, key_ends, bytes(key_table))
+
+    @classmethod
+    def load(cls, sidecar, file_key, block_size):
+        """
+        Load sparse index from sidecar file, if it exists and
+        matches the current indexed file and block size
+        """
+        try:
+            fh = open(sidecar, 'rb')
+        except (IOError, OSError):
+            return None
+
+        with fh:
+            if fh.read(len(cls.MAGIC)) != cls.MAGIC:
+                return None
+
+            header = fh.read(cls.HEADER.size)
+            if len(header) != cls.HEADER.size:
+                return None
+
+            size, mtime, sidx_block_size, count = cls.HEADER.unpack(header)
+
+            if (size, mtime) != file_key or sidx_block_size != block_size:
+                return None
+
+            try:
+                offsets = array(OFFSET_TYPE)
+                offsets.fromfile(fh, count)
+
+                key_ends = array(OFFSET_TYPE)
+                key_ends.fromfile(fh, count)
+            except EOFError:
+                return None
+
+            key_table = fh.read()
+
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            key_ends.byteswap()
+
+        if count and len(key_table) != key_ends[-1]:
+            return None
+
+        return cls(file_key, block_size, offsets, key_ends, key_table)
+
+    def save(self, sidecar):
+        """
+        Write sparse index to sidecar file, replacing any existing one
+        """
+        offsets = self.offsets
+        key_ends = self.key_ends
+
+        if sys.byteorder != 'little':
+            offsets = array(OFFSET_TYPE, offsets)
+            offsets.byteswap()
+            key_ends = array(OFFSET_TYPE, key_ends)
+            key_ends.byteswap()
+
+        tmp_sidecar = sidecar + '.tmp.' + str(os.getpid())
+
+        try:
+            with open(tmp_sidecar, 'wb') as fh:
+                fh.write(self.MAGIC)
+                fh.write(self.HEADER.pack(self.file_key[0], self.file_key[1],
+                                          self.block_size, len(self)))
+                offsets.tofile(fh)
+                key_ends.tofile(fh)
+                fh.write(self.key_table)
+
+            os.rename(tmp_sidecar, sidecar)
+        except:
+            if os.path.isfile(tmp_sidecar):
+                os.remove(tmp_sidecar)
+            raise
+
+    @classmethod
+    def load_or_build(cls, filename, block_size=DEFAULT_BLOCK_SIZE):
+        sidecar = filename + cls.SIDECAR_EXT
+        file_key = cls.get_file_key(filename)
+
+        sidx = cls.load(sidecar, file_key, block_size)
+        if sidx is not None:
+            return sidx
+
+        logger.debug('Building sparse index for: ' + filename)
+        sidx = cls.build(filename, block_size)
+
+        try:
+            sidx.save(sidecar)
+        except (IOError, OSError) as e:
+            # not fatal, eg. read-only index dir: index is kept in memory only
+            logger.debug('Unable to save sparse index: ' + str(e))
+
+        return sidx
+
+
+#=================================================================
+class SparseIndexCache(object):
+    """
+    Keeps the sparse index for each file, reloading or rebuilding
+    it if the file's size or mtime have changed
+
+    Up to max_size indexes are kept, least recently used first, and
+    the index for a file is dropped once the file is removed
+    """
+    DEFAULT_MAX_SIZE = 1000
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.indexes = LRUCache(max_size)
+
+    def get(self, filename, block_size=SparseIndex.DEFAULT_BLOCK_SIZE):
+        try:
+            file_key = SparseIndex.get_file_key(filename)
+        except (IOError, OSError):
+            self.indexes.remove(filename)
+            raise
+
+        sidx = self.indexes.get(filename)
+        if (sidx is not None and sidx.file_key == file_key and
+            sidx.block_size == block_size):
+            return sidx
+
+        sidx = SparseIndex.load_or_build(filename, block_size)
+        self.indexes.put(filename, sidx)
+        return sidx
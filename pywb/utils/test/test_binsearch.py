@@ -68,12 +68,64 @@ org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 I
 org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
 
 
+# Reverse Range Search (end exclusive)
+>>> print_reverse_results_range('org,iana)/about', 'org,iana)/domains')
+org,iana)/dnssec 20140126201307 https://www.iana.org/dnssec text/html 200 PHLRSX73EV3WSZRFXMWDO6BRKTVUSASI - - 2278 773766 iana.warc.gz
+org,iana)/dnssec 20140126201306 http://www.iana.org/dnssec text/html 302 3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ - - 442 772827 iana.warc.gz
+org,iana)/about/performance/ietf-statistics 20140126200804 http://www.iana.org/about/performance/ietf-statistics text/html 302 HNYDN7XRX46RQTT2OFIWXKEYMZQAJWHD - - 582 581890 iana.warc.gz
+org,iana)/about/performance/ietf-draft-status 20140126200815 http://www.iana.org/about/performance/ietf-draft-status text/html 302 Y7CTA2QZUSCDTJCSECZNSPIBLJDO7PJJ - - 584 596566 iana.warc.gz
+org,iana)/about 20140126200706 http://www.iana.org/about text/html 200 6G77LZKFAVKH4PCWWKMW6TRJPSHWUBI3 - - 2962 483588 iana.warc.gz
+
+>>> print_reverse_results_range('a)/', 'a-')
+
+>>> print_reverse_results_range('org,iana)/protocols', 'z-')
+org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
+org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 IRUJZEUAXOUUG224ZMI4VWTUPJX6XJTT - - 63663 496277 iana.warc.gz
+
+# Reverse Search -- same as forward search reversed, reading back across blocks
+>>> all(compare_forward_and_reverse(line.split(b' ', 1)[0]) for line in open(test_cdx_dir + 'iana.cdx', 'rb'))
+True
+
+# Distinct Keys -- first line of each key, seeking past remaining lines
+>>> print_distinct_keys('org,iana)/_css', 'org,iana)/_img', max_scan=1)
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf application/octet-stream 200 LNMEDYOENSOEI5VPADCKL3CB6N3GWXPR - - 34054 620049 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200625 http://www.iana.org/_css/2013.1/fonts/OpenSans-Bold.ttf application/octet-stream 200 YFUR5ALIWJMWV6FAAFRLVRQNXZQF5HRW - - 117166 198285 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-regular.ttf 20140126200626 http://www.iana.org/_css/2013.1/fonts/OpenSans-Regular.ttf application/octet-stream 200 GVSO2C2TMPPVZ4TXYFXAY27NYWTIEIL7 - - 114499 83293 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-semibold.ttf 20140126200654 http://www.iana.org/_css/2013.1/fonts/OpenSans-Semibold.ttf application/octet-stream 200 6HXHVHDNCPXC2ZBKQBWATZZXE5PGCN4S - - 116641 329393 iana.warc.gz
+org,iana)/_css/2013.1/print.css 20140126200625 http://www.iana.org/_css/2013.1/print.css text/css 200 VNBXHMUNWJQC5OWWGZ3X7GM5C7X6ZAB4 - - 4662 50482 iana.warc.gz
+org,iana)/_css/2013.1/screen.css 20140126200625 http://www.iana.org/_css/2013.1/screen.css text/css 200 BUAEPXZNN44AIX3NLXON4QDV6OY2H5QD - - 8754 41238 iana.warc.gz
+
+>>> all(compare_distinct_keys(max_scan) for max_scan in (0, 1, 16))
+True
+
+
+# MMap Search -- same results as file search
+>>> print_mmap_results_range('org,iana)/about', 'org,iana)/about!', iter_range, prev_size=1)
+org,iana)/_js/2013.1/jquery.js 20140126201307 https://www.iana.org/_js/2013.1/jquery.js warc/revisit - AAW2RS7JB7HTF666XNZDQYJFA6PDQBPO - - 543 778507 iana.warc.gz
+org,iana)/about 20140126200706 http://www.iana.org/about text/html 200 6G77LZKFAVKH4PCWWKMW6TRJPSHWUBI3 - - 2962 483588 iana.warc.gz
+
+>>> print_mmap_results_range('org,iana)/protocols', 'z-', iter_range)
+org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 IRUJZEUAXOUUG224ZMI4VWTUPJX6XJTT - - 63663 496277 iana.warc.gz
+org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
+
+>>> print_mmap_results_range('a)/', 'a-', iter_range)
+
+>>> all(compare_file_and_mmap(line.split(b' ', 1)[0]) for line in open(test_cdx_dir + 'iana.cdx', 'rb'))
+True
+
+# MMap Cache -- mapping reused while file unchanged
+>>> mmap_cache.get(test_cdx_dir + 'iana.cdx') is mmap_cache.get(test_cdx_dir + 'iana.cdx')
+True
+
+
 """
 
 
 #=================================================================
 import os
-from pywb.utils.binsearch import iter_prefix, iter_exact, iter_range
+from pywb.utils.binsearch import iter_prefix, iter_exact, iter_range, MMapCache
+from pywb.utils.binsearch import iter_range_reverse, reverse_search
+from pywb.utils.binsearch import iter_distinct_keys
 
 from pywb import get_test_dir
 
@@ -90,6 +142,48 @@ def print_binsearch_results_range(key, end_key, iter_func, prev_size=0):
         for line in iter_func(cdx, key.encode('utf-8'), end_key.encode('utf-8'), prev_size=prev_size):
             print(line.decode('utf-8'))
 
+def print_reverse_results_range(key, end_key):
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
+        for line in iter_range_reverse(cdx, key.encode('utf-8'), end_key.encode('utf-8')):
+            print(line.decode('utf-8'))
+
+mmap_cache = MMapCache()
+
+def print_mmap_results_range(key, end_key, iter_func, prev_size=0):
+    buff = mmap_cache.get(test_cdx_dir + 'iana.cdx')
+    for line in iter_func(buff, key.encode('utf-8'), end_key.encode('utf-8'), prev_size=prev_size):
+        print(line.decode('utf-8'))
+
+def compare_forward_and_reverse(key):
+    buff = mmap_cache.get(test_cdx_dir + 'iana.cdx')
+    end_key = key + b'!'
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
+        forward = list(iter_range(cdx, b'org,iana)/', end_key))
+        reverse = list(reverse_search(cdx, end_key, block_size=256))
+        reverse = reverse[:len(forward)]
+        return (forward[::-1] == reverse ==
+                list(iter_range_reverse(buff, b'org,iana)/', end_key)))
+
+def print_distinct_keys(key, end_key, max_scan=16):
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
+        for line in iter_distinct_keys(cdx, key.encode('utf-8'), end_key.encode('utf-8'), max_scan=max_scan):
+            print(line.decode('utf-8'))
+
+def compare_distinct_keys(max_scan):
+    buff = mmap_cache.get(test_cdx_dir + 'iana.cdx')
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
+        lines = list(iter_range(cdx, b' ', b'~'))
+        exp = [line for i, line in enumerate(lines)
+               if i == 0 or line.split(b' ', 1)[0] != lines[i - 1].split(b' ', 1)[0]]
+
+        return (exp == list(iter_distinct_keys(cdx, b' ', b'~', max_scan=max_scan)) ==
+                list(iter_distinct_keys(buff, b' ', b'~', max_scan=max_scan)))
+
+def compare_file_and_mmap(key):
+    buff = mmap_cache.get(test_cdx_dir + 'iana.cdx')
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
+        return list(iter_exact(cdx, key)) == list(iter_exact(buff, key))
+
 
 if __name__ == "__main__":
     import doctest
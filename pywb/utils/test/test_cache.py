@@ -0,0 +1,42 @@
+from pywb.utils.cache import LRUCache
+
+
+#=================================================================
+def test_lru_cache_count():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    assert cache.get('a') == 1
+
+    # 'b' least recently used
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+    assert cache.stats() == dict(size=2, max_size=2, count=2,
+                                 hits=3, misses=1, evictions=1)
+
+
+def test_lru_cache_size_func():
+    cache = LRUCache(10, size_func=len)
+    cache.put('a', b'12345')
+    cache.put('b', b'123')
+    cache.put('c', b'1234')
+
+    assert 'a' not in cache
+    assert cache.size == 7
+
+    # too large to cache
+    cache.put('d', b'12345678901')
+    assert 'd' not in cache
+
+    # replace existing
+    cache.put('b', b'1')
+    assert cache.size == 5
+
+    assert cache.remove('c')
+    assert not cache.remove('c')
+    assert cache.size == 1
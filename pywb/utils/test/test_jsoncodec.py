@@ -0,0 +1,37 @@
+from pywb.utils.jsoncodec import json_encode, json_decode, get_json_codec
+from pywb import get_test_dir
+
+import json
+import pytest
+
+
+#=================================================================
+def load_cdxj_blocks():
+    with open(get_test_dir() + 'cdxj/iana.cdxj', 'rb') as fh:
+        return [line.rstrip().split(b' ', 2)[-1].decode('utf-8') for line in fh]
+
+
+#=================================================================
+def test_default_codec():
+    obj = {'url': 'http://example.com/a?b=c', 'mime': 'text/html', 'filename': u'caf\xe9.warc.gz'}
+    assert json_encode(obj) == '{"url": "http://example.com/a?b=c", "mime": "text/html", "filename": "caf\\u00e9.warc.gz"}'
+    assert list(json_decode(json_encode(obj)).items()) == list(obj.items())
+
+
+@pytest.mark.parametrize('name', ['json', 'ujson', 'orjson'])
+def test_same_as_json(name):
+    encoder, decoder = get_json_codec(name)
+    if not encoder and not decoder:
+        pytest.skip(name + ' not available')
+
+    for block in load_cdxj_blocks():
+        obj = json.loads(block)
+        if encoder:
+            assert encoder(obj) == json.dumps(obj)
+
+        if decoder:
+            assert list(decoder(block).items()) == list(obj.items())
+
+
+def test_unknown_codec():
+    assert get_json_codec('unknown') == (None, None)
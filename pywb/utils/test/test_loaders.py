@@ -80,6 +80,7 @@ import six
 from six import StringIO
 from io import BytesIO
 import requests
+from mock import patch
 
 from pywb.utils.loaders import BlockLoader, HMACCookieMaker, to_file_url
 from pywb.utils.loaders import extract_client_cookie
@@ -106,6 +107,21 @@ def test_s3_read_1():
     assert reader.readline() == b'WARC/1.0\r\n'
     assert reader.readline() == b'WARC-Type: response\r\n'
 
+def test_http_get_stamp_with_cookie():
+    res = requests.Response()
+    res.status_code = 200
+    res.headers['ETag'] = '"abc"'
+
+    with patch('requests.Session.head', return_value=res) as head:
+        assert BlockLoader(cookie='some=value').get_stamp('http://example.com/') == '"abc"'
+
+    head.assert_called_once_with('http://example.com/', headers={'Cookie': 'some=value'},
+                                 allow_redirects=True)
+
+
+def test_file_get_stamp_none():
+    assert BlockLoader().get_stamp(test_cdx_dir + 'iana.cdx') is None
+
 # Error
 def test_err_no_such_file():
     # no such file
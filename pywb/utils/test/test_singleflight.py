@@ -0,0 +1,46 @@
+from pywb.utils.singleflight import SingleFlight
+
+import gevent
+
+
+#=================================================================
+def slow_call(calls, result=None, exc=None):
+    def func():
+        calls.append(1)
+        gevent.sleep(0.01)
+        if exc:
+            raise exc
+
+        return result
+
+    return func
+
+
+def test_shared_result():
+    single_flight = SingleFlight()
+    calls = []
+
+    jobs = [gevent.spawn(single_flight, 'key', slow_call(calls, 'value')) for i in range(3)]
+    jobs.append(gevent.spawn(single_flight, 'other', slow_call(calls, 'other')))
+    gevent.joinall(jobs)
+
+    assert [job.value for job in jobs] == [('value', False), ('value', True),
+                                           ('value', True), ('other', False)]
+    assert len(calls) == 2
+    assert single_flight.stats() == {'calls': 4, 'shared': 2, 'in_flight': 0}
+
+
+def test_shared_exception():
+    single_flight = SingleFlight()
+    calls = []
+
+    jobs = [gevent.spawn(single_flight, 'key', slow_call(calls, exc=ValueError('err')))
+            for i in range(2)]
+    gevent.joinall(jobs)
+
+    assert len(calls) == 1
+    assert all(isinstance(job.exception, ValueError) for job in jobs)
+
+    # not remembered once done
+    assert single_flight('key', slow_call(calls, 'value')) == ('value', False)
+    assert len(calls) == 2
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from pywb.utils.binsearch import iter_range, iter_prefix, MMapCache
+from pywb.utils.sparseindex import SparseIndex, SparseIndexCache
+
+from pywb import get_test_dir
+
+
+#=================================================================
+class TestSparseIndex(object):
+    @classmethod
+    def setup_class(cls):
+        cls.root_dir = tempfile.mkdtemp()
+        cls.cdx_file = os.path.join(cls.root_dir, 'iana.cdx')
+        shutil.copy(get_test_dir() + 'cdx/iana.cdx', cls.cdx_file)
+
+        with open(cls.cdx_file, 'rb') as fh:
+            cls.keys = [line.split(b' ', 1)[0] for line in fh]
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.root_dir)
+
+    def compare_range(self, sidx, reader_func):
+        for key in self.keys + [b'a)/', b'z)/']:
+            for end_key in (key + b'!', key + b' 20140126201', b'z-'):
+                with open(self.cdx_file, 'rb') as fh:
+                    expected = list(iter_range(fh, key, end_key))
+
+                reader = reader_func()
+                assert list(sidx.iter_range(reader, key, end_key)) == expected
+
+    def test_build_and_search(self):
+        sidx = SparseIndex.build(self.cdx_file, 1024)
+        assert len(sidx) > 20
+        assert sidx.get_key(0).startswith(b' CDX')
+
+        self.compare_range(sidx, lambda: open(self.cdx_file, 'rb'))
+
+    def test_search_mmap(self):
+        sidx = SparseIndex.build(self.cdx_file, 512)
+        mmap_cache = MMapCache()
+
+        self.compare_range(sidx, lambda: mmap_cache.get(self.cdx_file))
+
+    def test_mmap_search_same_as_file(self):
+        buff = MMapCache().get(self.cdx_file)
+
+        # keys which are a prefix of, equal to, or longer than lines
+        for key in self.keys + [b'org,iana)/', b'org,iana)/_css', b' ', b'~']:
+            for end_key in (key + b'!', key + b' 20140126201', key + b' ~'):
+                with open(self.cdx_file, 'rb') as fh:
+                    expected = list(iter_range(fh, key, end_key))
+
+                assert list(iter_range(buff, key, end_key)) == expected
+
+            with open(self.cdx_file, 'rb') as fh:
+                assert list(iter_prefix(buff, key)) == list(iter_prefix(fh, key))
+
+    def test_mmap_cache_bounded(self):
+        filenames = []
+        for i in range(3):
+            filename = os.path.join(self.root_dir, 'mmap-{0}.cdx'.format(i))
+            shutil.copy(self.cdx_file, filename)
+            filenames.append(filename)
+
+        mmap_cache = MMapCache(max_size=2)
+        buffs = [mmap_cache.get(filename) for filename in filenames]
+
+        assert len(mmap_cache.mappings) == 2
+        assert filenames[0] not in mmap_cache.mappings
+        assert mmap_cache.get(filenames[2]) is buffs[2]
+
+        # removed file, mapping dropped
+        os.remove(filenames[2])
+        with pytest.raises(OSError):
+            mmap_cache.get(filenames[2])
+
+        assert filenames[2] not in mmap_cache.mappings
+        assert len(mmap_cache.mappings) == 1
+
+        # replaced file, remapped
+        with open(filenames[1], 'ab') as fh:
+            fh.write(b'zz,example)/ 20170101000000 http://example.zz/ text/html 200 ABC - - 100 200 zz.warc.gz\n')
+
+        assert mmap_cache.get(filenames[1]) is not buffs[1]
+        assert len(mmap_cache.mappings) == 1
+
+    def test_sidecar_save_load(self):
+        sidx = SparseIndex.load_or_build(self.cdx_file, 2048)
+        sidecar = self.cdx_file + SparseIndex.SIDECAR_EXT
+        assert os.path.isfile(sidecar)
+
+        loaded = SparseIndex.load(sidecar, sidx.file_key, 2048)
+        assert list(loaded.offsets) == list(sidx.offsets)
+        assert loaded.key_table == sidx.key_table
+
+        # different block size, not loaded
+        assert SparseIndex.load(sidecar, sidx.file_key, 4096) is None
+
+    def test_cache_rebuild_on_change(self):
+        cache = SparseIndexCache()
+        sidx = cache.get(self.cdx_file, 2048)
+        assert cache.get(self.cdx_file, 2048) is sidx
+
+        new_line = b'zz,example)/ 20170101000000 http://example.zz/ text/html 200 ABC - - 100 200 zz.warc.gz\n'
+        with open(self.cdx_file, 'ab') as fh:
+            fh.write(new_line)
+
+        new_sidx = cache.get(self.cdx_file, 2048)
+        assert new_sidx is not sidx
+        assert new_sidx.file_key[0] == sidx.file_key[0] + len(new_line)
+
+        with open(self.cdx_file, 'rb') as fh:
+            assert list(new_sidx.iter_range(fh, b'zz,example)/', b'zz,example)/!')) == [new_line.rstrip()]
+
+    def test_cache_bounded(self):
+        filename = os.path.join(self.root_dir, 'bounded.cdx')
+        shutil.copy(self.cdx_file, filename)
+
+        cache = SparseIndexCache(max_size=1)
+        cache.get(self.cdx_file, 2048)
+        cache.get(filename, 2048)
+
+        assert len(cache.indexes) == 1
+        assert self.cdx_file not in cache.indexes
+
+        os.remove(filename)
+        with pytest.raises(OSError):
+            cache.get(filename, 2048)
+
+        assert len(cache.indexes) == 0
@@ -4,9 +4,12 @@ from pywb.utils.memento import MementoUtils
 
 from warcio.recordloader import ArchiveLoadFailed
 
+from pywb.warcserver.index.cdxobject import CDXException
+from pywb.warcserver.index.query import CDXQuery
 from pywb.warcserver.index.fuzzymatcher import FuzzyMatcher
 from pywb.warcserver.resource.responseloader import  WARCPathLoader, LiveWebLoader, VideoLoader
 
+import json
 import six
 
 
@@ -44,8 +47,22 @@ class IndexHandler(object):
         self.opts = opts or {}
         self.fuzzy = FuzzyMatcher('pkg://pywb/rules.yaml')
 
+    # params of each bulk entry, also allowed from the query
+    BULK_ENTRY_PARAMS = ('url', 'closest', 'filter', 'matchType', 'from', 'to')
+
+    # max size of a bulk POST body, and max lookups per request
+    MAX_BULK_BODY_SIZE = 1024 * 1024
+    MAX_BULK_ENTRIES = 10000
+
     def get_supported_modes(self):
-        return dict(modes=['list_sources', 'index'])
+        return dict(modes=['list_sources', 'index', 'bulk', 'stats'])
+
+    def get_stats(self, params):
+        stats = self.index_source.get_stats(params)
+
+        not_found_cache = self.fuzzy.not_found_cache
+        stats['not_found_cache'] = not_found_cache.stats() if not_found_cache else None
+        return stats
 
     def _load_index_source(self, params):
         url = params.get('url')
@@ -57,6 +74,13 @@ class IndexHandler(object):
         if input_req:
             params['alt_url'] = input_req.include_post_query(url)
 
+        # no fuzzy match when paging through exact results
+        if params.get('resumeKey') or params.get('showResumeKey'):
+            try:
+                return self.index_source(params)
+            except CDXException as ce:
+                return None, dict(last_exc=ce)
+
         return self.fuzzy(self.index_source, params)
 
     def __call__(self, params):
@@ -64,6 +88,12 @@ class IndexHandler(object):
         if mode == 'list_sources':
             return {}, self.index_source.get_source_list(params), {}
 
+        if mode == 'bulk':
+            return self.handle_bulk(params)
+
+        if mode == 'stats':
+            return {}, self.get_stats(params), {}
+
         if mode != 'index':
             return {}, self.get_supported_modes(), {}
 
@@ -91,8 +121,156 @@ class IndexHandler(object):
                     line = line.encode('utf-8')
                 yield line
 
+            # set once all captures for the page have been read
+            resume_key = params.get('_resume_key')
+            if resume_key:
+                yield self.format_resume_key(output, resume_key)
+
         return out_headers, check_str(res), errs
 
+    @staticmethod
+    def format_resume_key(output, resume_key):
+        """ Resume key following the captures, after an empty line,
+        or as a json line with only a 'resumeKey'
+        """
+        if output == 'json':
+            line = json.dumps({'resumeKey': resume_key}) + '\n'
+        elif output == 'link':
+            return b''
+        else:
+            line = '\n' + resume_key + '\n'
+
+        return line.encode('utf-8')
+
+    def handle_bulk(self, params):
+        """ Find the best capture for each of a batch of lookups, POSTed
+        as one json object per line, eg. {"url": ..., "closest": ...}
+
+        Each lookup is a separate query, but identical lookups are only
+        done once, and lookups are done in index key order, so that
+        consecutive queries read nearby index blocks and pages, likely
+        already cached. Results are returned as ndjson in input order,
+        with an "error" for lookups with no capture.
+
+        The body is limited to MAX_BULK_BODY_SIZE bytes and
+        MAX_BULK_ENTRIES lookups, which also bounds the results held
+        back until all earlier lookups are done.
+        """
+        input_req = params.get('_input_req')
+        body = None
+        if input_req and input_req.get_req_method() == 'POST':
+            body = input_req.get_req_body()
+
+        if not body:
+            msg = 'A POST body with one json lookup per line is required'
+            return None, None, dict(last_exc=BadRequestException(msg))
+
+        body = body.read(self.MAX_BULK_BODY_SIZE + 1)
+        if len(body) > self.MAX_BULK_BODY_SIZE:
+            msg = 'Bulk lookup body is over {0} bytes'.format(self.MAX_BULK_BODY_SIZE)
+            return None, None, dict(last_exc=BadRequestException(msg))
+
+        try:
+            entries = self._parse_bulk_entries(body, params)
+        except BadRequestException as be:
+            return None, None, dict(last_exc=be)
+
+        fields = params.get('fields')
+        if fields and isinstance(fields, str):
+            fields = fields.split(',')
+
+        content_type = 'application/x-ndjson'
+        return {'Content-Type': content_type}, self._iter_bulk(entries, fields), {}
+
+    def _parse_bulk_entries(self, body, params):
+        base_params = dict((n, v) for n, v in six.iteritems(params)
+                           if not n.startswith('_') and
+                           n not in self.BULK_ENTRY_PARAMS and n != 'mode')
+
+        base_params['limit'] = '1'
+
+        entries = []
+        for i, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line.decode('utf-8'))
+                url = entry['url']
+            except Exception:
+                msg = 'Invalid bulk lookup on line {0}'.format(i + 1)
+                raise BadRequestException(msg)
+
+            entry_params = dict(base_params)
+            for name in self.BULK_ENTRY_PARAMS:
+                value = entry.get(name)
+                if value is None:
+                    value = params.get(name)
+
+                if value is None:
+                    continue
+
+                if name == 'filter' and isinstance(value, list):
+                    entry_params[name] = [str(v) for v in value]
+                else:
+                    entry_params[name] = str(value)
+
+            entries.append((url, entry_params))
+
+            if len(entries) > self.MAX_BULK_ENTRIES:
+                msg = 'Bulk lookup is over {0} lookups'.format(self.MAX_BULK_ENTRIES)
+                raise BadRequestException(msg)
+
+        return entries
+
+    def _iter_bulk(self, entries, fields):
+        # identical lookups are only done once
+        lookups = {}
+        for i, (url, entry_params) in enumerate(entries):
+            lookup_key = json.dumps(entry_params, sort_keys=True)
+            lookups.setdefault(lookup_key, (entry_params, []))[1].append(i)
+
+        def sort_key(lookup):
+            entry_params, _ = lookup
+            try:
+                key = CDXQuery(dict(entry_params)).key
+            except CDXException:
+                key = b''
+
+            return key, entry_params.get('closest', '')
+
+        results = [None] * len(entries)
+        next_i = 0
+
+        for entry_params, indexes in sorted(six.itervalues(lookups), key=sort_key):
+            line = self._bulk_lookup(entry_params, fields)
+            for i in indexes:
+                results[i] = line
+
+            # yield results in input order as soon as available
+            while next_i < len(results) and results[next_i] is not None:
+                yield results[next_i]
+                results[next_i] = None
+                next_i += 1
+
+    def _bulk_lookup(self, params, fields):
+        url = params['url']
+        try:
+            cdx_iter, errs = self.fuzzy(self.index_source, dict(params))
+            for cdx in cdx_iter:
+                line = cdx.to_json(fields)
+                break
+            else:
+                line = json.dumps({'url': url, 'error': 'No Captures Found'}) + '\n'
+
+        except WbException as wbe:
+            line = json.dumps({'url': url, 'error': str(wbe)}) + '\n'
+
+        if isinstance(line, six.text_type):
+            line = line.encode('utf-8')
+
+        return line
+
 
 #=============================================================================
 class ResourceHandler(IndexHandler):
@@ -105,6 +283,17 @@ class ResourceHandler(IndexHandler):
         res['modes'].append('resource')
         return res
 
+    def get_stats(self, params):
+        stats = super(ResourceHandler, self).get_stats(params)
+
+        stats['record_coalescer'] = None
+        for loader in self.resource_loaders:
+            if isinstance(loader, WARCPathLoader):
+                stats['record_coalescer'] = loader.get_stats()
+                break
+
+        return stats
+
     def __call__(self, params):
         if params.get('mode', 'resource') != 'resource':
             return super(ResourceHandler, self).__call__(params)
@@ -133,8 +322,9 @@ class ResourceHandler(IndexHandler):
 
 #=============================================================================
 class DefaultResourceHandler(ResourceHandler):
-    def __init__(self, index_source, warc_paths='', forward_proxy_prefix=''):
-        loaders = [WARCPathLoader(warc_paths, index_source),
+    def __init__(self, index_source, warc_paths='', forward_proxy_prefix='',
+                 coalesce_size=0):
+        loaders = [WARCPathLoader(warc_paths, index_source, coalesce_size),
                    LiveWebLoader(forward_proxy_prefix),
                    VideoLoader()
                   ]
@@ -5,25 +5,58 @@ import json
 import time
 import os
 
-from warcio.timeutils import timestamp_now
+from warcio.timeutils import timestamp_now, timestamp_to_sec
 
-from heapq import merge
-from collections import deque
 from itertools import chain
+from functools import partial
 
 from pywb.utils.wbexception import NotFoundException, WbException
 from pywb.utils.format import ParamFormatter, res_template
 
 from pywb.warcserver.index.indexsource import FileIndexSource, RedisIndexSource
-from pywb.warcserver.index.cdxops import process_cdx
+from pywb.warcserver.index.binaryindex import BinaryIndexSource
+from pywb.warcserver.index.sqliteindex import SqliteIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.warcserver.index.cdxops import process_cdx, cdx_merge
+from pywb.warcserver.index.cdxops import cdx_merge_closest, cdx_sort_all_closest
+from pywb.warcserver.index.cdxops import cdx_merge_reverse, cdx_reverse
+from pywb.warcserver.index.cdxops import make_line_filter
 from pywb.warcserver.index.query import CDXQuery
+from pywb.warcserver.index.resultcache import ResultCache
+from pywb.warcserver.index.sourcestats import SourceStats
 
 import six
 import glob
+import logging
+
+
+logger = logging.getLogger('warcserver')
 
 
 #=============================================================================
 class BaseAggregator(object):
+    # merged results of child sources are also in closest or reverse order
+    supports_closest_seek = True
+    supports_reverse_seek = True
+
+    # max originals kept when resolving revisits, default if not set
+    revisit_cache_size = None
+
+    # ResultCache for query results, if set
+    result_cache = None
+
+    # QueryCoalescer for identical concurrent queries, if set
+    query_coalescer = None
+
+    # params not used when looking up the original of a revisit
+    REVISIT_LOOKUP_SKIP_PARAMS = ('alt_url', 'matchType', 'key', 'end_key',
+                                  'from', 'from_ts', 'to', 'closest', 'sort',
+                                  'reverse', 'limit', 'filter', 'collapse',
+                                  'collapseTime', 'resolveRevisits',
+                                  'page', 'pageSize', 'showNumPages',
+                                  'showPagedIndex', 'resumeKey',
+                                  'showResumeKey', 'fl', 'fields')
+
     def __call__(self, params):
         if params.get('closest') == 'now':
             params['closest'] = timestamp_now()
@@ -34,11 +67,87 @@ class BaseAggregator(object):
 
         query = CDXQuery(params)
 
+        # load captures in closest order from each source, if possible
+        params['_closest_seek'] = query.closest_seek
+
+        # or in reverse order, if possible
+        params['_reverse_seek'] = query.reverse_seek
+
+        # skip parsing index lines which can not match filters
+        params['_line_filter'] = make_line_filter(query)
+
+        # load only first capture of each urlkey, if collapsing by urlkey
+        params['_collapse_seek'] = query.collapse_seek
+
+        # load lazily from each source, if only reading a page of captures
+        params['_resume_seek'] = query.resume_seek
+
+        if query.resolve_revisits:
+            params['_revisit_cache_size'] = self.revisit_cache_size
+            params['_revisit_lookup'] = self._get_revisit_lookup(params)
+            params['_revisit_stats'] = self.revisit_stats
+
+        if not ResultCache.is_cacheable(query):
+            return self._load_and_process(query)
+
+        load_func = self._load_and_process
+
+        if self.query_coalescer:
+            load_func = self._load_coalesced
+
+        if self.result_cache:
+            return self.result_cache(self, query, load_func)
+
+        return load_func(query)
+
+    def _load_coalesced(self, query):
+        return self.query_coalescer(self, query, self._load_and_process)
+
+    def _load_and_process(self, query):
         cdx_iter, errs = self.load_index(query.params)
 
         cdx_iter = process_cdx(cdx_iter, query)
         return cdx_iter, dict(errs)
 
+    @property
+    def revisit_stats(self):
+        """ counts of evicted originals and lookups to find them again,
+        when resolving revisits
+        """
+        try:
+            return self._revisit_stats
+        except AttributeError:
+            self._revisit_stats = {}
+            return self._revisit_stats
+
+    def _get_revisit_lookup(self, params):
+        lookup_params = dict((n, v) for n, v in six.iteritems(params)
+                             if n not in self.REVISIT_LOOKUP_SKIP_PARAMS)
+
+        def lookup(cdx):
+            """ find earliest original for revisit 'cdx' at the same url
+            """
+            url = cdx.get('url')
+            if not url:
+                return None
+
+            new_params = dict(lookup_params)
+            new_params['url'] = url
+            new_params['to'] = cdx['timestamp']
+            new_params['filter'] = ['=digest:' + cdx['digest']]
+
+            try:
+                cdx_iter, errs = self(new_params)
+                for orig_cdx in cdx_iter:
+                    if not orig_cdx.is_revisit():
+                        return orig_cdx
+            except WbException:
+                pass
+
+            return None
+
+        return lookup
+
     def load_child_source(self, name, source, params):
         try:
             params['_name'] = name
@@ -54,8 +163,19 @@ class BaseAggregator(object):
             cdx_iter = iter([])
             err_list = [(name, repr(wbe))]
 
+        closest = params.get('_closest_seek')
+        if closest and not getattr(source, 'supports_closest_seek', False):
+            cdx_iter = cdx_sort_all_closest(closest, cdx_iter)
+
+        elif (params.get('_reverse_seek') and
+              not getattr(source, 'supports_reverse_seek', False)):
+            cdx_iter = cdx_reverse(cdx_iter, None)
+
         def add_name(cdx, name):
-            if cdx.get('source'):
+            # deferred until rest of cdx line is parsed
+            if isinstance(cdx, CDXObject):
+                cdx.add_source(name)
+            elif cdx.get('source'):
                 cdx['source'] = name + ':' + cdx['source']
             else:
                 cdx['source'] = name
@@ -76,11 +196,17 @@ class BaseAggregator(object):
         iter_list = [res[0] for res in res_list]
         err_list = chain(*[res[1] for res in res_list])
 
+        closest = params.get('_closest_seek')
+
         #optimization: if only a single entry (or empty) just load directly
         if len(iter_list) <= 1:
             cdx_iter = iter_list[0] if iter_list else iter([])
+        elif closest:
+            cdx_iter = cdx_merge_closest(closest, iter_list)
+        elif params.get('_reverse_seek'):
+            cdx_iter = cdx_merge_reverse(iter_list)
         else:
-            cdx_iter = merge(*(iter_list))
+            cdx_iter = cdx_merge(iter_list)
 
         return cdx_iter, err_list
 
@@ -93,6 +219,59 @@ class BaseAggregator(object):
     def _iter_sources(self, params):  #pragma: no cover
         raise NotImplemented()
 
+    def _iter_query_sources(self, params):
+        """ Sources to load for the query, skipping any sources
+        whose metadata shows they have no captures in the key range
+        """
+        for name, source in self._iter_sources(params):
+            if self._may_contain(source, params):
+                yield name, source
+
+    @staticmethod
+    def _may_contain(source, params):
+        get_source_meta = getattr(source, 'get_source_meta', None)
+        if not get_source_meta or 'key' not in params:
+            return True
+
+        try:
+            meta = get_source_meta(params)
+        except Exception:
+            # not skipped, any error reported when loading
+            return True
+
+        if meta is None:
+            return True
+
+        return meta.may_contain(params['key'], params['end_key'])
+
+    def get_index_version(self, params):
+        """ Versions of all sources for this query, or None if
+        changes to any source can not be detected
+        """
+        versions = []
+        try:
+            for name, source in self._iter_sources(params):
+                get_index_version = getattr(source, 'get_index_version', None)
+                if not get_index_version:
+                    return None
+
+                version = get_index_version(params)
+                if version is None:
+                    return None
+
+                versions.append((name, version))
+        except Exception:
+            return None
+
+        return tuple(versions)
+
+    def get_stats(self, params):
+        result_cache = self.result_cache.stats() if self.result_cache else None
+        query_coalescer = self.query_coalescer.stats() if self.query_coalescer else None
+        return {'result_cache': result_cache,
+                'query_coalescer': query_coalescer,
+                'revisits': dict(self.revisit_stats)}
+
     def get_source_list(self, params):
         sources = self._iter_sources(params)
         result = [(name, str(value)) for name, value in sources]
@@ -106,6 +285,9 @@ class BaseSourceListAggregator(BaseAggregator):
         self.sources = sources
         self.sources_key = kwargs.get('sources_key', 'sources')
         self.invert_sources = kwargs.get('invert_sources', False)
+        self.revisit_cache_size = kwargs.get('revisit_cache_size')
+        self.result_cache = kwargs.get('result_cache')
+        self.query_coalescer = kwargs.get('query_coalescer')
 
     def get_all_sources(self, params):
         return self.sources
@@ -158,7 +340,7 @@ class SeqAggMixin(object):
 
 
     def _load_all(self, params):
-        sources = self._iter_sources(params)
+        sources = self._iter_query_sources(params)
         return [self.load_child_source(name, source, params)
                 for name, source in sources]
 
@@ -170,28 +352,42 @@ class SimpleAggregator(SeqAggMixin, BaseSourceListAggregator):
 
 #=============================================================================
 class TimeoutMixin(object):
+    """ Track latency and timeouts of each source, skipping a source
+    while its circuit breaker is open after repeated timeouts.
+
+    With 'adaptive_timeout', each source is given a deadline from its
+    recent p95 latency, instead of the full timeout.
+    """
+    DEFAULT_ADAPTIVE_TIMEOUT = {'min_samples': 20,
+                                'multiplier': 2.0,
+                                'min_timeout': 0.5}
+
     def __init__(self, *args, **kwargs):
         super(TimeoutMixin, self).__init__(*args, **kwargs)
         self.t_count = kwargs.get('t_count', 3)
         self.t_dura = kwargs.get('t_duration', 20)
-        self.timeouts = {}
+        self.source_stats = {}
 
-    def is_timed_out(self, name):
-        timeout_deq = self.timeouts.get(name)
-        if not timeout_deq:
-            return False
+        adaptive = kwargs.get('adaptive_timeout')
+        if adaptive:
+            if not isinstance(adaptive, dict):
+                adaptive = {}
 
-        the_time = time.time()
-        for t in list(timeout_deq):
-            if (the_time - t) > self.t_dura:
-                timeout_deq.popleft()
+            self.adaptive_timeout = dict(self.DEFAULT_ADAPTIVE_TIMEOUT)
+            self.adaptive_timeout.update(adaptive)
+        else:
+            self.adaptive_timeout = None
 
-        if len(timeout_deq) >= self.t_count:
-            print('Skipping {0}, {1} timeouts in {2} seconds'.
-                  format(name, self.t_count, self.t_dura))
-            return True
+    def get_source_stats(self, name):
+        stats = self.source_stats.get(name)
+        if not stats:
+            stats = SourceStats(self.t_count, self.t_dura)
+            self.source_stats[name] = stats
 
-        return False
+        return stats
+
+    def is_timed_out(self, name):
+        return not self.get_source_stats(name).is_available(time.time())
 
     def _iter_sources(self, params):
         sources = super(TimeoutMixin, self)._iter_sources(params)
@@ -199,44 +395,196 @@ class TimeoutMixin(object):
             if not self.is_timed_out(name):
                 yield name, source
 
+    def _iter_query_sources(self, params):
+        """ Sources to load, claiming each for this load, including
+        the single probe of a half open source
+        """
+        now = time.time()
+        for name, source in super(TimeoutMixin, self)._iter_sources(params):
+            if not self._may_contain(source, params):
+                continue
+
+            if self.get_source_stats(name).start_request(now):
+                yield name, source
+            else:
+                logger.debug('Skipping {0}, {1} timeouts in {2} seconds'.
+                             format(name, self.t_count, self.t_dura))
+
+    def get_source_deadline(self, name):
+        if not self.adaptive_timeout:
+            return self.timeout
+
+        return self.get_source_stats(name).get_deadline(self.timeout,
+                                                        **self.adaptive_timeout)
+
+    def _on_source_done(self, name, secs):
+        self.get_source_stats(name).end_request(secs)
+
+    def _on_source_success(self, name):
+        self.get_source_stats(name).on_success()
+
     def _on_source_error(self, name):
-        the_time = time.time()
-        if name not in self.timeouts:
-            self.timeouts[name] = deque()
+        self.get_source_stats(name).on_timeout(time.time())
+        logger.debug(name + ' timed out!')
 
-        self.timeouts[name].append(the_time)
-        print(name + ' timed out!')
+    def get_stats(self, params):
+        stats = super(TimeoutMixin, self).get_stats(params)
+        stats['sources'] = dict((name, source_stats.stats())
+                                for name, source_stats in six.iteritems(self.source_stats))
+        return stats
 
 
 #=============================================================================
 class GeventMixin(object):
+    """ Load all sources concurrently, waiting for each up to its deadline.
+
+    With 'early_exit', a resource lookup for the closest capture returns
+    as soon as any source has a capture within 'max_distance' secs of the
+    closest timestamp (default 0, an exact match, which no other source
+    can beat), without waiting for the remaining sources.
+    """
     def __init__(self, *args, **kwargs):
         super(GeventMixin, self).__init__(*args, **kwargs)
         self.pool = Pool(size=kwargs.get('size'))
         self.timeout = kwargs.get('timeout', 5.0)
 
+        early_exit = kwargs.get('early_exit')
+        if early_exit:
+            if not isinstance(early_exit, dict):
+                early_exit = {}
+
+            self.early_exit_distance = int(early_exit.get('max_distance', 0))
+        else:
+            self.early_exit_distance = None
+
+    def get_source_deadline(self, name):
+        return self.timeout
+
+    def _on_source_done(self, name, secs):
+        pass
+
+    def _on_source_success(self, name):
+        pass
+
+    def _load_timed(self, name, source, params):
+        start = time.time()
+        try:
+            return self.load_child_source(name, source, params)
+        finally:
+            # also tracked if after the deadline
+            self._on_source_done(name, time.time() - start)
+
+    def _get_early_exit_sec(self, params):
+        """ closest timestamp, in secs, if this lookup can exit early
+        """
+        if self.early_exit_distance is None:
+            return None
+
+        if params.get('mode', 'resource') != 'resource':
+            return None
+
+        # first capture from each source is its closest
+        closest = params.get('_closest_seek')
+        if not closest:
+            return None
+
+        return timestamp_to_sec(closest)
+
     def _load_all(self, params):
         params['_timeout'] = self.timeout
 
-        sources = list(self._iter_sources(params))
+        sources = list(self._iter_query_sources(params))
 
         def do_spawn(name, source):
-            return self.pool.spawn(self.load_child_source, name, source, params)
+            return self.pool.spawn(self._load_timed, name, source, params)
 
+        start = time.time()
         jobs = [do_spawn(name, source) for name, source in sources]
 
-        gevent.joinall(jobs, timeout=self.timeout)
+        # wait for each job until its deadline, shortest first
+        deadlines = [self.get_source_deadline(name) for name, source in sources]
+        waits = sorted(zip(deadlines, jobs), key=lambda x: (x[0] is None, x[0]))
+
+        closest_sec = self._get_early_exit_sec(params)
+        if closest_sec is None:
+            for deadline, job in waits:
+                job.join(timeout=self._get_remaining(start, deadline))
+
+            peeked = {}
+            found = False
+        else:
+            peeked, found = self._wait_until_found(waits, start, closest_sec)
 
         results = []
-        for (name, source), job in zip(sources, jobs):
-            if job.value is not None:
+        for (name, source), job, deadline in zip(sources, jobs, deadlines):
+            if peeked.get(job) is not None:
+                results.append(peeked[job])
+                self._on_source_success(name)
+            elif job not in peeked and job.value is not None:
                 results.append(job.value)
+                self._on_source_success(name)
+            elif found and not job.ready():
+                # still loading, but not needed: record outcome once done
+                results.append((iter([]), [(name, 'skipped')]))
+                job.link(partial(self._on_skipped_done, name, start, deadline))
             else:
                 results.append((iter([]), [(name, 'timeout')]))
                 self._on_source_error(name)
 
         return results
 
+    def _on_skipped_done(self, name, start, deadline, job):
+        if job.value is None or (deadline is not None and
+                                 time.time() > start + deadline):
+            self._on_source_error(name)
+        else:
+            self._on_source_success(name)
+
+    @staticmethod
+    def _get_remaining(start, deadline):
+        if deadline is None:
+            return None
+
+        return max(start + deadline - time.time(), 0)
+
+    def _wait_until_found(self, waits, start, closest_sec):
+        """ Wait for jobs as for _load_all(), but return once any job
+        has a close enough first capture. Returns the results of completed
+        jobs, with their first capture read, and True if found
+        """
+        peeked = {}
+
+        for deadline, job in waits:
+            if job in peeked:
+                continue
+
+            pending = [job for deadline, job in waits if job not in peeked]
+            for done in gevent.iwait(pending, timeout=self._get_remaining(start, deadline)):
+                if self._peek_closest(done, peeked, closest_sec):
+                    return peeked, True
+
+                if done is job:
+                    break
+
+        return peeked, False
+
+    def _peek_closest(self, job, peeked, closest_sec):
+        if job.value is None:
+            peeked[job] = None
+            return False
+
+        cdx_iter, err_list = job.value
+
+        first = next(cdx_iter, None)
+        if first is None:
+            peeked[job] = (iter([]), err_list)
+            return False
+
+        peeked[job] = (chain([first], cdx_iter), err_list)
+
+        dist = abs(timestamp_to_sec(first['timestamp']) - closest_sec)
+        return dist <= self.early_exit_distance
+
 
 #=============================================================================
 class GeventTimeoutAggregator(TimeoutMixin, GeventMixin, BaseSourceListAggregator):
@@ -245,10 +593,13 @@ class GeventTimeoutAggregator(TimeoutMixin, GeventMixin, BaseSourceListAggregato
 
 #=============================================================================
 class BaseDirectoryIndexSource(BaseAggregator):
-    def __init__(self, base_prefix, base_dir=''):
+    def __init__(self, base_prefix, base_dir='', **file_opts):
         self.base_prefix = base_prefix
         self.base_dir = base_dir
 
+        # options passed to each FileIndexSource
+        self.file_opts = file_opts
+
     def _iter_sources(self, params):
         the_dir = res_template(self.base_dir, params)
         the_dir = os.path.join(self.base_prefix, the_dir)
@@ -269,14 +620,23 @@ class BaseDirectoryIndexSource(BaseAggregator):
             filename = os.path.join(the_dir, name)
 
             if filename.endswith(FileIndexSource.CDX_EXT):
-                #print('Adding ' + filename)
-                rel_path = os.path.relpath(the_dir, self.base_prefix)
-                if rel_path == '.':
-                    full_name = name
-                else:
-                    full_name = os.path.join(rel_path, name)
+                source = FileIndexSource(filename, **self.file_opts)
+            elif filename.endswith(BinaryIndexSource.CDX_EXT):
+                source = BinaryIndexSource(filename,
+                                           bloom=self.file_opts.get('bloom', False))
+            elif filename.endswith(SqliteIndexSource.CDX_EXT):
+                source = SqliteIndexSource(filename)
+            else:
+                continue
+
+            #print('Adding ' + filename)
+            rel_path = os.path.relpath(the_dir, self.base_prefix)
+            if rel_path == '.':
+                full_name = name
+            else:
+                full_name = os.path.join(rel_path, name)
 
-                yield full_name, FileIndexSource(filename)
+            yield full_name, source
 
     def __repr__(self):
         return '{0}(file://{1})'.format(self.__class__.__name__,
@@ -293,18 +653,19 @@ class BaseDirectoryIndexSource(BaseAggregator):
                 self.base_dir == other.base_dir)
 
     @classmethod
-    def init_from_string(cls, value):
+    def init_from_string(cls, value, **file_opts):
         if os.path.sep != '/':
             value = value.replace('/', os.path.sep)
         if '://' not in value and os.path.isdir(value):
-            return cls(value)
+            return cls(value, **file_opts)
 
     @classmethod
     def init_from_config(cls, config):
         if config['type'] != 'file':
             return
 
-        return cls.init_from_string(config['path'])
+        return cls.init_from_string(config['path'],
+                                    **FileIndexSource.get_file_opts(config))
 
 
 #=============================================================================
@@ -0,0 +1,576 @@
+"""
+Compact binary CDX index format (.cdxb), searched via a memory mapping.
+
+A .cdxb file holds the same sorted captures as a CDX or CDXJ file, as
+fixed-width records which can be binary searched directly:
+
+    urlkey id, timestamp, field layout id, offset, length,
+    status id, mime id, filename id, extra fields offset, length
+
+Urlkeys are stored once each in a string table, in sorted order, so that
+urlkey ids sort the same way as the urlkeys. Status, mime and filename
+values are stored in per-field dictionary tables, and any remaining fields
+(url, digest, etc...) in a separate area, as encoded json values or plain
+cdx fields.
+
+Each layout records the original field order and format, and whether
+offset and length were stored as numbers or strings, so that each record
+is turned back into the same cdx or cdxj line. Json blocks are written
+back in standard json form.
+
+Existing indexes may be converted with:
+
+    wb-manager cdx-binary <dir or file>
+"""
+
+from array import array
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import six
+
+try:  # pragma: no cover
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    from ordereddict import OrderedDict
+
+from pywb.utils.binsearch import MMapCache
+from pywb.utils.cache import LRUCache
+from pywb.utils.jsoncodec import json_encode
+from pywb.utils.wbexception import NotFoundException
+
+from pywb.warcserver.index.cdxobject import CDXObject, CDXException
+from pywb.warcserver.index.cdxobject import OFFSET, LENGTH
+from pywb.warcserver.index.cdxobject import STATUSCODE, MIMETYPE, FILENAME
+from pywb.warcserver.index.indexsource import FileIndexSource
+from pywb.warcserver.index.sourcemeta import SourceMeta
+
+
+#=================================================================
+OFFSET_TYPE = 'Q' if six.PY3 else 'L'
+
+# field kinds in a layout
+KIND_INT = 'i'      # number column, json number
+KIND_STR = 's'      # number column, json string or plain cdx field
+KIND_DICT = 'd'     # dictionary id column
+KIND_EXTRA = 'x'    # stored with extra fields
+
+NUM_FIELDS = (OFFSET, LENGTH)
+DICT_FIELDS = (STATUSCODE, MIMETYPE, FILENAME)
+
+MAX_NUM = 2 ** 63 - 1
+
+# separators between extra fields: encoded json values never
+# contain a raw tab, and plain cdx fields never contain a space
+JSON_EXTRA_SEP = '\t'
+CDX_EXTRA_SEP = ' '
+
+
+#=================================================================
+class BinaryCDXFormat(object):
+    MAGIC = b'PYWB-CDXB1\n'
+
+    # num records, num urlkeys, records offset, urlkeys offset,
+    # tables offset, extras offset
+    HEADER = struct.Struct('<qqqqqq')
+
+    # urlkey id, timestamp, layout id
+    KEY = struct.Struct('<IqH')
+
+    # key, offset, length, status id, mime id, filename id,
+    # extras offset, extras length
+    RECORD = struct.Struct('<IqHqqiiiqI')
+
+    URLKEY_ID = struct.Struct('<I')
+
+    # start and end of urlkey in urlkey table
+    URLKEY_RANGE = struct.Struct('<qq')
+
+    # index in unpacked record of each column
+    COLUMNS = {OFFSET: 3,
+               LENGTH: 4,
+               STATUSCODE: 5,
+               MIMETYPE: 6,
+               FILENAME: 7}
+
+    EXT = '.cdxb'
+
+
+#=================================================================
+class BinaryCDXWriter(BinaryCDXFormat):
+    """
+    Write sorted cdx or cdxj lines to the binary format. Records, urlkeys
+    and extra fields are spooled to temp files until write() is called.
+    """
+    CDX_FORMATS = dict((len(fields), fields) for fields in CDXObject.CDX_FORMATS)
+
+    def __init__(self):
+        self.records = tempfile.TemporaryFile()
+        self.extras = tempfile.TemporaryFile()
+        self.urlkeys = tempfile.TemporaryFile()
+
+        self.num_records = 0
+        self.extras_size = 0
+
+        self.urlkey_ends = array(OFFSET_TYPE)
+        self.urlkeys_size = 0
+        self.last_urlkey = None
+        self.last_line = None
+
+        self.tables = dict((field, []) for field in DICT_FIELDS)
+        self.table_ids = dict((field, {}) for field in DICT_FIELDS)
+
+        self.layouts = []
+        self.layout_ids = {}
+
+    def close(self):
+        self.records.close()
+        self.extras.close()
+        self.urlkeys.close()
+
+    def add_line(self, line):
+        line = line.rstrip()
+        if not line:
+            return
+
+        if self.last_line is not None and line < self.last_line:
+            raise CDXException('cdx lines not sorted: ' + repr(line))
+
+        self.last_line = line
+
+        fields = line.split(b' ', 2)
+        if len(fields) < 2 or not fields[1].isdigit():
+            raise CDXException('invalid cdx line: ' + repr(line))
+
+        urlkey, timestamp = fields[0], fields[1]
+        rest = fields[2] if len(fields) == 3 else b''
+
+        is_json = rest.startswith(b'{')
+
+        if is_json:
+            items = json.loads(rest.decode('utf-8'),
+                               object_pairs_hook=OrderedDict).items()
+        else:
+            values = rest.decode('utf-8').split(' ') if rest else []
+            names = self.CDX_FORMATS.get(len(values) + 2)
+            if not names:
+                msg = 'unknown {0}-field cdx format'.format(len(values) + 2)
+                raise CDXException(msg)
+
+            items = zip(names[2:], values)
+
+        columns = {OFFSET: -1, LENGTH: -1,
+                   STATUSCODE: -1, MIMETYPE: -1, FILENAME: -1}
+
+        layout = []
+        extras = []
+
+        for name, value in items:
+            kind = self._get_kind(name, value, is_json)
+
+            if kind == KIND_DICT:
+                columns[name] = self._get_id(name, value)
+            elif kind == KIND_INT or kind == KIND_STR:
+                columns[name] = int(value)
+            elif is_json:
+                extras.append(json_encode(value))
+            else:
+                extras.append(value)
+
+            layout.append((name, kind))
+
+        layout_id = self._get_layout_id((is_json, len(timestamp), tuple(layout)))
+
+        if extras:
+            sep = JSON_EXTRA_SEP if is_json else CDX_EXTRA_SEP
+            extras = sep.join(extras).encode('utf-8')
+            self.extras.write(extras)
+
+        extras_offset = self.extras_size
+        self.extras_size += len(extras)
+
+        record = self.RECORD.pack(self._get_urlkey_id(urlkey),
+                                  int(timestamp),
+                                  layout_id,
+                                  columns[OFFSET],
+                                  columns[LENGTH],
+                                  columns[STATUSCODE],
+                                  columns[MIMETYPE],
+                                  columns[FILENAME],
+                                  extras_offset,
+                                  len(extras))
+
+        self.records.write(record)
+        self.num_records += 1
+
+    @staticmethod
+    def _get_kind(name, value, is_json):
+        if name in NUM_FIELDS:
+            if (is_json and isinstance(value, six.integer_types) and
+                not isinstance(value, bool) and 0 <= value <= MAX_NUM):
+                return KIND_INT
+
+            # only numbers which are written back the same way
+            if (isinstance(value, six.text_type) and value.isdigit() and
+                str(int(value)) == value and int(value) <= MAX_NUM):
+                return KIND_STR
+
+        elif name in DICT_FIELDS:
+            if isinstance(value, six.text_type):
+                return KIND_DICT
+
+        return KIND_EXTRA
+
+    def _get_id(self, field, value):
+        ids = self.table_ids[field]
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(ids)
+            self.tables[field].append(value)
+
+        return value_id
+
+    def _get_layout_id(self, layout):
+        layout_id = self.layout_ids.get(layout)
+        if layout_id is None:
+            layout_id = len(self.layouts)
+            if layout_id > 0xffff:
+                raise CDXException('too many distinct cdx field layouts')
+
+            self.layout_ids[layout] = layout_id
+            self.layouts.append(layout)
+
+        return layout_id
+
+    def _get_urlkey_id(self, urlkey):
+        if urlkey != self.last_urlkey:
+            if self.last_urlkey is not None and urlkey < self.last_urlkey:
+                raise CDXException('cdx urlkeys not sorted: ' + repr(urlkey))
+
+            self.urlkeys.write(urlkey)
+            self.urlkeys_size += len(urlkey)
+            self.urlkey_ends.append(self.urlkeys_size)
+            self.last_urlkey = urlkey
+
+        return len(self.urlkey_ends) - 1
+
+    def write(self, out):
+        """ Write full index to file object 'out'
+        """
+        tables = {'tables': self.tables,
+                  'layouts': [[is_json, ts_len, [list(field) for field in layout]]
+                              for is_json, ts_len, layout in self.layouts]}
+
+        tables = json.dumps(tables).encode('utf-8')
+
+        num_urlkeys = len(self.urlkey_ends)
+        urlkey_ends = array(OFFSET_TYPE, [0])
+        urlkey_ends.extend(self.urlkey_ends)
+
+        if sys.byteorder != 'little':
+            urlkey_ends.byteswap()
+
+        records_offset = len(self.MAGIC) + self.HEADER.size
+        urlkeys_offset = records_offset + self.num_records * self.RECORD.size
+        tables_offset = (urlkeys_offset + (num_urlkeys + 1) * 8 +
+                         self.urlkeys_size)
+        extras_offset = tables_offset + len(tables)
+
+        out.write(self.MAGIC)
+        out.write(self.HEADER.pack(self.num_records, num_urlkeys,
+                                   records_offset, urlkeys_offset,
+                                   tables_offset, extras_offset))
+
+        self._copy(self.records, out)
+        urlkey_ends.tofile(out)
+        self._copy(self.urlkeys, out)
+        out.write(tables)
+        self._copy(self.extras, out)
+
+    @staticmethod
+    def _copy(tmp, out):
+        tmp.flush()
+        tmp.seek(0)
+        shutil.copyfileobj(tmp, out)
+
+
+#=================================================================
+def write_binary_cdx(cdx_filename, out_filename):
+    """ Convert sorted cdx or cdxj file to binary index 'out_filename'
+    """
+    writer = BinaryCDXWriter()
+    tmp_filename = out_filename + '.tmp.' + str(os.getpid())
+
+    try:
+        with open(cdx_filename, 'rb') as fh:
+            for line in fh:
+                # skip legacy cdx header
+                if not line.startswith(b' CDX'):
+                    writer.add_line(line)
+
+        with open(tmp_filename, 'wb') as out:
+            writer.write(out)
+
+        os.rename(tmp_filename, out_filename)
+    except:
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    finally:
+        writer.close()
+
+    return writer.num_records
+
+
+#=================================================================
+class BinaryCDXIndex(BinaryCDXFormat):
+    """
+    Search a binary index in a buffer (usually a memory mapping),
+    yielding the original cdx lines in the same way as the range
+    functions in pywb.utils.binsearch
+    """
+    def __init__(self, buff):
+        if buff[:len(self.MAGIC)] != self.MAGIC:
+            raise CDXException('not a binary cdx index')
+
+        self.buff = buff
+
+        (self.num_records, self.num_urlkeys,
+         self.records_offset, self.urlkeys_offset,
+         tables_offset, self.extras_offset) = self.HEADER.unpack_from(buff, len(self.MAGIC))
+
+        self.urlkey_table_offset = self.urlkeys_offset + (self.num_urlkeys + 1) * 8
+
+        tables = json.loads(buff[tables_offset:self.extras_offset].decode('utf-8'))
+
+        self.layouts = [self._init_layout(is_json, ts_len, layout, tables['tables'])
+                        for is_json, ts_len, layout in tables['layouts']]
+
+    def _init_layout(self, is_json, ts_len, layout, tables):
+        """ For each field, return prefix, kind, record column
+        and table of written values
+        """
+        fields = []
+        for name, kind in layout:
+            if is_json:
+                prefix = json_encode(name) + ': '
+            else:
+                prefix = ''
+
+            column = self.COLUMNS.get(name)
+            table = None
+
+            if kind == KIND_DICT:
+                table = tables[name]
+                if is_json:
+                    table = [json_encode(value) for value in table]
+
+            elif kind == KIND_STR and is_json:
+                table = '"{0}"'
+
+            fields.append((prefix, kind, column, table))
+
+        has_extras = any(kind == KIND_EXTRA for name, kind in layout)
+        sep = JSON_EXTRA_SEP if is_json else CDX_EXTRA_SEP
+
+        ts_format = ('%0{0}d'.format(ts_len)).encode('ascii')
+
+        return is_json, ts_format, fields, has_extras, sep
+
+    def __len__(self):
+        return self.num_records
+
+    def get_urlkey(self, urlkey_id):
+        start, end = self.URLKEY_RANGE.unpack_from(self.buff,
+                                                   self.urlkeys_offset + urlkey_id * 8)
+
+        offset = self.urlkey_table_offset
+        return self.buff[offset + start:offset + end]
+
+    def get_key(self, i):
+        """ Return 'urlkey timestamp' of record i
+        """
+        urlkey_id, timestamp, layout_id = self.KEY.unpack_from(
+            self.buff, self.records_offset + i * self.RECORD.size)
+
+        ts_format = self.layouts[layout_id][1]
+        return self.get_urlkey(urlkey_id) + b' ' + ts_format % timestamp
+
+    def get_urlkey_id(self, i):
+        return self.URLKEY_ID.unpack_from(self.buff,
+                                          self.records_offset + i * self.RECORD.size)[0]
+
+    def get_line(self, i):
+        """ Return original cdx line of record i
+        """
+        record = self.RECORD.unpack_from(self.buff,
+                                         self.records_offset + i * self.RECORD.size)
+
+        is_json, ts_format, fields, has_extras, sep = self.layouts[record[2]]
+
+        if has_extras:
+            extras_offset = self.extras_offset + record[8]
+            extras = self.buff[extras_offset:extras_offset + record[9]]
+            extras = iter(extras.decode('utf-8').split(sep))
+
+        values = []
+        for prefix, kind, column, table in fields:
+            if kind == KIND_EXTRA:
+                value = next(extras)
+            elif kind == KIND_DICT:
+                value = table[record[column]]
+            elif table:
+                value = table.format(record[column])
+            else:
+                value = str(record[column])
+
+            values.append(prefix + value)
+
+        if is_json:
+            rest = '{' + ', '.join(values) + '}'
+        else:
+            rest = ' '.join(values)
+
+        key = self.get_urlkey(record[0]) + b' ' + ts_format % record[1]
+
+        if not rest:
+            return key
+
+        return key + b' ' + rest.encode('utf-8')
+
+    def search(self, key, lo=0):
+        """ Return index of first record with 'urlkey timestamp' >= key
+        """
+        hi = self.num_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def search_next_urlkey(self, i):
+        """ Return index of first record after i with a different urlkey
+        """
+        urlkey_id = self.get_urlkey_id(i)
+
+        lo = i + 1
+        hi = self.num_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_urlkey_id(mid) <= urlkey_id:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def iter_range(self, start, end):
+        """ Lines where start <= line < end
+        """
+        i = self.search(start)
+        while i < self.num_records and self.get_key(i) < end:
+            yield self.get_line(i)
+            i += 1
+
+    def iter_range_reverse(self, start, end):
+        """ Lines where start <= line < end, in reverse order
+        """
+        i = self.search(end) - 1
+        while i >= 0 and self.get_key(i) >= start:
+            yield self.get_line(i)
+            i -= 1
+
+    def iter_distinct_keys(self, start, end):
+        """ First line of each distinct urlkey where start <= line < end
+        """
+        i = self.search(start)
+        while i < self.num_records and self.get_key(i) < end:
+            yield self.get_line(i)
+            i = self.search_next_urlkey(i)
+
+
+#=================================================================
+class BinaryIndexSource(FileIndexSource):
+    """
+    Index source for a binary (.cdxb) index file, memory-mapped
+    and searched without reading or parsing any text lines
+    """
+    CDX_EXT = (BinaryCDXFormat.EXT,)
+
+    # parsed header and tables for each mapped file, dropped
+    # along with the mapping
+    indexes = LRUCache(MMapCache.DEFAULT_MAX_SIZE)
+
+    def __init__(self, filename, bloom=False):
+        super(BinaryIndexSource, self).__init__(filename, use_mmap=True,
+                                                bloom=bloom)
+
+    def get_index(self, filename):
+        try:
+            buff = self.mmap_cache.get(filename)
+        except (IOError, OSError):
+            self.indexes.remove(filename)
+            raise
+
+        index = self.indexes.get(filename)
+        if index is None or index.buff is not buff:
+            index = BinaryCDXIndex(buff)
+            self.indexes.put(filename, index)
+
+        return index
+
+    def _load_meta(self, filename, file_key, bloom):
+        index = self.get_index(filename)
+        if not len(index):
+            return SourceMeta(file_key, None, None)
+
+        if bloom:
+            bloom = SourceMeta.build_bloom(index.get_urlkey(urlkey_id) for urlkey_id
+                                           in six.moves.range(index.num_urlkeys))
+        else:
+            bloom = None
+
+        return SourceMeta(file_key, index.get_line(0),
+                          index.get_line(len(index) - 1), bloom)
+
+    def _load_lines(self, filename, range_func, start, end, params):
+        try:
+            index = self.get_index(filename)
+        except (IOError, OSError):
+            raise NotFoundException(filename)
+
+        def do_load():
+            gen = range_func(filename, index, start, end)
+            for line in self.filter_lines(gen, params):
+                yield CDXObject(line)
+
+        return do_load()
+
+    def _iter_range(self, filename, index, start, end):
+        return index.iter_range(start, end)
+
+    def _iter_range_reverse(self, filename, index, start, end):
+        return index.iter_range_reverse(start, end)
+
+    def _iter_distinct_keys(self, filename, index, start, end):
+        return index.iter_distinct_keys(start, end)
+
+    @classmethod
+    def init_from_string(cls, value, **file_opts):
+        if value.startswith('file://'):
+            filename = value[7:]
+        elif value.startswith('/') or '://' not in value:
+            filename = value
+        else:
+            return None
+
+        if filename.endswith(cls.CDX_EXT):
+            return cls(filename, bloom=file_opts.get('bloom', False))
@@ -4,7 +4,12 @@ except ImportError:  # pragma: no cover
     from ordereddict import OrderedDict
 
 import six
-from six.moves import zip
+from six.moves import zip, intern
+
+try:  # pragma: no cover
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
 
 from six.moves.urllib.parse import urlencode, quote
 from six.moves.urllib.parse import parse_qs
@@ -12,8 +17,7 @@ from six.moves.urllib.parse import parse_qs
 from pywb.utils.wbexception import WbException
 from warcio.utils import to_native_str
 
-from json import loads as json_decode
-from json import dumps as json_encode
+from pywb.utils.jsoncodec import json_encode, json_decode
 
 
 #=================================================================
@@ -41,9 +45,12 @@ class CDXException(WbException):
 
 
 #=================================================================
-class CDXObject(OrderedDict):
+class CDXObject(MutableMapping):
     """
     dictionary object representing parsed CDX line.
+
+    The urlkey and timestamp are parsed when created, while the rest
+    of the line is only parsed on first access to any other field.
     """
     CDX_FORMATS = [
         # Public CDX Format
@@ -103,23 +110,98 @@ class CDXObject(OrderedDict):
                   'f': FILENAME
     }
 
-    def __init__(self, cdxline=b''):
-        OrderedDict.__init__(self)
+    # repeated values shared between all parsed lines
+    INTERN_FIELDS = (MIMETYPE, STATUSCODE, FILENAME)
 
+    __slots__ = ('cdxline', '_fields', '_urlkey', '_timestamp',
+                 '_from_json', '_cached_json', '_formatter', '_source')
+
+    def __init__(self, cdxline=b''):
         cdxline = cdxline.rstrip()
         self._from_json = False
         self._cached_json = None
+        self._formatter = None
+        self._source = None
+
+        self.cdxline = cdxline
 
         # Allows for filling the fields later or in a custom way
         if not cdxline:
-            self.cdxline = cdxline
+            self._fields = OrderedDict()
+            self._urlkey = None
+            self._timestamp = None
             return
 
-        fields = cdxline.split(b' ' , 2)
-        # Check for CDX JSON
-        if fields[-1].startswith(b'{'):
-            self[URLKEY] = to_native_str(fields[0], 'utf-8')
-            self[TIMESTAMP] = to_native_str(fields[1], 'utf-8')
+        # only urlkey and timestamp are parsed up front,
+        # remaining fields are parsed on first access
+        self._fields = None
+
+        fields = cdxline.split(b' ', 2)
+        if len(fields) == 3:
+            # Check for CDX JSON
+            if fields[-1].startswith(b'{'):
+                self._from_json = True
+            else:
+                self._get_cdx_format(fields[-1].count(b' ') + 3)
+
+        else:
+            self._get_cdx_format(len(fields))
+
+        self._urlkey = to_native_str(fields[0], 'utf-8')
+        self._timestamp = to_native_str(fields[1], 'utf-8')
+
+    def _get_cdx_format(self, num_fields):
+        cdxformat = None
+        for i in self.CDX_FORMATS:
+            if len(i) == num_fields:
+                cdxformat = i
+
+        if not cdxformat:
+            msg = 'unknown {0}-field cdx format'.format(num_fields)
+            raise CDXException(msg)
+
+        return cdxformat
+
+    @property
+    def fields(self):
+        """ OrderedDict of all fields, parsing the cdx line if not yet parsed
+        """
+        if self._fields is None:
+            self._fields = self._parse()
+
+            if self._source:
+                self._add_source(self._fields, self._source)
+                self._source = None
+                self.cdxline = None
+
+        return self._fields
+
+    def add_source(self, name):
+        """ prefix 'source' field with source name, deferred until
+        the line is parsed
+        """
+        if self._fields is None:
+            if self._source:
+                name += ':' + self._source
+            self._source = name
+        else:
+            self._add_source(self, name)
+
+    @staticmethod
+    def _add_source(fields, name):
+        if fields.get('source'):
+            fields['source'] = name + ':' + fields['source']
+        else:
+            fields['source'] = name
+
+    def _parse(self):
+        result = OrderedDict()
+        result[URLKEY] = self._urlkey
+        result[TIMESTAMP] = self._timestamp
+
+        fields = self.cdxline.split(b' ', 2)
+
+        if self._from_json:
             json_fields = json_decode(to_native_str(fields[-1], 'utf-8'))
             for n, v in six.iteritems(json_fields):
                 n = to_native_str(n, 'utf-8')
@@ -134,31 +216,36 @@ class CDXObject(OrderedDict):
                 if n != 'filename':
                     v = to_native_str(v, 'utf-8')
 
-                self[n] = v
+                result[intern(n)] = self._intern_value(n, v)
 
-            self.cdxline = cdxline
-            self._from_json = True
-            return
+            return result
 
-        more_fields = fields.pop().split(b' ')
-        fields.extend(more_fields)
+        fields = fields[-1].split(b' ')
+        cdxformat = self._get_cdx_format(len(fields) + 2)
 
-        cdxformat = None
-        for i in self.CDX_FORMATS:
-            if len(i) == len(fields):
-                cdxformat = i
+        for header, field in zip(cdxformat[2:], fields):
+            result[header] = self._intern_value(header,
+                                                to_native_str(field, 'utf-8'))
 
-        if not cdxformat:
-            msg = 'unknown {0}-field cdx format'.format(len(fields))
-            raise CDXException(msg)
+        return result
 
-        for header, field in zip(cdxformat, fields):
-            self[header] = to_native_str(field, 'utf-8')
+    def _intern_value(self, name, value):
+        if name in self.INTERN_FIELDS and isinstance(value, str):
+            return intern(value)
 
-        self.cdxline = cdxline
+        return value
+
+    def __getitem__(self, key):
+        if self._fields is None:
+            if key == URLKEY:
+                return self._urlkey
+            elif key == TIMESTAMP:
+                return self._timestamp
+
+        return self.fields[key]
 
     def __setitem__(self, key, value):
-        OrderedDict.__setitem__(self, key, value)
+        self.fields[key] = value
 
         # force regen on next __str__ call
         self.cdxline = None
@@ -166,6 +253,41 @@ class CDXObject(OrderedDict):
         # force regen on next to_json() call
         self._cached_json = None
 
+    def __delitem__(self, key):
+        del self.fields[key]
+
+        self.cdxline = None
+        self._cached_json = None
+
+    def __contains__(self, key):
+        if self._fields is None and key in (URLKEY, TIMESTAMP):
+            return True
+
+        return key in self.fields
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__,
+                                   list(self.items()))
+
+    def copy(self):
+        """ copy which can be changed independently of this cdx,
+        sharing the unparsed line if not yet parsed
+        """
+        other = self.__class__.__new__(self.__class__)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+
+        if self._fields is not None:
+            other._fields = OrderedDict(self._fields)
+
+        return other
+
     def is_revisit(self):
         """return ``True`` if this record is a revisit record."""
         return (self.get(MIMETYPE) == 'warc/revisit' or
@@ -212,13 +334,17 @@ class CDXObject(OrderedDict):
         return result
 
     def __str__(self):
+        # apply any deferred source name
+        if self._source:
+            self.fields
+
         if self.cdxline:
             return to_native_str(self.cdxline, 'utf-8')
 
         if not self._from_json:
             return ' '.join(str(val) for val in six.itervalues(self))
         else:
-            return json_encode(self)
+            return json_encode(self.fields)
 
     def to_cdxj(self, fields=None):
         prefix = self['urlkey'] + ' ' + self['timestamp'] + ' '
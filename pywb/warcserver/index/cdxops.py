@@ -1,19 +1,26 @@
 from pywb.warcserver.index.cdxobject import CDXObject, IDXObject
 from pywb.warcserver.index.cdxobject import TIMESTAMP, STATUSCODE, MIMETYPE, DIGEST
-from pywb.warcserver.index.cdxobject import OFFSET, LENGTH, FILENAME
+from pywb.warcserver.index.cdxobject import OFFSET, LENGTH, FILENAME, URLKEY
 
 from pywb.warcserver.index.query import CDXQuery
+from pywb.warcserver.index.query import encode_resume_key, decode_resume_key
+
+from pywb.utils.cache import LRUCache
 
 from warcio.timeutils import timestamp_to_sec, pad_timestamp
 from warcio.timeutils import PAD_14_DOWN, PAD_14_UP
 
 import bisect
 
-from six.moves import zip, range, map
+from warcio.utils import to_native_str
+
+from six.moves import zip, range
+import six
 import re
 
 from heapq import merge
 from collections import deque
+from itertools import groupby
 
 
 #=================================================================
@@ -63,7 +70,11 @@ def cdx_to_json(cdx_iter, fields):
 #=================================================================
 def process_cdx(cdx_iter, query):
     if query.resolve_revisits:
-        cdx_iter = cdx_resolve_revisits(cdx_iter)
+        params = query.params
+        cdx_iter = cdx_resolve_revisits(cdx_iter,
+                                        params.get('_revisit_cache_size'),
+                                        params.get('_revisit_lookup'),
+                                        params.get('_revisit_stats'))
 
     filters = query.filters
     if filters:
@@ -76,15 +87,29 @@ def process_cdx(cdx_iter, query):
     if collapse_time:
         cdx_iter = cdx_collapse_time_status(cdx_iter, collapse_time)
 
+    if query.collapse_urlkey:
+        cdx_iter = cdx_collapse_urlkey(cdx_iter)
+
     closest = query.closest
     reverse = query.reverse
     limit = query.limit
 
     if closest:
-        cdx_iter = cdx_sort_closest(closest, cdx_iter, limit)
+        # already loaded in closest order by the index sources
+        if query.params.get('_closest_seek'):
+            cdx_iter = cdx_limit(cdx_iter, limit)
+        else:
+            cdx_iter = cdx_sort_closest(closest, cdx_iter, limit)
 
     elif reverse:
-        cdx_iter = cdx_reverse(cdx_iter, limit)
+        # already loaded in reverse order by the index sources
+        if query.params.get('_reverse_seek'):
+            cdx_iter = cdx_limit(cdx_iter, limit)
+        else:
+            cdx_iter = cdx_reverse(cdx_iter, limit)
+
+    elif query.resume_key or query.show_resume_key:
+        cdx_iter = cdx_resume(cdx_iter, limit, query.resume_key, query.params)
 
     elif limit:
         cdx_iter = cdx_limit(cdx_iter, limit)
@@ -102,8 +127,8 @@ def create_merged_cdx_gen(sources, query):
     if len(sources) == 1:
         cdx_iter = sources[0].load_cdx(query)
     else:
-        source_iters = map(lambda src: src.load_cdx(query), sources)
-        cdx_iter = merge(*(source_iters))
+        source_iters = [src.load_cdx(query) for src in sources]
+        cdx_iter = cdx_merge(source_iters)
 
     for cdx in cdx_iter:
         yield cdx
@@ -132,6 +157,54 @@ def cdx_limit(cdx_iter, limit):
     return (cdx for cdx, _ in zip(cdx_iter, range(limit)))
 
 
+#=================================================================
+def cdx_resume(cdx_iter, limit, resume_key=None, params=None):
+    """
+    skip cdx up to and including the one at `resume_key`, and limit
+    to at most `limit`. if more cdx remain, the resume key of the last
+    cdx returned is set as '_resume_key' in `params`.
+
+    as cdx with the same urlkey and timestamp may be in several sources,
+    the resume key also counts how many of these have been returned.
+    """
+    skip_key = None
+    skip_count = 0
+    if resume_key:
+        urlkey, timestamp, skip_count = decode_resume_key(resume_key)
+        skip_key = (urlkey, timestamp)
+
+    last_key = None
+    count = 0
+    num = 0
+
+    for cdx in cdx_iter:
+        key = (cdx[URLKEY], cdx[TIMESTAMP])
+        if key != last_key:
+            last_key = key
+            count = 0
+
+        count += 1
+
+        if skip_key:
+            if key < skip_key or (key == skip_key and count <= skip_count):
+                continue
+
+            skip_key = None
+
+        if num == limit:
+            break
+
+        yield cdx
+        num += 1
+        resume = (key, count)
+    else:
+        return
+
+    if num and params is not None:
+        (urlkey, timestamp), count = resume
+        params['_resume_key'] = encode_resume_key(urlkey, timestamp, count)
+
+
 #=================================================================
 def cdx_reverse(cdx_iter, limit):
     """
@@ -199,6 +272,9 @@ class CDXFilter(object):
         else:
             val = str(cdx.get(self.field, ''))
 
+        return self.match(val)
+
+    def match(self, val):
         matched = self.compare_func(val)
 
         return matched ^ self.invert
@@ -214,6 +290,146 @@ class CDXFilter(object):
         return res is not None
 
 
+#=================================================================
+class CDXLineFilter(object):
+    """
+    Predicate over raw index lines, compiled from cdx filters, to skip
+    parsing lines which can not match.
+
+    Filters on fields of classic CDX lines, and on the urlkey and timestamp
+    of CDXJ lines, are evaluated exactly on the raw field.
+    For other CDXJ fields, a line is only rejected if it does not contain
+    the literal value required by the filter, so all accepted lines must
+    still be checked by cdx_filter()
+    """
+    # field name -> position, for each classic cdx format by length,
+    # using the same format as CDXObject when lengths are equal
+    CDX_FIELD_POS = {}
+    for cdxformat in CDXObject.CDX_FORMATS:
+        CDX_FIELD_POS[len(cdxformat)] = dict((name, i) for i, name in enumerate(cdxformat))
+
+    BASE_FIELDS = set(field for cdxformat in CDXObject.CDX_FORMATS
+                      for field in cdxformat)
+
+    # positional fields in cdxj
+    CDXJ_FIELD_POS = {URLKEY: 0, TIMESTAMP: 1}
+
+    RX_LITERAL_PREFIX = re.compile(r'[\w/,;=:@&!\'-]*')
+
+    def __init__(self, filters):
+        self.filters = []
+        for cdx_filter in filters:
+            # only filters on fields present in the raw line
+            if cdx_filter.field not in self.BASE_FIELDS:
+                continue
+
+            literal = self.get_literal(cdx_filter)
+            self.filters.append((cdx_filter, literal))
+
+    def __len__(self):
+        return len(self.filters)
+
+    @classmethod
+    def get_literal(cls, cdx_filter):
+        """
+        Return bytes which the raw cdxj line must contain
+        for the filter to match, if any
+        """
+        if cdx_filter.invert:
+            return None
+
+        if cdx_filter.compare_func == cdx_filter.rx_match:
+            pattern = cdx_filter.regex.pattern
+            if '|' in pattern:
+                return None
+
+            literal = cls.RX_LITERAL_PREFIX.match(pattern).group(0)
+
+            # last char may be optional
+            if literal and pattern[len(literal):len(literal) + 1] in ('?', '*', '{'):
+                literal = literal[:-1]
+        else:
+            literal = cdx_filter.filter_str
+
+        if not literal:
+            return None
+
+        try:
+            literal = literal.encode('ascii')
+        except UnicodeEncodeError:
+            return None
+
+        # may be escaped or quoted differently in json, or when parsed
+        if any(c in literal for c in (b'"', b'\\', b'%')):
+            return None
+
+        if any(c < 0x20 or c > 0x7e for c in six.iterbytes(literal)):
+            return None
+
+        return literal
+
+    def __call__(self, line):
+        line = line.rstrip()
+        fields = line.split(b' ', 2)
+
+        # cdxj
+        if fields[-1].startswith(b'{'):
+            for cdx_filter, literal in self.filters:
+                pos = self.CDXJ_FIELD_POS.get(cdx_filter.field)
+                if pos is not None:
+                    val = to_native_str(fields[pos], 'utf-8')
+                    if not cdx_filter.match(val):
+                        return False
+
+                elif literal is not None and not self.has_literal(fields[-1], literal):
+                    return False
+
+            return True
+
+        # classic cdx
+        fields = line.split(b' ')
+        field_pos = self.CDX_FIELD_POS.get(len(fields))
+
+        # unknown format, left to parser to report
+        if not field_pos:
+            return True
+
+        for cdx_filter, literal in self.filters:
+            pos = field_pos.get(cdx_filter.field)
+            val = to_native_str(fields[pos], 'utf-8') if pos is not None else ''
+            if not cdx_filter.match(val):
+                return False
+
+        return True
+
+    @staticmethod
+    def has_literal(json_text, literal):
+        if literal in json_text:
+            return True
+
+        return b'/' in literal and literal.replace(b'/', b'\\/') in json_text
+
+
+#=================================================================
+def make_line_filter(query):
+    """
+    Return a CDXLineFilter for the query filters, or None if no filters
+    can be applied to raw index lines
+    """
+    filter_strings = query.filters
+    if not filter_strings or query.resolve_revisits:
+        return None
+
+    # Support single strings as well
+    if isinstance(filter_strings, str):
+        filter_strings = [filter_strings]
+
+    line_filter = CDXLineFilter([CDXFilter(filter_str)
+                                 for filter_str in filter_strings])
+
+    return line_filter if len(line_filter) else None
+
+
 #=================================================================
 def cdx_filter(cdx_iter, filter_strings):
     """
@@ -270,6 +486,19 @@ def cdx_collapse_time_status(cdx_iter, timelen=10):
             yield cdx
 
 
+#=================================================================
+def cdx_collapse_urlkey(cdx_iter):
+    """
+    collapse to the first capture of each urlkey
+    """
+    last_urlkey = None
+
+    for cdx in cdx_iter:
+        if cdx[URLKEY] != last_urlkey:
+            last_urlkey = cdx[URLKEY]
+            yield cdx
+
+
 #=================================================================
 def cdx_sort_closest(closest, cdx_iter, limit=10):
     """
@@ -305,14 +534,121 @@ def cdx_sort_closest(closest, cdx_iter, limit=10):
     #    yield cdx
 
 
+#=================================================================
+def cdx_merge(cdx_iters):
+    """
+    merge sorted iterators into a single sorted iterator.
+
+    captures are compared by urlkey and timestamp only, without parsing
+    the rest of the line, with equal captures in source order.
+    """
+    if len(cdx_iters) == 1:
+        return cdx_iters[0]
+
+    def add_key(i, cdx_iter):
+        for cdx in cdx_iter:
+            yield cdx[URLKEY], cdx[TIMESTAMP], i, cdx
+
+    return (res[-1] for res in merge(*[add_key(i, cdx_iter)
+                                       for i, cdx_iter in enumerate(cdx_iters)]))
+
+
+#=================================================================
+class _ReverseOrder(object):
+    __slots__ = ['key', 'cdx']
+
+    def __init__(self, key, cdx):
+        self.key = key
+        self.cdx = cdx
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def cdx_merge_reverse(cdx_iters):
+    """
+    merge iterators, each already in reverse order,
+    into a single iterator in reverse order.
+    """
+    if len(cdx_iters) == 1:
+        return cdx_iters[0]
+
+    def add_key(i, cdx_iter):
+        for cdx in cdx_iter:
+            yield _ReverseOrder((cdx[URLKEY], cdx[TIMESTAMP], i), cdx)
+
+    return (rev.cdx for rev in merge(*[add_key(i, cdx_iter)
+                                       for i, cdx_iter in enumerate(cdx_iters)]))
+
+
+#=================================================================
+def cdx_iter_closest(closest, prev_iter, next_iter):
+    """
+    merge captures before `closest` timestamp (in reverse order) and
+    captures at or after it (in forward order) into a single iterator
+    sorted by closest to timestamp, reading only as far as needed
+    in each direction.
+    """
+    def prev_forward():
+        # keep captures with the same timestamp in forward order
+        for _, group in groupby(prev_iter, lambda cdx: cdx[TIMESTAMP]):
+            for cdx in reversed(list(group)):
+                yield cdx
+
+    return cdx_merge_closest(closest, [prev_forward(), next_iter])
+
+
+#=================================================================
+def cdx_merge_closest(closest, cdx_iters):
+    """
+    merge iterators, each already sorted by closest to timestamp,
+    into a single iterator sorted by closest to timestamp.
+    """
+    if len(cdx_iters) == 1:
+        return cdx_iters[0]
+
+    closest_sec = timestamp_to_sec(closest)
+
+    # equal distance: earlier timestamp first, then in source order
+    def add_dist(i, cdx_iter):
+        for cdx in cdx_iter:
+            timestamp = cdx[TIMESTAMP]
+            yield (abs(closest_sec - timestamp_to_sec(timestamp)),
+                   timestamp, i, cdx)
+
+    return (res[-1] for res in merge(*[add_dist(i, cdx_iter)
+                                       for i, cdx_iter in enumerate(cdx_iters)]))
+
+
+#=================================================================
+def cdx_sort_all_closest(closest, cdx_iter):
+    """
+    sort all captures by closest to timestamp, for sources
+    which can not load captures in closest order.
+    """
+    closest_sec = timestamp_to_sec(closest)
+
+    def get_dist(cdx):
+        return abs(closest_sec - timestamp_to_sec(cdx[TIMESTAMP]))
+
+    for cdx in sorted(cdx_iter, key=get_dist):
+        yield cdx
+
+
 #=================================================================
 # resolve revisits
 
 # Fields to append from cdx original to revisit
 ORIG_TUPLE = [LENGTH, OFFSET, FILENAME]
 
+# Fields kept for each original, for revisits with the same digest
+ORIG_CACHE_FIELDS = [MIMETYPE, STATUSCODE] + ORIG_TUPLE
+
+# Max number of originals kept while resolving revisits
+DEFAULT_REVISIT_CACHE_SIZE = 10000
 
-def cdx_resolve_revisits(cdx_iter):
+
+def cdx_resolve_revisits(cdx_iter, cache_size=None, lookup=None, stats=None):
     """
     resolve revisits.
 
@@ -320,35 +656,66 @@ def cdx_resolve_revisits(cdx_iter):
     and ``orig.filename``. for revisit records, these fields have corresponding
     field values in previous non-revisit (original) CDX record.
     They are all ``"-"`` for non-revisit records.
+
+    at most ``cache_size`` originals are kept, least recently used first
+    evicted. once any have been evicted, an unresolved revisit may have
+    had its original evicted, and ``lookup(cdx)`` is called to find it
+    instead, if provided. the number of lookups, and how many found
+    an original, are added to the ``stats`` dict, if provided.
     """
-    originals = {}
+    originals = LRUCache(cache_size or DEFAULT_REVISIT_CACHE_SIZE)
 
-    for cdx in cdx_iter:
-        is_revisit = cdx.is_revisit()
+    def get_orig_fields(cdx):
+        return tuple(cdx.get(field) for field in ORIG_CACHE_FIELDS)
 
-        digest = cdx.get(DIGEST)
+    def fill(value, default):
+        return default if value is None else value
 
-        original_cdx = None
+    try:
+        for cdx in cdx_iter:
+            is_revisit = cdx.is_revisit()
 
-        # only set if digest is valid, otherwise no way to resolve
-        if digest:
-            original_cdx = originals.get(digest)
+            digest = cdx.get(DIGEST)
 
-            if not original_cdx and not is_revisit:
-                originals[digest] = cdx
+            original = None
 
-        if original_cdx and is_revisit:
-            fill_orig = lambda field: original_cdx.get(field, '-')
-            # Transfer mimetype and statuscode
-            if MIMETYPE in cdx:
-                cdx[MIMETYPE] = original_cdx.get(MIMETYPE, '')
-            if STATUSCODE in cdx:
-                cdx[STATUSCODE] = original_cdx.get(STATUSCODE, '')
-        else:
-            fill_orig = lambda field: '-'
+            # only set if digest is valid, otherwise no way to resolve
+            if digest:
+                original = originals.get(digest)
 
-        # Always add either the original or empty '- - -'
-        for field in ORIG_TUPLE:
-            cdx['orig.' + field] = fill_orig(field)
+                if not original and not is_revisit:
+                    originals.put(digest, get_orig_fields(cdx))
 
-        yield cdx
+                elif not original and lookup and originals.evictions:
+                    original_cdx = lookup(cdx)
+                    if stats is not None:
+                        stats['lookups'] = stats.get('lookups', 0) + 1
+
+                    if original_cdx:
+                        original = get_orig_fields(original_cdx)
+                        originals.put(digest, original)
+                        if stats is not None:
+                            stats['found'] = stats.get('found', 0) + 1
+
+            if original and is_revisit:
+                mime, status, length, offset, filename = original
+                fill_orig = [fill(value, '-') for value in (length, offset, filename)]
+
+                # Transfer mimetype and statuscode
+                if MIMETYPE in cdx:
+                    cdx[MIMETYPE] = fill(mime, '')
+                if STATUSCODE in cdx:
+                    cdx[STATUSCODE] = fill(status, '')
+            else:
+                fill_orig = ['-', '-', '-']
+
+            # Always add either the original or empty '- - -'
+            for field, value in zip(ORIG_TUPLE, fill_orig):
+                cdx['orig.' + field] = value
+
+            yield cdx
+
+    finally:
+        if stats is not None:
+            stats['evictions'] = (stats.get('evictions', 0) +
+                                  originals.evictions)
@@ -0,0 +1,167 @@
+"""
+Coalescing of identical concurrent aggregator queries.
+
+When many requests for the same page arrive at once, each would run
+the same lookup against every index source. Instead, the first query
+runs the lookup, and identical queries arriving while any of them is
+still reading the results share it.
+
+Results are read lazily into a shared list, only as far as the furthest
+reader has read, so a reader which only needs the first capture still
+only reads one capture. The list holds up to max_captures results: a
+reader reading past that runs the lookup again for the rest.
+
+A lookup is shared until all its results have been read, or until no
+reader is left, after which a new query runs a new lookup.
+"""
+
+from gevent.event import Event
+from gevent.lock import Semaphore
+
+from pywb.warcserver.index.resultcache import ResultCache
+from pywb.warcserver.index.resultcache import get_params_key
+
+import weakref
+
+
+#=============================================================================
+class SharedResult(object):
+    def __init__(self, max_captures):
+        self.cdx_iter = None
+        self.errs = None
+        self.max_captures = max_captures
+
+        self.loaded = Event()
+
+        self.cdx_list = []
+        self.done = False
+        self.truncated = False
+        self.exc = None
+
+        self.lock = Semaphore()
+
+    def load(self, load_func, query):
+        try:
+            self.cdx_iter, self.errs = load_func(query)
+        except Exception as e:
+            self.exc = e
+            self.done = True
+            raise
+        finally:
+            self.loaded.set()
+
+    def wait_loaded(self):
+        self.loaded.wait()
+        if self.exc:
+            raise self.exc
+
+    def read_next(self, i):
+        """ Ensure result i is read, unless no more results.
+        Return False if no more results
+        """
+        with self.lock:
+            if i < len(self.cdx_list):
+                return True
+
+            if self.done:
+                return False
+
+            if i >= self.max_captures:
+                self.truncated = True
+                self.done = True
+                return False
+
+            try:
+                self.cdx_list.append(next(self.cdx_iter))
+                return True
+            except StopIteration:
+                self.done = True
+                return False
+            except Exception as e:
+                self.exc = e
+                self.done = True
+                raise
+
+
+#=============================================================================
+class QueryCoalescer(object):
+    DEFAULT_MAX_CAPTURES = 1000
+
+    def __init__(self, max_captures=DEFAULT_MAX_CAPTURES):
+        self.max_captures = int(max_captures)
+
+        # shared results, for as long as any reader is left
+        self.in_flight = weakref.WeakValueDictionary()
+
+        self.calls = 0
+        self.shared = 0
+        self.reloads = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        """ Init from a config dict with optional:
+
+        max_captures: <max captures shared per query>
+        """
+        if not config:
+            return None
+
+        if not isinstance(config, dict):
+            config = {}
+
+        return cls(max_captures=config.get('max_captures', cls.DEFAULT_MAX_CAPTURES))
+
+    def get_key(self, agg, params):
+        return (agg, get_params_key(params, ResultCache.SKIP_PARAMS))
+
+    def __call__(self, agg, query, load_func):
+        """ Return results from load_func(query), or the shared results
+        of an identical query already in flight
+        """
+        key = self.get_key(agg, query.params)
+        self.calls += 1
+
+        shared = self.in_flight.get(key)
+        if shared is not None and not shared.done:
+            self.shared += 1
+            shared.wait_loaded()
+        else:
+            shared = SharedResult(self.max_captures)
+            self.in_flight[key] = shared
+            shared.load(load_func, query)
+
+        return self._iter_shared(key, shared, query, load_func), dict(shared.errs)
+
+    def _iter_shared(self, key, shared, query, load_func):
+        i = 0
+        while shared.read_next(i):
+            # a copy of each capture, as replay may add fields to it
+            yield shared.cdx_list[i].copy()
+            i += 1
+
+        # all read, not shared with new queries
+        if self.in_flight.get(key) is shared:
+            del self.in_flight[key]
+
+        if shared.exc:
+            raise shared.exc
+
+        if not shared.truncated:
+            return
+
+        # read past shared captures, load the rest
+        self.reloads += 1
+
+        cdx_iter, errs = load_func(query)
+
+        count = 0
+        for cdx in cdx_iter:
+            count += 1
+            if count > i:
+                yield cdx
+
+    def stats(self):
+        return dict(calls=self.calls,
+                    shared=self.shared,
+                    in_flight=len(self.in_flight),
+                    reloads=self.reloads)
@@ -0,0 +1,349 @@
+"""
+Optional columnar processing of ZipNum blocks, using NumPy.
+
+All lines of a block are parsed at once into arrays: urlkey and
+timestamp, ids for the status, mime and digest values, and offsets of
+each line in the block. Clamping, exact status/mime/digest filters,
+collapse by urlkey and closest selection are then run as vector
+operations, and only the remaining lines are parsed into CDXObjects.
+
+This is only a pre-filter: lines are dropped only if the regular cdx
+processing would also drop them, and are always processed again by
+process_cdx(), so the output is the same with or without it.
+"""
+
+import re
+import json
+
+from warcio.timeutils import timestamp_to_sec, pad_timestamp
+from warcio.timeutils import PAD_14_DOWN, PAD_14_UP
+from warcio.utils import to_native_str
+
+from pywb.warcserver.index.cdxobject import STATUSCODE, MIMETYPE, DIGEST
+from pywb.warcserver.index.cdxops import CDXFilter, CDXLineFilter
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover
+    HAS_NUMPY = False
+
+
+#=================================================================
+# value id for lines where a field could not be read from the raw line
+UNKNOWN = -1
+
+
+#=================================================================
+class BlockColumns(object):
+    """
+    Columns of a block of cdx lines, parsed from the whole block at once
+    """
+    FIELDS = (STATUSCODE, MIMETYPE, DIGEST)
+
+    LINE_RX = re.compile(br'^([^ \n]*) ([^ \n]*)( \{)?', re.M)
+
+    # quoted string values of json fields, and the alt names of those fields
+    JSON_FIELD_RX = re.compile(br'"(status|mime|digest|statuscode|mimetype|s|m|d)": '
+                               br'(?:"((?:[^"\\\n]|\\.)*)")?')
+
+    JSON_ALT_FIELDS = {b'status': STATUSCODE,
+                       b'mime': MIMETYPE,
+                       b'digest': DIGEST,
+                       b'statuscode': STATUSCODE,
+                       b'mimetype': MIMETYPE,
+                       b's': STATUSCODE,
+                       b'm': MIMETYPE,
+                       b'd': DIGEST}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.num_lines = len(lines)
+
+        lengths = np.fromiter((len(line) for line in lines), dtype=np.int64,
+                              count=self.num_lines)
+
+        self.ends = np.cumsum(lengths)
+        self.starts = self.ends - lengths
+
+        self.buff = b''.join(lines)
+
+        self.urlkeys = None
+        self.timestamps = None
+
+        # field -> (array of value ids, dict of value -> id)
+        self.values = {}
+
+        self._seconds = None
+
+    @classmethod
+    def parse(cls, lines):
+        """ Parse lines into columns, or return None if lines
+        are not all in the same, known format
+        """
+        columns = cls(lines)
+        matches = columns.LINE_RX.findall(columns.buff)
+
+        if len(matches) != columns.num_lines or not matches:
+            return None
+
+        urlkeys, timestamps, is_json = zip(*matches)
+
+        columns.urlkeys = np.array(urlkeys, dtype=bytes)
+        columns.timestamps = np.array(timestamps, dtype=bytes)
+
+        num_json = sum(1 for m in is_json if m)
+
+        if num_json == columns.num_lines:
+            columns._parse_json_fields()
+        elif num_json == 0:
+            columns._parse_cdx_fields()
+        else:
+            return None
+
+        return columns
+
+    def _new_field(self):
+        return np.full(self.num_lines, UNKNOWN, dtype=np.int32), {}
+
+    def _get_id(self, field, value):
+        ids, vocab = self.values[field]
+        value_id = vocab.get(value)
+        if value_id is None:
+            value_id = vocab[value] = len(vocab)
+
+        return value_id
+
+    def _parse_json_fields(self):
+        for field in self.FIELDS:
+            self.values[field] = self._new_field()
+
+        # lines with a field under an alt name, or not a string
+        unknown = dict((field, []) for field in self.FIELDS)
+
+        matches = list(self.JSON_FIELD_RX.finditer(self.buff))
+        rows = np.searchsorted(self.ends,
+                               [m.start() for m in matches], side='right')
+
+        for m, row in zip(matches, rows):
+            name, value = m.group(1, 2)
+            field = self.JSON_ALT_FIELDS[name]
+
+            if value is None or name != field.encode('utf-8'):
+                unknown[field].append(row)
+                continue
+
+            if b'\\' in value:
+                value = to_native_str(json.loads(b'"' + value + b'"'), 'utf-8')
+            else:
+                value = to_native_str(value, 'utf-8')
+
+            self.values[field][0][row] = self._get_id(field, value)
+
+        for field, rows in unknown.items():
+            self.values[field][0][rows] = UNKNOWN
+
+    def _parse_cdx_fields(self):
+        for field in self.FIELDS:
+            self.values[field] = self._new_field()
+
+        for row, line in enumerate(self.lines):
+            fields = line.rstrip().split(b' ')
+            field_pos = CDXLineFilter.CDX_FIELD_POS.get(len(fields))
+            if not field_pos:
+                continue
+
+            for field in self.FIELDS:
+                pos = field_pos.get(field)
+                if pos is not None:
+                    value = to_native_str(fields[pos], 'utf-8')
+                    self.values[field][0][row] = self._get_id(field, value)
+
+    def match_exact(self, field, value):
+        """ Mask of lines where field may be equal to value
+        """
+        ids, vocab = self.values[field]
+        return (ids == vocab.get(value, -2)) | (ids == UNKNOWN)
+
+    def match_not_exact(self, field, value):
+        """ Mask of lines where field may not be equal to value
+        """
+        ids, vocab = self.values[field]
+        return ids != vocab.get(value, -2)
+
+    def is_known(self, field):
+        """ Mask of lines where the value of field could be read
+        """
+        return self.values[field][0] != UNKNOWN
+
+    @property
+    def seconds(self):
+        """ Tuple of array of timestamps in seconds, and mask of timestamps
+        which are valid 14-digit timestamps, and so have seconds
+        """
+        if self._seconds is None:
+            self._seconds = timestamps_to_sec(self.timestamps)
+
+        return self._seconds
+
+    def get_lines(self, mask):
+        buff = self.buff
+        return [buff[start:end] for start, end in
+                zip(self.starts[mask].tolist(), self.ends[mask].tolist())]
+
+
+#=================================================================
+def timestamps_to_sec(timestamps):
+    """ Convert array of 14-digit timestamps to seconds since epoch,
+    same as timestamp_to_sec(), returning seconds and mask of valid
+    timestamps. Shorter timestamps or out of range values,
+    padded or clamped by timestamp_to_sec(), are not valid.
+    """
+    valid = (np.char.str_len(timestamps) == 14) & np.char.isdigit(timestamps)
+
+    values = np.where(valid, timestamps, b'19700101000000').astype(np.int64)
+
+    year = values // 10000000000
+    month = values // 100000000 % 100
+    day = values // 1000000 % 100
+    hour = values // 10000 % 100
+    minute = values // 100 % 100
+    second = values % 100
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    max_day = month_days[np.clip(month, 0, 12)] + (leap & (month == 2))
+
+    # same year range as timestamp_to_sec()
+    valid &= ((year >= 1900) & (year <= 2999) & (month >= 1) & (month <= 12) &
+              (day >= 1) & (day <= max_day) &
+              (hour < 24) & (minute < 60) & (second < 60))
+
+    # days since epoch, from proleptic gregorian date
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+
+    return days * 86400 + hour * 3600 + minute * 60 + second, valid
+
+
+#=================================================================
+class ColumnarBlockFilter(object):
+    """
+    Vectorized pre-filter for blocks of cdx lines, compiled from a query
+    """
+    def __init__(self, query):
+        self.filters = []
+        all_exact = True
+
+        filters = query.filters
+        # same as cdx_filter()
+        if isinstance(filters, str):
+            filters = [filters]
+
+        for filter_str in filters:
+            cdx_filter = CDXFilter(filter_str)
+            if (cdx_filter.field in BlockColumns.FIELDS and
+                cdx_filter.compare_func == cdx_filter.exact):
+                self.filters.append(cdx_filter)
+            else:
+                all_exact = False
+
+        # same as cdx_clamp()
+        self.from_ts = self._pad(query.from_ts, PAD_14_DOWN)
+        self.to_ts = self._pad(query.to_ts, PAD_14_UP)
+
+        # rest only if all lines dropped by regular processing
+        # before collapsing are also dropped here
+        self.collapse_urlkey = False
+        self.closest_sec = None
+        self.limit = query.limit
+
+        if not all_exact or query.collapse_time:
+            return
+
+        if query.collapse_urlkey:
+            self.collapse_urlkey = True
+
+        elif query.closest and not query.params.get('_closest_seek'):
+            self.closest_sec = timestamp_to_sec(query.closest)
+
+    @staticmethod
+    def _pad(timestamp, pad):
+        if not timestamp:
+            return None
+
+        if len(timestamp) < 14:
+            timestamp = pad_timestamp(timestamp, pad)
+
+        return timestamp.encode('utf-8')
+
+    @classmethod
+    def from_query(cls, query):
+        """ Return filter for query, or None if numpy is not available
+        or nothing can be filtered
+        """
+        if not HAS_NUMPY or query.resolve_revisits:
+            return None
+
+        block_filter = cls(query)
+        if (not block_filter.filters and not block_filter.from_ts and
+            not block_filter.to_ts and not block_filter.collapse_urlkey and
+            block_filter.closest_sec is None):
+            return None
+
+        return block_filter
+
+    def __call__(self, line_iter):
+        lines = list(line_iter)
+        columns = BlockColumns.parse(lines) if lines else None
+        if not columns:
+            return lines
+
+        return columns.get_lines(self.get_mask(columns))
+
+    def get_mask(self, columns):
+        mask = np.ones(columns.num_lines, dtype=bool)
+
+        # lines where all filtered fields could be read, and so which
+        # are known to pass the filters if still in the mask
+        known = np.ones(columns.num_lines, dtype=bool)
+
+        for cdx_filter in self.filters:
+            known &= columns.is_known(cdx_filter.field)
+
+            if cdx_filter.invert:
+                mask &= columns.match_not_exact(cdx_filter.field,
+                                                cdx_filter.filter_str)
+            else:
+                mask &= columns.match_exact(cdx_filter.field,
+                                            cdx_filter.filter_str)
+
+        if self.from_ts:
+            mask &= columns.timestamps >= self.from_ts
+
+        if self.to_ts:
+            mask &= columns.timestamps <= self.to_ts
+
+        # lines which may be dropped by the filters are kept, and
+        # are not counted when selecting the lines to keep below
+
+        if self.collapse_urlkey:
+            rows = np.nonzero(mask & known)[0]
+            urlkeys = columns.urlkeys[rows]
+            mask[rows[1:][urlkeys[1:] == urlkeys[:-1]]] = False
+
+        elif self.closest_sec is not None:
+            seconds, valid = columns.seconds
+
+            # only the closest 'limit' lines, in order, with valid timestamps
+            rows = np.nonzero(mask & known & valid)[0]
+            if len(rows) > self.limit:
+                dist = np.abs(seconds[rows] - self.closest_sec)
+                order = np.argsort(dist, kind='stable')
+                mask[rows[order[self.limit:]]] = False
+
+        return mask
@@ -1,5 +1,6 @@
 from warcio.utils import to_native_str
 from pywb.utils.loaders import load_yaml_config
+from pywb.warcserver.index.resultcache import get_index_version
 
 import re
 import os
@@ -24,6 +25,9 @@ class FuzzyMatcher(object):
     FUZZY_SKIP_PARAMS = ('alt_url', 'reverse', 'closest', 'end_key',
                          'url', 'matchType', 'filter')
 
+    # NotFoundCache of queries with no exact or fuzzy match, if set
+    not_found_cache = None
+
     def __init__(self, filename):
         config = load_yaml_config(filename)
         self.rules = []
@@ -126,10 +130,36 @@ class FuzzyMatcher(object):
         return '.*'.join([conv(param) for param in params_list])
 
     def __call__(self, index_source, params):
+        not_found = None
+        if self.not_found_cache:
+            not_found = self._check_not_found(index_source, params)
+            if not_found is True:
+                return iter([]), {}
+
         cdx_iter, errs = index_source(params)
-        return self.get_fuzzy_iter(cdx_iter, index_source, params), errs
 
-    def get_fuzzy_iter(self, cdx_iter, index_source, params):
+        # only cache if all sources were queried
+        if errs:
+            not_found = None
+
+        return self.get_fuzzy_iter(cdx_iter, index_source, params, not_found), errs
+
+    def _check_not_found(self, index_source, params):
+        """ Return True if query is cached as not found, or else the
+        (key, version) to cache if nothing is found, or None
+        """
+        key = self.not_found_cache.get_key(params)
+        if key is None:
+            return None
+
+        version = get_index_version(index_source, params)
+
+        if self.not_found_cache.is_not_found(key, version):
+            return True
+
+        return key, version
+
+    def get_fuzzy_iter(self, cdx_iter, index_source, params, not_found=None):
         found = False
         for cdx in cdx_iter:
             found = True
@@ -139,10 +169,13 @@ class FuzzyMatcher(object):
             return
 
         url = params['url']
-        urlkey = to_native_str(params['key'], 'utf-8')
+        # key may be followed by from timestamp
+        urlkey = to_native_str(params['key'], 'utf-8').split(' ', 1)[0]
 
         res = self.get_fuzzy_match(urlkey, params)
         if not res:
+            if not_found:
+                self.not_found_cache.add(*not_found)
             return
 
         rule, fuzzy_params = res
@@ -155,9 +188,13 @@ class FuzzyMatcher(object):
 
         for cdx in new_iter:
             if is_custom or self.match_general_fuzzy_query(url, urlkey, cdx, rx_cache):
+                found = True
                 cdx['is_fuzzy'] = True
                 yield cdx
 
+        if not found and not_found and not errs:
+            self.not_found_cache.add(*not_found)
+
     def match_general_fuzzy_query(self, url, urlkey, cdx, rx_cache):
         # check ext
         ext = self.get_ext(url)
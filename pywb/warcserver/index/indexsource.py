@@ -1,4 +1,8 @@
-from pywb.utils.binsearch import iter_range
+from pywb.utils.binsearch import iter_range, iter_range_reverse, MMapCache
+from pywb.utils.binsearch import iter_distinct_keys
+from pywb.utils.sparseindex import SparseIndexCache, SparseIndex
+from pywb.warcserver.index.sourcemeta import SourceMetaCache, load_text_meta
+from pywb.warcserver.index.sourcemeta import get_file_key
 from pywb.utils.canonicalize import canonicalize
 from pywb.utils.wbexception import NotFoundException
 
@@ -7,6 +11,7 @@ from warcio.timeutils import timestamp_now, pad_timestamp, PAD_14_DOWN
 
 from pywb.warcserver.http import DefaultAdapters
 from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.warcserver.index.cdxops import cdx_iter_closest
 
 from pywb.utils.format import ParamFormatter, res_template
 from pywb.utils.memento import MementoUtils
@@ -15,6 +20,8 @@ import redis
 
 import requests
 
+from six.moves import filter
+
 import re
 import logging
 
@@ -25,9 +32,54 @@ class BaseIndexSource(object):
 
     logger = logging.getLogger('warcserver')
 
+    # if true, load_index() returns captures in closest order
+    # when a '_closest_seek' timestamp is set
+    supports_closest_seek = False
+
+    # if true, load_index() returns captures in reverse order
+    # when '_reverse_seek' is set
+    supports_reverse_seek = False
+
     def load_index(self, params):  #pragma: no cover
         raise NotImplemented()
 
+    def get_source_meta(self, params):
+        """ Return SourceMeta for the index used for this query,
+        or None if not available
+        """
+        return None
+
+    def get_index_version(self, params):
+        """ Return a value which changes whenever the index used for
+        this query changes, or None if changes can not be detected
+        """
+        return None
+
+    @staticmethod
+    def filter_lines(lines, params):
+        """ Skip raw index lines which can not match the query filters
+        """
+        line_filter = params.get('_line_filter')
+        if not line_filter:
+            return lines
+
+        return filter(line_filter, lines)
+
+    @staticmethod
+    def get_closest_key(params):
+        """ Return the index key at which captures at or after the
+        '_closest_seek' timestamp start, or None if not seeking
+        """
+        closest = params.get('_closest_seek')
+        if not closest:
+            return None
+
+        # key may already be narrowed by from/to timestamps
+        urlkey = params['key'].split(b' ', 1)[0]
+        key = urlkey + b' ' + closest.encode('utf-8')
+
+        return min(max(key, params['key']), params['end_key'])
+
     def _get_referrer(self, params):
         input_req = params.get('_input_req')
         if input_req:
@@ -47,24 +99,99 @@ class BaseIndexSource(object):
 class FileIndexSource(BaseIndexSource):
     CDX_EXT = ('.cdx', '.cdxj')
 
-    def __init__(self, filename):
+    # shared by all file sources, so that mappings and sparse indexes
+    # outlive per-request sources created by DirectoryIndexSource
+    mmap_cache = MMapCache()
+    sparse_cache = SparseIndexCache()
+    meta_cache = SourceMetaCache()
+
+    def __init__(self, filename, use_mmap=False, sparse_block_size=0,
+                 bloom=False):
         self.filename_template = filename
+        self.use_mmap = use_mmap
+        self.sparse_block_size = sparse_block_size
+        self.bloom = bloom
+
+    supports_closest_seek = True
+    supports_reverse_seek = True
 
     def load_index(self, params):
         filename = res_template(self.filename_template, params)
 
+        if params.get('_reverse_seek'):
+            return self._load_lines(filename, self._iter_range_reverse,
+                                    params['key'], params['end_key'], params)
+
+        if params.get('_collapse_seek'):
+            return self._load_lines(filename, self._iter_distinct_keys,
+                                    params['key'], params['end_key'], params)
+
+        closest_key = self.get_closest_key(params)
+        if not closest_key:
+            return self._load_lines(filename, self._iter_range,
+                                    params['key'], params['end_key'], params)
+
+        # captures before closest, read backwards
+        prev_iter = self._load_lines(filename, self._iter_range_reverse,
+                                     params['key'], closest_key, params)
+
+        # captures at or after closest, read forwards
+        next_iter = self._load_lines(filename, self._iter_range,
+                                     closest_key, params['end_key'], params)
+
+        return cdx_iter_closest(params['_closest_seek'], prev_iter, next_iter)
+
+    def get_source_meta(self, params):
+        filename = res_template(self.filename_template, params)
+        return self.meta_cache.get(filename, self._load_meta, self.bloom)
+
+    def get_index_version(self, params):
+        filename = res_template(self.filename_template, params)
         try:
-            fh = open(filename, 'rb')
-        except IOError:
+            return get_file_key(filename)
+        except (IOError, OSError):
+            return None
+
+    def _load_meta(self, filename, file_key, bloom):
+        return load_text_meta(filename, file_key, bloom)
+
+    def _load_lines(self, filename, range_func, start, end, params):
+        try:
+            if self.use_mmap:
+                reader = self.mmap_cache.get(filename)
+            else:
+                reader = open(filename, 'rb')
+        except (IOError, OSError):
             raise NotFoundException(filename)
 
-        def do_load(fh):
-            with fh:
-                gen = iter_range(fh, params['key'], params['end_key'])
-                for line in gen:
+        def do_load(reader):
+            try:
+                gen = range_func(filename, reader, start, end)
+                for line in self.filter_lines(gen, params):
                     yield CDXObject(line)
+            finally:
+                # shared mapping, not closed here
+                if not self.use_mmap:
+                    reader.close()
 
-        return do_load(fh)
+        return do_load(reader)
+
+    def _iter_range(self, filename, reader, start, end):
+        if self.sparse_block_size:
+            sidx = self.sparse_cache.get(filename, self.sparse_block_size)
+            return sidx.iter_range(reader, start, end)
+
+        return iter_range(reader, start, end)
+
+    def _iter_range_reverse(self, filename, reader, start, end):
+        return iter_range_reverse(reader, start, end)
+
+    def _iter_distinct_keys(self, filename, reader, start, end):
+        if self.sparse_block_size:
+            sidx = self.sparse_cache.get(filename, self.sparse_block_size)
+            return iter_distinct_keys(reader, start, end, search_func=sidx.search)
+
+        return iter_distinct_keys(reader, start, end)
 
     def __repr__(self):
         return '{0}(file://{1})'.format(self.__class__.__name__,
@@ -79,23 +206,44 @@ class FileIndexSource(BaseIndexSource):
 
         return self.filename_template == other.filename_template
 
+    @staticmethod
+    def get_file_opts(config):
+        """ Parse per-file search options from a 'file' source config:
+
+        mmap: true -- search memory-mapped file
+        sparse_index: true|<block size in KB> -- use sparse key index
+        bloom: true -- skip file if query host not in Bloom filter of hosts
+        """
+        sparse_index = config.get('sparse_index', False)
+        if sparse_index is True:
+            sparse_block_size = SparseIndex.DEFAULT_BLOCK_SIZE
+        elif sparse_index:
+            sparse_block_size = int(sparse_index) * 1024
+        else:
+            sparse_block_size = 0
+
+        return dict(use_mmap=config.get('mmap', False),
+                    sparse_block_size=sparse_block_size,
+                    bloom=config.get('bloom', False))
+
     @classmethod
-    def init_from_string(cls, value):
+    def init_from_string(cls, value, **file_opts):
         if value.startswith('file://'):
-            return cls(value[7:])
+            return cls(value[7:], **file_opts)
 
         if not value.endswith(cls.CDX_EXT):
             return None
 
         if value.startswith('/') or '://' not in value:
-            return cls(value)
+            return cls(value, **file_opts)
 
     @classmethod
     def init_from_config(cls, config):
         if config['type'] != 'file':
             return
 
-        return cls.init_from_string(config['path'])
+        return cls.init_from_string(config['path'],
+                                    **cls.get_file_opts(config))
 
 
 #=============================================================================
@@ -206,7 +354,7 @@ class LiveIndexSource(BaseIndexSource):
             raise NotFoundException(params['url'] + '*')
 
         cdx = CDXObject()
-        cdx['urlkey'] = params.get('key').decode('utf-8')
+        cdx['urlkey'] = params.get('key').split(b' ', 1)[0].decode('utf-8')
         cdx['timestamp'] = timestamp_now()
         cdx['url'] = params['url']
         cdx['load_url'] = res_template(self.proxy_url, params)
@@ -261,6 +409,12 @@ class LiveIndexSource(BaseIndexSource):
 
 #=============================================================================
 class RedisIndexSource(BaseIndexSource):
+    # entries loaded per request when seeking to closest or in reverse
+    BATCH_SIZE = 100
+
+    supports_closest_seek = True
+    supports_reverse_seek = True
+
     def __init__(self, redis_url=None, redis=None, key_template=None, **kwargs):
         if redis_url:
             redis, key_template = self.parse_redis_url(redis_url, redis)
@@ -308,15 +462,86 @@ class RedisIndexSource(BaseIndexSource):
 
     def load_key_index(self, key_template, params):
         z_key = res_template(key_template, params)
-        index_list = self.redis.zrangebylex(z_key,
-                                            b'[' + params['key'],
-                                            b'(' + params['end_key'])
 
         def do_load(index_list):
-            for line in index_list:
+            for line in self.filter_lines(index_list, params):
                 yield CDXObject(line)
 
-        return do_load(index_list)
+        if params.get('_collapse_seek'):
+            return do_load(self.iter_distinct_lex_range(z_key,
+                                                        params['key'],
+                                                        params['end_key']))
+
+        if params.get('_reverse_seek'):
+            return do_load(self.iter_lex_range(z_key,
+                                               b'[' + params['key'],
+                                               b'(' + params['end_key'],
+                                               reverse=True))
+
+        if params.get('_resume_seek'):
+            return do_load(self.iter_lex_range(z_key,
+                                               b'[' + params['key'],
+                                               b'(' + params['end_key']))
+
+        closest_key = self.get_closest_key(params)
+        if not closest_key:
+            index_list = self.redis.zrangebylex(z_key,
+                                                b'[' + params['key'],
+                                                b'(' + params['end_key'])
+
+            return do_load(index_list)
+
+        prev_iter = self.iter_lex_range(z_key,
+                                        b'[' + params['key'],
+                                        b'(' + closest_key,
+                                        reverse=True)
+
+        next_iter = self.iter_lex_range(z_key,
+                                        b'[' + closest_key,
+                                        b'(' + params['end_key'])
+
+        return cdx_iter_closest(params['_closest_seek'],
+                                do_load(prev_iter),
+                                do_load(next_iter))
+
+    def iter_distinct_lex_range(self, z_key, start, end):
+        """ Iterate over the first entry of each distinct urlkey
+        where start <= entry < end, skipping the rest of each urlkey
+        with an exclusive start
+        """
+        min_ = b'[' + start
+        max_ = b'(' + end
+
+        while True:
+            batch = self.redis.zrangebylex(z_key, min_, max_, 0, 1)
+            if not batch:
+                break
+
+            line = batch[0]
+            yield line
+
+            min_ = b'(' + line.split(b' ', 1)[0] + b'!'
+
+    def iter_lex_range(self, z_key, min_, max_, reverse=False):
+        """ Iterate over a lex range of a sorted set, in forward
+        or reverse order, loading BATCH_SIZE entries at a time
+        """
+        start = 0
+        while True:
+            if reverse:
+                batch = self.redis.zrevrangebylex(z_key, max_, min_,
+                                                  start, self.BATCH_SIZE)
+            else:
+                batch = self.redis.zrangebylex(z_key, min_, max_,
+                                               start, self.BATCH_SIZE)
+
+            for line in batch:
+                yield line
+
+            if len(batch) < self.BATCH_SIZE:
+                break
+
+            start += self.BATCH_SIZE
 
     def __repr__(self):
         return '{0}({1}, {2}, {3})'.format(self.__class__.__name__,
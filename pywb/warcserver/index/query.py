@@ -2,6 +2,11 @@ from six.moves.urllib.parse import urlencode
 from pywb.warcserver.index.cdxobject import CDXException
 from pywb.utils.canonicalize import calc_search_range
 
+from warcio.timeutils import timestamp_to_datetime, datetime_to_timestamp
+from warcio.utils import to_native_str
+
+import base64
+
 
 #=================================================================
 class CDXQuery(object):
@@ -19,13 +24,37 @@ class CDXQuery(object):
             else:
                 self.params['matchType'] = 'exact'
 
+        # originals of revisits may be before the from timestamp
+        from_ts = self.from_ts if not self.resolve_revisits else None
+
         start, end = calc_search_range(url=url,
                                        match_type=self.params['matchType'],
-                                       url_canon=self.params.get('_url_canon'))
+                                       url_canon=self.params.get('_url_canon'),
+                                       from_ts=from_ts,
+                                       to_ts=self.to_ts)
+
+        if self.resume_key:
+            start = self._seek_resume_key(start, end)
 
         self.params['key'] = start.encode('utf-8')
         self.params['end_key'] = end.encode('utf-8')
 
+    def _seek_resume_key(self, start, end):
+        """ Move start of key range to the capture at the resume key,
+        or to the next urlkey if collapsing by urlkey
+        """
+        if self.closest or self.reverse:
+            msg = 'resumeKey is not supported with closest or reverse'
+            raise CDXException(msg)
+
+        urlkey, timestamp, _ = decode_resume_key(self.resume_key)
+        if self.collapse_urlkey:
+            resume_start = urlkey + '!'
+        else:
+            resume_start = urlkey + ' ' + timestamp
+
+        return min(max(start, resume_start), end)
+
     @property
     def key(self):
         return self.params['key']
@@ -70,6 +99,26 @@ class CDXQuery(object):
     def collapse_time(self):
         return self.params.get('collapseTime')
 
+    @property
+    def collapse(self):
+        return self.params.get('collapse')
+
+    @property
+    def collapse_urlkey(self):
+        return self.collapse == 'urlkey'
+
+    @property
+    def collapse_seek(self):
+        """
+        true if index sources can skip to the next urlkey after
+        the first capture of each urlkey, as the rest are collapsed
+        """
+        return (self.collapse_urlkey and not self.filters and
+                not self.from_ts and not self.to_ts and
+                not self.resolve_revisits and
+                not self.reverse and not self.closest and
+                not self.page_count and not self.secondary_index_only)
+
     @property
     def resolve_revisits(self):
         return self._get_bool('resolveRevisits')
@@ -99,12 +148,38 @@ class CDXQuery(object):
         # sort=closest is not required
         return self.params.get('closest')
 
+    @property
+    def closest_seek(self):
+        """
+        closest timestamp, padded to 14 digits, if captures can be loaded
+        in closest order by seeking to it in each index, or None if all
+        captures must be loaded and then sorted
+        """
+        closest = self.closest
+        if (not closest or not self.is_exact or
+            self.collapse_time or self.collapse or self.resolve_revisits or
+            self.page_count or self.secondary_index_only):
+            return None
+
+        return datetime_to_timestamp(timestamp_to_datetime(closest))
+
     @property
     def reverse(self):
         # sort=reverse overrides reverse=0
         return (self._get_bool('reverse') or
                 self.params.get('sort') == 'reverse')
 
+    @property
+    def reverse_seek(self):
+        """
+        true if captures can be loaded in reverse order by reading each
+        index backwards, instead of loading all captures and reversing
+        """
+        return (self.reverse and not self.closest and
+                not self.collapse_time and not self.collapse and
+                not self.resolve_revisits and
+                not self.page_count and not self.secondary_index_only)
+
     @property
     def custom_ops(self):
         return self.params.get('custom_ops', [])
@@ -125,6 +200,24 @@ class CDXQuery(object):
     def page_count(self):
         return self._get_bool('showNumPages')
 
+    @property
+    def resume_key(self):
+        return self.params.get('resumeKey')
+
+    @property
+    def show_resume_key(self):
+        return self._get_bool('showResumeKey')
+
+    @property
+    def resume_seek(self):
+        """
+        true if reading a page of captures starting from a resume key,
+        or returning a resume key, so sources need only read as many
+        captures as are needed for the page
+        """
+        return (bool(self.resume_key or self.show_resume_key) and
+                not self.closest and not self.reverse)
+
     def _get_bool(self, name, def_val=False):
         v = self.params.get(name)
         if v:
@@ -139,3 +232,28 @@ class CDXQuery(object):
 
     def urlencode(self):
         return urlencode(self.params, True)
+
+
+#=================================================================
+def encode_resume_key(urlkey, timestamp, count):
+    """
+    opaque resume key for the `count`-th capture with urlkey and timestamp
+
+    >>> encode_resume_key('com,example)/', '20140127171200', 2)
+    'Y29tLGV4YW1wbGUpLyAyMDE0MDEyNzE3MTIwMCAy'
+
+    >>> decode_resume_key(encode_resume_key('com,example)/?a', '2014', 1))
+    ('com,example)/?a', '2014', 1)
+    """
+    key = '{0} {1} {2}'.format(urlkey, timestamp, count).encode('utf-8')
+    return to_native_str(base64.urlsafe_b64encode(key).rstrip(b'='))
+
+
+def decode_resume_key(resume_key):
+    try:
+        key = resume_key.encode('utf-8')
+        key = base64.urlsafe_b64decode(key + b'=' * (-len(key) % 4))
+        urlkey, timestamp, count = key.decode('utf-8').split(' ')
+        return urlkey, timestamp, int(count)
+    except Exception:
+        raise CDXException('Invalid resumeKey: ' + resume_key)
@@ -0,0 +1,353 @@
+"""
+In-process cache of aggregator query results.
+
+Results are cached by the normalized query, with the closest timestamp
+optionally rounded to a bucket, so that lookups for a page and its
+embeds, and for reloads of the same page, are answered from memory.
+The rounding only applies to the cache key: a cached result for another
+closest timestamp in the bucket is only used if it holds all captures
+for the query, and is then sorted again for the requested timestamp.
+
+Each entry is checked against the current version of each index source
+(eg. file mtime and size) and discarded if any index has changed. For
+sources with no version, such as redis or remote sources, entries expire
+after a ttl instead.
+
+Only the captures read by the caller are cached: if a later lookup reads
+past the cached captures, the query is run again for the rest.
+"""
+
+import time
+
+from pywb.utils.cache import LRUCache
+from pywb.warcserver.index.query import CDXQuery
+
+from warcio.timeutils import timestamp_to_sec, sec_to_timestamp
+
+
+#=============================================================================
+def get_params_key(params, skip_params=()):
+    """ Hashable key of all query params, except internal params
+    and any in skip_params
+    """
+    key = []
+    for name in sorted(params):
+        if name.startswith('_') or name in skip_params:
+            continue
+
+        value = params[name]
+        if isinstance(value, list):
+            value = tuple(value)
+
+        key.append((name, value))
+
+    return tuple(key)
+
+
+#=============================================================================
+def get_index_version(index_source, params):
+    """ Index version of index_source, computed once per request
+    and kept in the params, for use by each cache
+    """
+    versions = params.get('_index_versions')
+    if versions is None:
+        versions = params['_index_versions'] = {}
+
+    try:
+        return versions[index_source]
+    except KeyError:
+        pass
+
+    get_version = getattr(index_source, 'get_index_version', None)
+    version = get_version(params) if get_version else None
+
+    versions[index_source] = version
+    return version
+
+
+#=============================================================================
+class CachedResult(object):
+    __slots__ = ['cdx_list', 'complete', 'version', 'expires', 'closest']
+
+    def __init__(self, version, expires, closest=None):
+        self.cdx_list = []
+        self.complete = False
+        self.version = version
+        self.expires = expires
+        self.closest = closest
+
+
+#=============================================================================
+class ResultCache(object):
+    DEFAULT_MAX_SIZE = 1000
+    DEFAULT_TTL = 60
+    DEFAULT_MAX_CAPTURES = 1000
+
+    # params which only change the output format, not the captures
+    SKIP_PARAMS = ('mode', 'output', 'fields', 'fl')
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL,
+                 max_captures=DEFAULT_MAX_CAPTURES, closest_bucket=0):
+        self.cache = LRUCache(int(max_size))
+        self.ttl = int(ttl)
+        self.max_captures = int(max_captures)
+        self.closest_bucket = int(closest_bucket)
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.reloads = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        """ Init from a config dict with optional:
+
+        size: <max queries cached>
+        ttl: <secs>, expiry for queries on sources with no version
+        max_captures: <max captures cached per query>
+        closest_bucket: <secs>, round closest timestamps to this interval
+        """
+        if not config:
+            return None
+
+        if not isinstance(config, dict):
+            config = {}
+
+        return cls(max_size=config.get('size', cls.DEFAULT_MAX_SIZE),
+                   ttl=config.get('ttl', cls.DEFAULT_TTL),
+                   max_captures=config.get('max_captures', cls.DEFAULT_MAX_CAPTURES),
+                   closest_bucket=config.get('closest_bucket', 0))
+
+    def round_closest(self, closest):
+        """ Round the closest timestamp to the middle of its bucket,
+        so that lookups within the same bucket share a cache entry
+        """
+        if not closest or not self.closest_bucket:
+            return closest
+
+        try:
+            secs = timestamp_to_sec(closest)
+        except Exception:
+            return closest
+
+        bucket = self.closest_bucket
+        secs = secs - (secs % bucket) + bucket // 2
+        return sec_to_timestamp(secs)
+
+    @staticmethod
+    def is_cacheable(query):
+        # resume keys are set while reading the results
+        return not (query.resume_key or query.show_resume_key or
+                    query.page_count or query.secondary_index_only)
+
+    def get_key(self, params):
+        closest = params.get('closest')
+        rounded = self.round_closest(closest)
+        if rounded != closest:
+            params = dict(params)
+            params['closest'] = rounded
+
+        return get_params_key(params, self.SKIP_PARAMS)
+
+    def __call__(self, agg, query, load_func):
+        """ Return cached results for the query, if still valid, or
+        results from load_func(query), to be cached as they are read
+        """
+        params = query.params
+        key = self.get_key(params)
+        version = get_index_version(agg, params)
+        now = time.time()
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.version != version or (entry.expires and now >= entry.expires):
+                self.invalidations += 1
+                self.cache.remove(key)
+                entry = None
+
+        if entry is not None:
+            if entry.closest == query.closest:
+                self.hits += 1
+                return self._iter_cached(entry, query, load_func), {}
+
+            if self._can_resort(entry, query):
+                self.hits += 1
+                return self._iter_resorted(entry, query), {}
+
+        self.misses += 1
+
+        cdx_iter, errs = load_func(query)
+
+        # don't cache errors, eg. from a source timing out
+        if errs:
+            return cdx_iter, errs
+
+        expires = now + self.ttl if version is None else None
+        entry = CachedResult(version, expires, query.closest)
+        self.cache.put(key, entry)
+
+        return self._iter_and_cache(entry, cdx_iter), errs
+
+    @staticmethod
+    def _can_resort(entry, query):
+        """ Return True if the entry, for another closest timestamp,
+        holds all captures for the query, in an order that only
+        depends on the closest timestamp
+        """
+        if not entry.complete or not query.closest_seek:
+            return False
+
+        return len(entry.cdx_list) < query.limit
+
+    def _iter_resorted(self, entry, query):
+        closest_sec = timestamp_to_sec(query.closest)
+
+        # equal distance: earlier timestamp first, then in cached order
+        def get_dist(cdx):
+            timestamp = cdx['timestamp']
+            return (abs(closest_sec - timestamp_to_sec(timestamp)), timestamp)
+
+        for cdx in sorted(entry.cdx_list, key=get_dist):
+            yield cdx.copy()
+
+    def _iter_and_cache(self, entry, cdx_iter):
+        count = 0
+        for cdx in cdx_iter:
+            count += 1
+            if count <= self.max_captures:
+                entry.cdx_list.append(cdx.copy())
+
+            yield cdx
+
+        entry.complete = (count <= self.max_captures)
+
+    def _iter_cached(self, entry, query, load_func):
+        # a copy of each capture, as replay may add fields to it
+        count = 0
+        for cdx in entry.cdx_list:
+            count += 1
+            yield cdx.copy()
+
+        if entry.complete:
+            return
+
+        # read past cached captures, load the rest, also adding them
+        # to the entry, unless already added by another lookup
+        self.reloads += 1
+
+        cdx_iter, errs = load_func(query)
+        if errs:
+            entry = None
+
+        i = 0
+        for cdx in cdx_iter:
+            i += 1
+            if i <= count:
+                continue
+
+            if entry and len(entry.cdx_list) == i - 1 and i <= self.max_captures:
+                entry.cdx_list.append(cdx.copy())
+
+            yield cdx
+
+        if entry and len(entry.cdx_list) == i:
+            entry.complete = True
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        cache_stats = self.cache.stats()
+
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    hit_ratio=float(self.hits) / total if total else 0.0,
+                    invalidations=self.invalidations,
+                    reloads=self.reloads,
+                    evictions=cache_stats['evictions'],
+                    count=cache_stats['count'],
+                    max_size=cache_stats['max_size'])
+
+
+#=============================================================================
+class NotFoundCache(object):
+    """
+    Bounded cache of queries which found no captures, including with
+    fuzzy matching, so that repeated lookups of missing urls can be
+    answered without querying the indexes.
+
+    Keyed by the index key range and other query params, but not the
+    closest timestamp or sort order, which do not change whether any
+    captures are found. Entries expire after a short ttl, and are
+    discarded if the version of any index source has changed.
+    """
+    DEFAULT_MAX_SIZE = 10000
+    DEFAULT_TTL = 10
+
+    SKIP_PARAMS = ResultCache.SKIP_PARAMS + ('url', 'alt_url', 'key', 'end_key',
+                                             'closest', 'sort', 'reverse')
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.cache = LRUCache(int(max_size))
+        self.ttl = int(ttl)
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def init_from_config(cls, config):
+        """ Init from a config dict with optional:
+
+        size: <max queries cached>
+        ttl: <secs>
+        """
+        if not config:
+            return None
+
+        if not isinstance(config, dict):
+            config = {}
+
+        return cls(max_size=config.get('size', cls.DEFAULT_MAX_SIZE),
+                   ttl=config.get('ttl', cls.DEFAULT_TTL))
+
+    def get_key(self, params):
+        """ Key for the query, or None if the query can not be parsed
+        """
+        try:
+            query = CDXQuery(dict(params))
+        except Exception:
+            return None
+
+        return (query.key, query.end_key,
+                get_params_key(query.params, self.SKIP_PARAMS))
+
+    def is_not_found(self, key, version):
+        entry = self.cache.get(key)
+        if entry is not None:
+            entry_version, expires = entry
+            if entry_version == version and time.time() < expires:
+                self.hits += 1
+                return True
+
+            self.cache.remove(key)
+
+        self.misses += 1
+        return False
+
+    def add(self, key, version):
+        self.cache.put(key, (version, time.time() + self.ttl))
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        cache_stats = self.cache.stats()
+
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    hit_ratio=float(self.hits) / total if total else 0.0,
+                    evictions=cache_stats['evictions'],
+                    count=cache_stats['count'],
+                    max_size=cache_stats['max_size'])
@@ -0,0 +1,165 @@
+"""
+Per-source index metadata, used by aggregators to skip sources which can
+not have any captures for a query, without opening or searching them.
+
+The metadata is the first and last line of the (sorted) index, and
+optionally a Bloom filter of all SURT host prefixes in the index, eg.
+'com', 'com,example' and 'com,example,www' for 'com,example,www)/path'.
+It is computed once for each file and recomputed if the file's mtime
+or size have changed.
+"""
+
+import os
+
+from pywb.utils.bloom import BloomFilter
+from pywb.utils.cache import LRUCache
+
+
+#=================================================================
+class SourceMeta(object):
+    def __init__(self, file_key, first_line, last_line, bloom=None):
+        self.file_key = file_key
+        self.first_line = first_line
+        self.last_line = last_line
+        self.bloom = bloom
+
+    def may_contain(self, key, end_key):
+        """ Return False if index has no lines where key <= line < end_key
+        """
+        if self.first_line is None:
+            return False
+
+        if self.last_line < key or self.first_line >= end_key:
+            return False
+
+        if self.bloom is not None:
+            host = get_query_host(key, end_key)
+            if host is not None and host not in self.bloom:
+                return False
+
+        return True
+
+    @staticmethod
+    def build_bloom(urlkeys):
+        """ Bloom filter of host prefixes of all urlkeys, or None
+        if any urlkey is not in SURT form
+        """
+        prefixes = set()
+        last_host = None
+
+        for urlkey in urlkeys:
+            host, sep, _ = urlkey.partition(b')')
+            if not sep:
+                return None
+
+            if host == last_host:
+                continue
+
+            last_host = host
+
+            parts = host.split(b',')
+            for i in range(1, len(parts) + 1):
+                prefixes.add(b','.join(parts[:i]))
+
+        bloom = BloomFilter(len(prefixes))
+        for prefix in prefixes:
+            bloom.add(prefix)
+
+        return bloom
+
+
+#=================================================================
+def get_query_host(key, end_key):
+    """ Return SURT host (or host prefix, for a domain query) which all
+    lines in the key range must start with, or None if no single host
+    """
+    host, sep, _ = key.partition(b')')
+    if not sep:
+        return None
+
+    # exact, prefix, host match: only lines for this host
+    if end_key.startswith(host + b')') or end_key == host + b'*':
+        return host
+
+    # domain match: lines for this host and any subdomains
+    if end_key == host + b'-':
+        return host
+
+    return None
+
+
+#=================================================================
+def get_file_key(filename):
+    stat = os.stat(filename)
+    return (stat.st_mtime, stat.st_size)
+
+
+def load_text_meta(filename, file_key, bloom=False):
+    """ Metadata for a sorted text (cdx, cdxj) index, reading the first
+    and last line, and only reading the full file if building a Bloom filter
+    """
+    with open(filename, 'rb') as fh:
+        first_line = fh.readline().rstrip()
+        if not first_line:
+            return SourceMeta(file_key, None, None)
+
+        last_line = _read_last_line(fh, file_key[1])
+
+        if bloom:
+            fh.seek(0)
+            bloom = SourceMeta.build_bloom(line.split(b' ', 1)[0] for line in fh
+                                           if line.strip() and not line.startswith(b' CDX'))
+        else:
+            bloom = None
+
+    return SourceMeta(file_key, first_line, last_line, bloom)
+
+
+def _read_last_line(fh, size, block_size=8192):
+    offset = size
+    buff = b''
+
+    while offset > 0:
+        read_size = min(block_size, offset)
+        offset -= read_size
+        fh.seek(offset)
+        buff = fh.read(read_size) + buff
+
+        lines = buff.rstrip().rsplit(b'\n', 1)
+        if len(lines) == 2:
+            return lines[1]
+
+    return buff.rstrip()
+
+
+#=================================================================
+class SourceMetaCache(object):
+    """
+    Keeps metadata for each index file, reloading it
+    if the file's mtime or size have changed
+
+    Up to max_size entries are kept, least recently used first, and
+    the metadata for a file is dropped once the file is removed
+    """
+    DEFAULT_MAX_SIZE = 1000
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.metas = LRUCache(max_size)
+
+    def get(self, filename, load_func, bloom=False):
+        """ Return cached metadata, or call load_func(filename, file_key, bloom)
+        to load it
+        """
+        try:
+            file_key = get_file_key(filename)
+        except (IOError, OSError):
+            self.metas.remove((filename, bloom))
+            raise
+
+        meta = self.metas.get((filename, bloom))
+        if meta is not None and meta.file_key == file_key:
+            return meta
+
+        meta = load_func(filename, file_key, bloom)
+        self.metas.put((filename, bloom), meta)
+        return meta
@@ -0,0 +1,144 @@
+"""
+Per-source latency tracking and circuit breaking, used by aggregators
+which query remote sources concurrently, so that one slow or failing
+source does not set the latency of every request.
+
+For each source, the latency of each lookup is tracked as an EWMA and
+over a window of recent lookups, for percentiles. After t_count timeouts
+within t_duration secs, the breaker opens and the source is skipped. Once
+t_duration secs have passed, a single probe lookup is allowed: if it
+completes in time the breaker closes, otherwise it opens again.
+"""
+
+from collections import deque
+
+
+#=============================================================================
+class SourceStats(object):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    DEFAULT_ALPHA = 0.2
+    DEFAULT_WINDOW = 100
+
+    def __init__(self, t_count=3, t_duration=20,
+                 alpha=DEFAULT_ALPHA, window=DEFAULT_WINDOW):
+        self.t_count = t_count
+        self.t_duration = t_duration
+        self.alpha = alpha
+
+        self.latencies = deque(maxlen=window)
+        self.ewma = None
+
+        self.timeouts = deque()
+
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.probing = False
+
+        self.requests = 0
+        self.timeout_count = 0
+        self.skipped = 0
+
+    def add_latency(self, secs):
+        self.latencies.append(secs)
+        if self.ewma is None:
+            self.ewma = secs
+        else:
+            self.ewma += self.alpha * (secs - self.ewma)
+
+    def percentile(self, pc):
+        """ Latency percentile over recent lookups, or None if no lookups
+        """
+        if not self.latencies:
+            return None
+
+        latencies = sorted(self.latencies)
+        return latencies[int(round((pc / 100.0) * (len(latencies) - 1)))]
+
+    def is_available(self, now):
+        """ Return True if the source may be queried, without changing
+        the breaker state
+        """
+        if self.state == self.OPEN:
+            return now - self.opened_at >= self.t_duration
+
+        if self.state == self.HALF_OPEN:
+            return not self.probing
+
+        return True
+
+    def start_request(self, now):
+        """ Claim the source for a lookup, including the single probe
+        when half open. Return False if skipped
+        """
+        if not self.is_available(now):
+            self.skipped += 1
+            return False
+
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            self.probing = True
+
+        self.requests += 1
+        return True
+
+    def end_request(self, secs):
+        """ Record the latency of a completed lookup, also releasing
+        the probe, if any
+        """
+        self.add_latency(secs)
+        self.probing = False
+
+    def on_success(self):
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self.probing = False
+            self.timeouts.clear()
+
+    def on_timeout(self, now):
+        self.timeout_count += 1
+
+        if self.state == self.HALF_OPEN:
+            self._open(now)
+            return
+
+        self.timeouts.append(now)
+        while self.timeouts and (now - self.timeouts[0]) > self.t_duration:
+            self.timeouts.popleft()
+
+        if len(self.timeouts) >= self.t_count:
+            self._open(now)
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probing = False
+        self.timeouts.clear()
+
+    def get_deadline(self, timeout, min_samples, multiplier, min_timeout):
+        """ Deadline for a lookup, from the p95 latency of recent lookups,
+        within min_timeout and timeout, or timeout if too few lookups
+        """
+        if len(self.latencies) < min_samples:
+            return timeout
+
+        deadline = max(self.percentile(95) * multiplier, min_timeout)
+        if timeout:
+            deadline = min(deadline, timeout)
+
+        return deadline
+
+    def stats(self):
+        return dict(state=self.state,
+                    requests=self.requests,
+                    timeouts=self.timeout_count,
+                    skipped=self.skipped,
+                    samples=len(self.latencies),
+                    ewma=self.ewma,
+                    p50=self.percentile(50),
+                    p95=self.percentile(95),
+                    p99=self.percentile(99))
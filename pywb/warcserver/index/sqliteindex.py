@@ -0,0 +1,284 @@
+"""
+Embedded SQLite index of cdx lines, which can be added to in place.
+
+Each capture is stored as a row of (urlkey, timestamp, rest of the line),
+in a table clustered on all three columns, so that range queries read the
+lines in the same order as a sorted cdx file, and adding new lines is an
+insert instead of a merge and rewrite of the full index. Identical lines
+are only stored once.
+
+The index may be written with:
+
+    cdx-indexer -j index.sqlite <warcs>
+
+or, for a collection, with `wb-manager sqlite <coll>`, after which
+`wb-manager add` adds new captures to the collection's index.sqlite.
+"""
+
+import os
+import sqlite3
+
+from pywb.utils.wbexception import NotFoundException
+from pywb.utils.format import res_template
+
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.warcserver.index.cdxops import cdx_iter_closest
+from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.sourcemeta import get_file_key
+
+
+#=============================================================================
+SQLITE_EXT = ('.sqlite', '.sqlite3')
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS cdx (
+    urlkey BLOB NOT NULL,
+    timestamp BLOB NOT NULL,
+    rest BLOB NOT NULL,
+    PRIMARY KEY (urlkey, timestamp, rest)
+) WITHOUT ROWID
+"""
+
+FIELDS = 'urlkey, timestamp, rest'
+
+ORDER = 'ORDER BY urlkey, timestamp, rest'
+
+REVERSE_ORDER = 'ORDER BY urlkey DESC, timestamp DESC, rest DESC'
+
+
+#=============================================================================
+def split_cdx_line(line):
+    """ Split cdx line into urlkey, timestamp and rest of the line
+    """
+    fields = line.rstrip().split(b' ', 2)
+    if len(fields) == 2:
+        fields.append(b'')
+
+    return fields
+
+
+#=============================================================================
+class SqliteIndexWriter(object):
+    """
+    Add cdx lines to a new or existing sqlite index, in batches
+    """
+    BATCH_SIZE = 10000
+
+    def __init__(self, filename):
+        self.conn = sqlite3.connect(filename)
+
+        # allow reads while adding to the index
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(SCHEMA)
+
+        self.batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def add_line(self, line):
+        if not line.strip() or line.startswith(b' CDX'):
+            return
+
+        fields = split_cdx_line(line)
+        if len(fields) != 3:
+            return
+
+        self.batch.append(fields)
+        if len(self.batch) >= self.BATCH_SIZE:
+            self.flush()
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.add_line(line)
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO cdx VALUES (?, ?, ?)',
+                                  self.batch)
+
+        self.batch = []
+
+    def close(self):
+        if self.conn:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+
+#=============================================================================
+class SqliteIndexSource(BaseIndexSource):
+    """
+    Index source for a sqlite index, answering range queries
+    from the (urlkey, timestamp) primary key
+    """
+    CDX_EXT = SQLITE_EXT
+
+    supports_closest_seek = True
+    supports_reverse_seek = True
+
+    def __init__(self, filename):
+        self.filename_template = filename
+
+    def load_index(self, params):
+        filename = res_template(self.filename_template, params)
+
+        if params.get('_reverse_seek'):
+            return self._load_lines(filename, self._iter_range_reverse,
+                                    params['key'], params['end_key'], params)
+
+        if params.get('_collapse_seek'):
+            return self._load_lines(filename, self._iter_distinct_keys,
+                                    params['key'], params['end_key'], params)
+
+        closest_key = self.get_closest_key(params)
+        if not closest_key:
+            return self._load_lines(filename, self._iter_range,
+                                    params['key'], params['end_key'], params)
+
+        # captures before closest, read backwards
+        prev_iter = self._load_lines(filename, self._iter_range_reverse,
+                                     params['key'], closest_key, params)
+
+        # captures at or after closest, read forwards
+        next_iter = self._load_lines(filename, self._iter_range,
+                                     closest_key, params['end_key'], params)
+
+        return cdx_iter_closest(params['_closest_seek'], prev_iter, next_iter)
+
+    def get_index_version(self, params):
+        filename = res_template(self.filename_template, params)
+        try:
+            version = get_file_key(filename)
+        except (IOError, OSError):
+            return None
+
+        # new lines may only be in the write-ahead log
+        wal_filename = filename + '-wal'
+        if os.path.isfile(wal_filename):
+            version += get_file_key(wal_filename)
+
+        return version
+
+    @staticmethod
+    def _connect(filename):
+        try:
+            return sqlite3.connect(filename)
+        except sqlite3.Error:
+            raise NotFoundException(filename)
+
+    def _load_lines(self, filename, range_func, start, end, params):
+        # don't create a new, empty index if not found
+        if not os.path.isfile(filename):
+            raise NotFoundException(filename)
+
+        # connection only open while the lines are read
+        def do_load():
+            conn = self._connect(filename)
+            try:
+                gen = range_func(conn, start, end)
+                for line in self.filter_lines(gen, params):
+                    yield CDXObject(line)
+            finally:
+                conn.close()
+
+        return do_load()
+
+    @staticmethod
+    def _key_clause(op, key):
+        """ Return sql condition and args comparing (urlkey, timestamp) to
+        a 'urlkey timestamp' search key, matching the sort order of lines
+        in a cdx file, where urlkey is always followed by a space
+        """
+        fields = key.split(b' ', 2)
+
+        # a line with the same urlkey sorts after a key without a timestamp,
+        # so only the urlkey needs to be compared for >= and <
+        if len(fields) == 1:
+            return 'urlkey {0} ?'.format(op), [key]
+
+        return '(urlkey, timestamp) {0} (?, ?)'.format(op), fields[:2]
+
+    def _select(self, conn, start, end, order, limit=None):
+        start_clause, start_args = self._key_clause('>=', start)
+        end_clause, end_args = self._key_clause('<', end)
+
+        sql = 'SELECT {0} FROM cdx WHERE {1} AND {2} {3}'.format(FIELDS,
+                                                              start_clause,
+                                                              end_clause,
+                                                              order)
+        if limit:
+            sql += ' LIMIT {0}'.format(limit)
+
+        return conn.execute(sql, start_args + end_args)
+
+    @staticmethod
+    def _to_line(row):
+        urlkey, timestamp, rest = row
+        line = bytes(urlkey) + b' ' + bytes(timestamp)
+        if rest:
+            line += b' ' + bytes(rest)
+
+        return line
+
+    def _iter_range(self, conn, start, end):
+        for row in self._select(conn, start, end, ORDER):
+            yield self._to_line(row)
+
+    def _iter_range_reverse(self, conn, start, end):
+        for row in self._select(conn, start, end, REVERSE_ORDER):
+            yield self._to_line(row)
+
+    def _iter_distinct_keys(self, conn, start, end):
+        """ First line of each urlkey, seeking from one urlkey to the next
+        """
+        while True:
+            row = self._select(conn, start, end, ORDER, limit=1).fetchone()
+            if not row:
+                break
+
+            yield self._to_line(row)
+
+            # '!' sorts right after the space following the urlkey in a line
+            start = bytes(row[0]) + b'!'
+
+    def __repr__(self):
+        return '{0}(sqlite://{1})'.format(self.__class__.__name__,
+                                          self.filename_template)
+
+    def __str__(self):
+        return 'sqlite'
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__):
+            return False
+
+        return self.filename_template == other.filename_template
+
+    @classmethod
+    def init_from_string(cls, value):
+        if value.startswith('sqlite://'):
+            return cls(value[9:])
+
+        if not value.endswith(cls.CDX_EXT):
+            return None
+
+        if value.startswith('file://'):
+            return cls(value[7:])
+
+        if value.startswith('/') or '://' not in value:
+            return cls(value)
+
+    @classmethod
+    def init_from_config(cls, config):
+        if config['type'] not in ('sqlite', 'file'):
+            return
+
+        return cls.init_from_string(config['path'])
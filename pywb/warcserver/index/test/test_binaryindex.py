@@ -0,0 +1,108 @@
+from pywb.warcserver.index.binaryindex import BinaryIndexSource, BinaryCDXWriter
+from pywb.warcserver.index.binaryindex import BinaryCDXIndex, write_binary_cdx
+from pywb.warcserver.index.cdxobject import CDXException
+from pywb.warcserver.index.aggregator import DirectoryIndexSource, SimpleAggregator
+from pywb.warcserver.warcserver import init_index_source
+
+from pywb.warcserver.test.testutils import TEST_CDX_PATH, TempDirTests, BaseTestClass
+
+from io import BytesIO
+
+import os
+import pytest
+
+
+# ============================================================================
+def to_binary(lines):
+    writer = BinaryCDXWriter()
+    try:
+        for line in lines:
+            writer.add_line(line)
+
+        buff = BytesIO()
+        writer.write(buff)
+    finally:
+        writer.close()
+
+    return BinaryCDXIndex(buff.getvalue())
+
+
+def read_lines(filename):
+    with open(filename, 'rb') as fh:
+        return [line.rstrip() for line in fh if not line.startswith(b' CDX')]
+
+
+# ============================================================================
+class TestBinaryIndex(TempDirTests, BaseTestClass):
+    @pytest.mark.parametrize('name', ['iana.cdxj', 'dupes.cdxj', 'example-no-digest.cdxj'])
+    def test_cdxj_round_trip(self, name):
+        lines = read_lines(TEST_CDX_PATH + name)
+        index = to_binary(lines)
+
+        assert len(index) == len(lines)
+        assert list(index.iter_range(b'', b'~')) == lines
+
+    @pytest.mark.parametrize('name', ['iana.cdx', 'example.cdx', 'bad.cdx'])
+    def test_cdx_round_trip(self, name):
+        lines = read_lines(os.path.join(TEST_CDX_PATH, '..', 'cdx', name))
+        index = to_binary(lines)
+
+        assert list(index.iter_range(b'', b'~')) == lines
+
+    def test_mixed_field_types(self):
+        lines = [b'com,example)/ 20140101000000 {"url": "http://example.com/", "length": "5", "offset": "10", "mime": "caf\\u00e9"}',
+                 b'com,example)/ 20140101000000 {"url": "http://example.com/", "length": 100, "offset": "0100", "status": 200, "extra": {"a": [1, "\\t"]}}',
+                 b'com,example)/a 20140102 http://example.com/a text/html 200 ABC - - 10 20 file.warc.gz',
+                 b'com,example)/b 20140102000000 http://example.com/b - - ABC - 20 file.warc.gz']
+
+        index = to_binary(lines)
+
+        assert list(index.iter_range(b'', b'~')) == lines
+        assert list(index.iter_range_reverse(b'com,example)/', b'com,example)/a')) == lines[1::-1]
+        assert list(index.iter_distinct_keys(b'', b'~')) == [lines[0]] + lines[2:]
+
+    def test_not_sorted(self):
+        with pytest.raises(CDXException):
+            to_binary([b'com,example)/b 20140101000000 {"url": "http://example.com/b"}',
+                       b'com,example)/a 20140101000000 {"url": "http://example.com/a"}'])
+
+    def test_not_binary_index(self):
+        with pytest.raises(CDXException):
+            BinaryCDXIndex(b'com,example)/ 20140101000000 {}\n')
+
+    def test_init_source(self):
+        filename = os.path.join(self.root_dir, 'iana.cdxb')
+        assert write_binary_cdx(TEST_CDX_PATH + 'iana.cdxj', filename) == 171
+
+        assert init_index_source(filename) == BinaryIndexSource(filename)
+        assert init_index_source('file://' + filename) == BinaryIndexSource(filename)
+        assert init_index_source({'type': 'file', 'path': filename}) == BinaryIndexSource(filename)
+
+        assert not isinstance(init_index_source(TEST_CDX_PATH + 'iana.cdxj'), BinaryIndexSource)
+
+    def test_dir_source(self):
+        filename = os.path.join(self.root_dir, 'iana.cdxb')
+        write_binary_cdx(TEST_CDX_PATH + 'iana.cdxj', filename)
+
+        source = DirectoryIndexSource(self.root_dir)
+        res, errs = SimpleAggregator({'dir': source})(dict(url='http://www.iana.org/', limit=1))
+        res = list(res)
+
+        assert errs == {}
+        assert res[0]['source'] == 'dir:iana.cdxb'
+        assert res[0]['timestamp'] == '20140126200624'
+
+    def test_index_dropped_with_file(self):
+        filename = os.path.join(self.root_dir, 'removed.cdxb')
+        write_binary_cdx(TEST_CDX_PATH + 'iana.cdxj', filename)
+
+        source = BinaryIndexSource(filename)
+        index = source.get_index(filename)
+        assert source.get_index(filename) is index
+        assert filename in BinaryIndexSource.indexes
+
+        os.remove(filename)
+        with pytest.raises(OSError):
+            source.get_index(filename)
+
+        assert filename not in BinaryIndexSource.indexes
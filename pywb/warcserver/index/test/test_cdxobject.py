@@ -53,3 +53,63 @@ def test_lt_le():
     assert A < C
 
 
+
+def test_lazy_parse():
+    line = b'com,example)/ 2016 {"url": "http://example.com/", "mime": "text/html", "status": "200"}'
+    A = CDXObject(line)
+    B = CDXObject(line)
+
+    # only urlkey and timestamp parsed
+    assert A._fields is None
+    assert A['urlkey'] == 'com,example)/'
+    assert A['timestamp'] == '2016'
+    assert 'timestamp' in A
+    assert A._fields is None
+
+    assert A.get('status') == '200'
+    assert A._fields is not None
+    assert list(A.keys()) == ['urlkey', 'timestamp', 'url', 'mime', 'status']
+
+    # repeated values shared
+    assert A['mime'] is B['mime']
+
+    assert str(B) == line.decode('utf-8')
+    assert B.to_json() == '{"urlkey": "com,example)/", "timestamp": "2016", "url": "http://example.com/", "mime": "text/html", "status": "200"}\n'
+
+    B['status'] = '404'
+    del B['mime']
+    assert B.to_cdxj() == 'com,example)/ 2016 {"url": "http://example.com/", "status": "404"}\n'
+
+def test_lazy_parse_cdx_format():
+    line = 'com,example)/ 2016 http://example.com/ text/html 200 ABC - - 100 200 example.warc.gz'
+    x = CDXObject(line.encode('utf-8'))
+    assert x['filename'] == 'example.warc.gz'
+    assert x.to_text(['timestamp', 'status']) == '2016 200\n'
+
+    x['filename'] = 'other.warc.gz'
+    assert str(x) == line.replace('example.warc.gz', 'other.warc.gz')
+
+
+def test_copy_empty_cdxobject():
+    # filled in field by field, as by live and memento sources
+    x = CDXObject()
+    x['urlkey'] = 'com,example)/'
+    x['timestamp'] = '2016'
+    x['load_url'] = 'http://example.com/'
+
+    y = x.copy()
+    y['load_url'] = 'http://example.com/other'
+    x['is_live'] = 'true'
+
+    assert list(y.items()) == [('urlkey', 'com,example)/'), ('timestamp', '2016'),
+                               ('load_url', 'http://example.com/other')]
+    assert x['load_url'] == 'http://example.com/'
+
+def test_copy_unparsed():
+    x = CDXObject(b'com,example)/ 2016 {"url": "http://example.com/"}')
+    y = x.copy()
+    y['status'] = '200'
+
+    assert x._fields is None
+    assert 'status' not in x
+    assert y['url'] == 'http://example.com/'
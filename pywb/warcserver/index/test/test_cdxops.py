@@ -113,6 +113,17 @@ org,iana)/_css/2013.1/screen.css 20140126201054 http://www.iana.org/_css/2013.1/
 20140126200654
 20140126200625
 
+# Reverse prefix query, read backwards from end of range
+>>> cdx_ops_test('http://iana.org/domains/root/*', reverse = True, limit = 3, fields = 'urlkey,timestamp')
+org,iana)/domains/root/servers 20140126201227
+org,iana)/domains/root/db 20140126200928
+org,iana)/domains/root/db 20140126200927
+
+# Reverse query with filter and multiple sources
+>>> cdx_ops_test('http://iana.org/', reverse = True, filter = '!mime:warc/revisit', fields = 'urlkey,timestamp,url', sources = {'dupes': test_cdx_dir + 'dupes.cdx', 'iana': test_cdx_dir + 'iana.cdx'})
+org,iana)/ 20140127171238 http://iana.org
+org,iana)/ 20140126200624 http://www.iana.org/
+
 # In case of both reverse and closest, closest takes precedence
 # 'reverse closest' not supported at this time
 # if it is, this test will reflect the change
@@ -160,10 +171,18 @@ org,iana)/domains/root/db 20140126200928 http://www.iana.org/domains/root/db tex
 
 #=================================================================
 from pywb.warcserver.warcserver import init_index_agg
+from pywb.warcserver.index.cdxops import CDXFilter, make_line_filter
+from pywb.warcserver.index.cdxops import cdx_merge, cdx_merge_reverse
+from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.indexsource import FileIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject, CDXException
+from pywb.warcserver.index.query import CDXQuery
 
 import os
 import sys
+import pytest
 import six
+import tempfile
 
 from pywb import get_test_dir
 
@@ -227,6 +246,165 @@ def test_cdxj_resolve_revisit_2():
 
 
 
+def test_line_filter_matches_cdx_filter():
+    # raw line filter never rejects a line matched by the full filter
+    filters = ['status:200', '=mime:text/html', '!mime:warc/revisit',
+               '~url:css', 'mime:text/.*', '=urlkey:org,iana)/',
+               '!timestamp:2014012620', 'digest:OSS', '=length:2258']
+
+    for filename in ('cdx/iana.cdx', 'cdxj/iana.cdxj'):
+        with open(get_test_dir() + filename, 'rb') as fh:
+            lines = fh.readlines()
+
+        for filter_str in filters:
+            query = CDXQuery(dict(url='iana.org', filter=filter_str))
+            line_filter = make_line_filter(query)
+            cdx_filter = CDXFilter(filter_str)
+
+            matched = [line for line in lines if cdx_filter(CDXObject(line))]
+            accepted = [line for line in lines if line_filter(line)]
+
+            assert set(matched) <= set(accepted)
+
+            # inverted cdxj field filters are only checked after parsing
+            if not filter_str.startswith('!'):
+                assert len(accepted) < len(lines)
+
+
+def test_line_filter_not_applied():
+    assert make_line_filter(CDXQuery(dict(url='iana.org'))) is None
+    assert make_line_filter(CDXQuery(dict(url='iana.org', filter='=source:file'))) is None
+    assert make_line_filter(CDXQuery(dict(url='iana.org', filter='status:200',
+                                          resolveRevisits='true'))) is None
+
+
+def test_merge_by_key():
+    with open(get_test_dir() + 'cdxj/iana.cdxj', 'rb') as fh:
+        lines = fh.readlines()
+
+    def load(i, lines):
+        for line in lines:
+            cdx = CDXObject(line)
+            cdx.add_source('src' + str(i))
+            yield cdx
+
+    # every other line, and all lines twice
+    line_lists = [lines[::2], lines, lines[1::2], lines]
+
+    res = list(cdx_merge([load(i, x) for i, x in enumerate(line_lists)]))
+
+    # merged without parsing
+    assert all(cdx._fields is None for cdx in res)
+
+    exp = sorted(((line, i) for i, x in enumerate(line_lists) for line in x),
+                 key=lambda res: (res[0].split(b' ', 2)[:2], res[1]))
+    fields = ['urlkey', 'timestamp', 'offset']
+    assert [(cdx.to_text(fields), cdx['source']) for cdx in res] == \
+           [(CDXObject(line).to_text(fields), 'src' + str(i)) for line, i in exp]
+
+    rev = cdx_merge_reverse([load(i, x[::-1]) for i, x in enumerate(line_lists)])
+    assert [cdx.to_json() for cdx in rev] == [cdx.to_json() for cdx in res][::-1]
+
+
+def test_resolve_revisits_bounded():
+    cdxj = """\
+com,example)/a 20140101000000 {"url": "http://example.com/a", "mime": "text/html", "status": "200", "digest": "A", "length": "1", "offset": "10", "filename": "a.warc.gz"}
+com,example)/a 20140102000000 {"url": "http://example.com/a", "mime": "text/plain", "status": "200", "digest": "B", "length": "2", "offset": "20", "filename": "a.warc.gz"}
+com,example)/a 20140103000000 {"url": "http://example.com/a", "mime": "warc/revisit", "digest": "A", "length": "3", "offset": "30", "filename": "b.warc.gz"}
+com,example)/a 20140104000000 {"url": "http://example.com/a", "mime": "warc/revisit", "digest": "B", "length": "4", "offset": "40", "filename": "b.warc.gz"}
+com,example)/b 20140105000000 {"url": "http://example.com/b", "mime": "warc/revisit", "digest": "A", "length": "5", "offset": "50", "filename": "b.warc.gz"}
+"""
+
+    with tempfile.NamedTemporaryFile(suffix='.cdxj', mode='wt', delete=False) as fh:
+        fh.write(cdxj)
+
+    try:
+        def query(size):
+            agg = SimpleAggregator({'src': FileIndexSource(fh.name)},
+                                   revisit_cache_size=size)
+
+            cdx_iter, errs = agg(dict(url='example.com/', matchType='domain',
+                                      resolveRevisits='true'))
+
+            res = [cdx.to_text(['timestamp', 'mime', 'orig.offset']) for cdx in cdx_iter]
+            return res, agg.revisit_stats
+
+        res, stats = query(None)
+        assert res == ['20140101000000 text/html -\n',
+                       '20140102000000 text/plain -\n',
+                       '20140103000000 text/html 10\n',
+                       '20140104000000 text/plain 20\n',
+                       '20140105000000 text/html 10\n']
+
+        assert stats == {'evictions': 0}
+
+        # original for 'A' evicted and looked up again, only at the same url
+        res2, stats = query(1)
+        assert res2[:4] == res[:4]
+        assert res2[4] == '20140105000000 warc/revisit -\n'
+        assert stats == {'evictions': 3, 'lookups': 3, 'found': 2}
+
+    finally:
+        os.remove(fh.name)
+
+
+def test_resume_key_pages():
+    sources = {'dupes': test_cdx_dir + 'dupes.cdx',
+               'iana': test_cdx_dir + 'iana.cdx',
+               'iana2': test_cdx_dir + 'iana.cdx'}
+
+    def load_pages(limit, **params):
+        params['url'] = 'iana.org'
+        params['matchType'] = 'domain'
+
+        server = init_index_agg(sources)
+        pages = []
+        resume_key = None
+        while True:
+            page_params = dict(params, limit=limit, showResumeKey='true')
+            if resume_key:
+                page_params['resumeKey'] = resume_key
+
+            cdx_iter, errs = server(page_params)
+            pages.append([cdx.to_text() for cdx in cdx_iter])
+
+            resume_key = page_params.get('_resume_key')
+            if not resume_key:
+                return pages
+
+    def load_all(**params):
+        cdx_iter, errs = init_index_agg(sources)(dict(params, url='iana.org',
+                                                      matchType='domain'))
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    for params in ({}, {'filter': 'mime:text/html'}, {'collapse': 'urlkey'}):
+        full = load_all(**params)
+
+        # same urlkey and timestamp in several sources, except if collapsed
+        keys = set(tuple(line.split(' ', 2)[:2]) for line in full)
+        assert len(full) > len(keys) or params.get('collapse')
+
+        for limit in (1, 2, 5, 100):
+            pages = load_pages(limit, **params)
+            assert all(len(page) == limit for page in pages[:-1])
+            assert sum(pages, []) == full
+
+        # no resume key if all captures in one page
+        assert len(load_pages(len(full), **params)) == 1
+
+
+def test_resume_key_errors():
+    with pytest.raises(CDXException):
+        cdx_ops_test_data('iana.org', resumeKey='abc')
+
+    resume_key = 'b3JnLGlhbmEpLyAyMDE0MDEyNjIwMDYyNCAx'
+    with pytest.raises(CDXException):
+        cdx_ops_test_data('iana.org', resumeKey=resume_key, reverse='true')
+
+    with pytest.raises(CDXException):
+        cdx_ops_test_data('iana.org', resumeKey=resume_key, closest='2014')
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,142 @@
+from pywb.warcserver.index.coalesce import QueryCoalescer
+from pywb.warcserver.index.resultcache import ResultCache
+from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+
+import gevent
+
+
+# ============================================================================
+class SlowCountingSource(BaseIndexSource):
+    def __init__(self, num_lines=3):
+        self.lines = [('com,example)/ 2014010100000{0} {{"url": "http://example.com/"}}'.format(i)).encode('utf-8')
+                      for i in range(num_lines)]
+        self.loads = 0
+
+        self.lines_read = 0
+
+    def load_index(self, params):
+        self.loads += 1
+        gevent.sleep(0.01)
+        return self._iter_lines()
+
+    def _iter_lines(self):
+        for line in self.lines:
+            self.lines_read += 1
+            yield CDXObject(line)
+
+
+# ============================================================================
+class TestQueryCoalescer(object):
+    def query_concurrent(self, agg, count=5, **params):
+        def query():
+            res, errs = agg(dict(url='http://example.com/', **params))
+            return [cdx['timestamp'] for cdx in res], errs
+
+        jobs = [gevent.spawn(query) for i in range(count)]
+        gevent.joinall(jobs)
+        return [job.value for job in jobs]
+
+    def test_coalesce(self):
+        source = SlowCountingSource()
+        coalescer = QueryCoalescer()
+        agg = SimpleAggregator({'source': source}, query_coalescer=coalescer)
+
+        results = self.query_concurrent(agg, output='json')
+        assert source.loads == 1
+        assert all(res == (['20140101000000', '20140101000001', '20140101000002'], {})
+                   for res in results)
+
+        assert coalescer.stats() == {'calls': 5, 'shared': 4, 'in_flight': 0, 'reloads': 0}
+
+        # only concurrent queries coalesced
+        self.query_concurrent(agg, count=1)
+        assert source.loads == 2
+
+        # different queries not coalesced
+        gevent.joinall([gevent.spawn(agg, dict(url='http://example.com/', limit=1)),
+                        gevent.spawn(agg, dict(url='http://example.com/', limit=2))])
+        assert source.loads == 4
+
+        assert agg.get_stats({})['query_coalescer'] == coalescer.stats()
+
+    def test_shared_copies(self):
+        agg = SimpleAggregator({'source': SlowCountingSource()}, query_coalescer=QueryCoalescer())
+
+        def query():
+            res, errs = agg(dict(url='http://example.com/'))
+            cdx = next(res)
+            assert 'recorder_skip' not in cdx
+            cdx['recorder_skip'] = '1'
+            return cdx['source']
+
+        jobs = [gevent.spawn(query) for i in range(3)]
+        gevent.joinall(jobs, raise_error=True)
+        assert [job.value for job in jobs] == ['source'] * 3
+
+    def test_more_than_max_captures(self):
+        source = SlowCountingSource(5)
+        coalescer = QueryCoalescer(max_captures=2)
+        agg = SimpleAggregator({'source': source}, query_coalescer=coalescer)
+
+        results = self.query_concurrent(agg, count=3)
+        assert all(len(res) == 5 for res, errs in results)
+
+        # each query reading past shared results loads the rest again
+        assert source.loads == 4
+        assert coalescer.stats()['reloads'] == 3
+
+    def test_with_result_cache(self):
+        source = SlowCountingSource()
+        cache = ResultCache()
+        agg = SimpleAggregator({'source': source}, query_coalescer=QueryCoalescer(),
+                               result_cache=cache)
+
+        self.query_concurrent(agg)
+        self.query_concurrent(agg)
+        assert source.loads == 1
+
+        assert cache.stats()['misses'] == 5
+        assert cache.stats()['hits'] == 5
+
+    def test_lazy_shared_read(self):
+        source = SlowCountingSource(5)
+        coalescer = QueryCoalescer()
+        agg = SimpleAggregator({'source': source}, query_coalescer=coalescer)
+
+        res, errs = agg(dict(url='http://example.com/'))
+        assert next(res)['timestamp'] == '20140101000000'
+        assert source.lines_read == 1
+
+        # joins lookup while still being read
+        res2, errs = agg(dict(url='http://example.com/'))
+        assert [cdx['timestamp'] for cdx in res2][:2] == ['20140101000000', '20140101000001']
+        assert source.loads == 1
+        assert source.lines_read == 5
+
+        assert next(res)['timestamp'] == '20140101000001'
+        assert coalescer.stats()['shared'] == 1
+
+        # no longer in flight once read
+        assert coalescer.stats()['in_flight'] == 0
+        agg(dict(url='http://example.com/'))
+        assert source.loads == 2
+
+    def test_not_shared_when_no_readers(self):
+        source = SlowCountingSource()
+        coalescer = QueryCoalescer()
+        agg = SimpleAggregator({'source': source}, query_coalescer=coalescer)
+
+        res, errs = agg(dict(url='http://example.com/'))
+        next(res)
+        del res
+
+        assert coalescer.stats()['in_flight'] == 0
+        agg(dict(url='http://example.com/'))
+        assert source.loads == 2
+
+    def test_init_from_config(self):
+        assert QueryCoalescer.init_from_config(None) is None
+        assert QueryCoalescer.init_from_config(True).max_captures == QueryCoalescer.DEFAULT_MAX_CAPTURES
+        assert QueryCoalescer.init_from_config({'max_captures': 10}).max_captures == 10
@@ -114,6 +114,22 @@ class TestDirAgg(TempDirTests, BaseTestClass):
         assert(to_json_list(res) == exp)
         assert(errs == {})
 
+    def test_agg_all_found_mmap_sparse(self):
+        loader = DirectoryIndexSource(self.dir_loader.base_prefix,
+                                      self.dir_loader.base_dir,
+                                      use_mmap=True,
+                                      sparse_block_size=1024)
+
+        for url in ('iana.org/*', 'example.com/', 'http://www.iana.org/_css/2013.1/fonts/opensans-bold.ttf'):
+            params = {'url': url, 'param.coll': '*'}
+            res, errs = loader(dict(params))
+            exp, exp_errs = self.dir_loader(dict(params))
+
+            assert(to_json_list(res) == to_json_list(exp))
+            assert(errs == {})
+
+        assert(os.path.isfile(to_path(self.root_dir + '/colls/B/indexes/iana.cdxj.sidx')))
+
     @patch('pywb.warcserver.index.indexsource.MementoIndexSource.get_timegate_links', mock_link_header)
     def test_agg_dir_and_memento(self):
         sources = {'ia': MementoIndexSource.from_timegate_url('http://web.archive.org/web/'),
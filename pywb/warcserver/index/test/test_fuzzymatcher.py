@@ -3,6 +3,11 @@ from pywb.utils.canonicalize import canonicalize
 
 from pywb.warcserver.index.aggregator import SimpleAggregator
 from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.resultcache import NotFoundCache, ResultCache
+from pywb.utils.wbexception import NotFoundException
+
+from mock import patch
+import time
 
 
 # ============================================================================
@@ -21,6 +26,26 @@ class EchoParamsSource(BaseIndexSource):
         return iter([cdx])
 
 
+# ============================================================================
+class CountingSource(EchoParamsSource):
+    def __init__(self):
+        self.loads = []
+        self.version = 1
+        self.version_checks = 0
+        self.error = False
+
+    def load_index(self, params):
+        self.loads.append(params.get('matchType', 'exact'))
+        if self.error:
+            raise NotFoundException('error')
+
+        return super(CountingSource, self).load_index(params)
+
+    def get_index_version(self, params):
+        self.version_checks += 1
+        return self.version
+
+
 # ============================================================================
 class TestFuzzy(object):
     @classmethod
@@ -159,3 +184,93 @@ class TestFuzzy(object):
         cdx_iter, errs = self.fuzzy(self.source, params)
         assert list(cdx_iter) == []
 
+
+
+# ============================================================================
+class TestFuzzyNotFoundCache(object):
+    def setup_method(self):
+        self.counting = CountingSource()
+        self.source = SimpleAggregator({'source': self.counting})
+        self.fuzzy = FuzzyMatcher('pkg://pywb/rules.yaml')
+        self.fuzzy.not_found_cache = NotFoundCache(ttl=10)
+
+    def query(self, url, actual_url, **params):
+        params.update({'url': url, 'cdx_url': actual_url, 'mime': 'text/html'})
+        cdx_iter, errs = self.fuzzy(self.source, params)
+        return list(cdx_iter), errs
+
+    def test_not_found_cached(self):
+        url = 'http://example.com/somefile.php?a=b'
+        actual_url = 'http://example.com/'
+
+        assert self.query(url, actual_url, closest='2014') == ([], {})
+        assert self.counting.loads == ['exact', 'prefix']
+
+        # no exact or fuzzy query, for any closest
+        assert self.query(url, actual_url, closest='2015') == ([], {})
+        assert self.query(url, actual_url) == ([], {})
+        assert self.counting.loads == ['exact', 'prefix']
+
+        # other match params not cached
+        assert self.query(url, actual_url, filter='status:200') == ([], {})
+        assert len(self.counting.loads) == 4
+
+        assert self.fuzzy.not_found_cache.stats()['hits'] == 2
+
+    def test_found_not_cached(self):
+        url = 'http://example.com/?_=123'
+        actual_url = 'http://example.com/'
+
+        for i in range(2):
+            res, errs = self.query(url, actual_url)
+            assert len(res) == 1
+
+        assert self.counting.loads == ['exact', 'prefix', 'exact', 'prefix']
+        assert self.fuzzy.not_found_cache.stats()['count'] == 0
+
+    def test_not_found_no_fuzzy_rule(self):
+        url = 'http://example.com/'
+        self.query(url, 'http://example.com/foo')
+        loads = list(self.counting.loads)
+
+        self.query(url, 'http://example.com/foo')
+        assert self.counting.loads == loads
+
+    def test_not_found_invalidated(self):
+        url = 'http://example.com/somefile.php?a=b'
+
+        self.query(url, 'http://example.com/')
+
+        # index changed
+        self.counting.version = 2
+        self.query(url, 'http://example.com/')
+        assert len(self.counting.loads) == 4
+
+        self.query(url, 'http://example.com/')
+        assert len(self.counting.loads) == 4
+
+        # expired
+        now = time.time()
+        with patch('time.time', lambda: now + 11):
+            self.query(url, 'http://example.com/')
+
+        assert len(self.counting.loads) == 6
+
+    def test_errors_not_cached(self):
+        self.counting.error = True
+
+        for i in range(2):
+            res, errs = self.query('http://example.com/', 'http://example.com/')
+            assert res == []
+            assert errs == {'source': "NotFoundException('error')"}
+
+        assert self.counting.loads.count('exact') == 2
+        assert self.fuzzy.not_found_cache.stats()['count'] == 0
+
+    def test_index_version_once(self):
+        self.source.result_cache = ResultCache()
+        self.query('http://example.com/somefile.php?a=b', 'http://example.com/')
+
+        # exact and fuzzy query, and result and not found cache, share version
+        assert self.counting.loads == ['exact', 'prefix']
+        assert self.counting.version_checks == 1
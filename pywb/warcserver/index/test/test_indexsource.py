@@ -1,30 +1,48 @@
 from pywb.warcserver.index.indexsource import FileIndexSource, RemoteIndexSource, MementoIndexSource, RedisIndexSource
 from pywb.warcserver.index.indexsource import LiveIndexSource, WBMementoIndexSource
+from pywb.warcserver.index.binaryindex import BinaryIndexSource, write_binary_cdx
+from pywb.warcserver.index.sqliteindex import SqliteIndexSource, SqliteIndexWriter
 
 from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.query import CDXQuery
 
 from warcio.timeutils import timestamp_now
 
 from pywb.warcserver.test.testutils import key_ts_res, TEST_CDX_PATH, FakeRedisTests, BaseTestClass
+from pywb.warcserver.test.testutils import TempDirTests
+
+from mock import patch
 
 import pytest
+import sqlite3
 import os
 
 
-local_sources = ['file', 'redis']
+local_sources = ['file', 'file_mmap', 'file_binary', 'sqlite', 'redis']
 remote_sources = ['remote_cdx', 'memento']
 all_sources = local_sources + remote_sources
 
 
 # ============================================================================
-class TestIndexSources(FakeRedisTests, BaseTestClass):
+class TestIndexSources(TempDirTests, FakeRedisTests, BaseTestClass):
     @classmethod
     def setup_class(cls):
         super(TestIndexSources, cls).setup_class()
         cls.add_cdx_to_redis(TEST_CDX_PATH + 'iana.cdxj', 'test:rediscdx')
 
+        binary_cdx = os.path.join(cls.root_dir, 'iana.cdxb')
+        write_binary_cdx(TEST_CDX_PATH + 'iana.cdxj', binary_cdx)
+
+        sqlite_cdx = os.path.join(cls.root_dir, 'iana.sqlite')
+        with SqliteIndexWriter(sqlite_cdx) as writer:
+            with open(TEST_CDX_PATH + 'iana.cdxj', 'rb') as fh:
+                writer.add_lines(fh)
+
         cls.all_sources = {
             'file': FileIndexSource(TEST_CDX_PATH + 'iana.cdxj'),
+            'file_mmap': FileIndexSource(TEST_CDX_PATH + 'iana.cdxj', use_mmap=True),
+            'file_binary': BinaryIndexSource(binary_cdx),
+            'sqlite': SqliteIndexSource(sqlite_cdx),
             'redis': RedisIndexSource('redis://localhost:6379/2/test:rediscdx'),
             'remote_cdx': RemoteIndexSource('http://webenact.rhizome.org/all-cdx?url={url}',
                               'http://webenact.rhizome.org/all/{timestamp}id_/{url}'),
@@ -81,6 +99,79 @@ org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz"""
         assert(errs == {})
 
 
+    def test_local_closest_loader_before_after(self, local_source):
+        url = 'http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf'
+        res, errs = self.query_single_source(local_source, dict(url=url,
+                      closest='20140126201000',
+                      limit=4))
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200930 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200912 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201055 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+        assert(errs == {})
+
+    def test_local_closest_loader_filter(self, local_source):
+        url = 'http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf'
+        res, errs = self.query_single_source(local_source, dict(url=url,
+                      closest='20140126201249',
+                      filter='!mime:warc/revisit',
+                      limit=1))
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+        assert(errs == {})
+
+    def test_local_reverse_loader(self, local_source):
+        url = 'http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf'
+        res, errs = self.query_single_source(local_source, dict(url=url,
+                      reverse='true',
+                      limit=2))
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201249 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201055 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+        assert(errs == {})
+
+    def test_local_from_to_key_range(self, local_source):
+        url = 'http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf'
+        query = CDXQuery(dict(url=url, from_ts='201401262009', to='20140126201055'))
+
+        # source only reads captures in range, before any clamping
+        res = local_source.load_index(query.params)
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200912 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200930 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201055 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+
+    def test_local_collapse_urlkey(self, local_source):
+        url = 'http://www.iana.org/_css/*'
+        query = CDXQuery(dict(url=url, collapse='urlkey'))
+        query.params['_collapse_seek'] = query.collapse_seek
+
+        # source only reads first capture of each urlkey
+        res = local_source.load_index(query.params)
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200625 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-regular.ttf 20140126200626 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-semibold.ttf 20140126200654 iana.warc.gz
+org,iana)/_css/2013.1/print.css 20140126200625 iana.warc.gz
+org,iana)/_css/2013.1/screen.css 20140126200625 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+
     # Prefix -- Local Loaders
     def test_file_prefix_loader(self, local_source):
         res, errs = self.query_single_source(local_source, dict(url='http://iana.org/domains/root/*'))
@@ -93,6 +184,33 @@ org,iana)/domains/root/servers 20140126201227 iana.warc.gz"""
         assert(key_ts_res(res) == expected)
         assert(errs == {})
 
+    def test_local_resume_key(self, local_source):
+        params = dict(url='http://iana.org/_css/*', limit=4, showResumeKey='true')
+        res, errs = self.query_single_source(local_source, params)
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200912 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200930 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201055 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+        assert(errs == {})
+
+        params = dict(url='http://iana.org/_css/*', limit=2,
+                      resumeKey=params['_resume_key'])
+        res, errs = self.query_single_source(local_source, params)
+
+        expected = """\
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201249 iana.warc.gz
+org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200625 iana.warc.gz"""
+
+        assert(key_ts_res(res) == expected)
+        assert(errs == {})
+
+        # source seeks to the resume key
+        assert params['key'] == b'org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126201055'
+
     # Url Match -- Remote Loaders
     def test_remote_loader(self, remote_source):
         url = 'http://instagram.com/amaliaulman'
@@ -107,7 +225,6 @@ com,instagram)/amaliaulman 20141014171636 http://webenact.rhizome.org/all/201410
         assert(key_ts_res(res, 'load_url') == expected)
         assert(errs == {})
 
-
     # Url Match -- Remote Loaders Closest
     def test_remote_closest_loader(self, remote_source):
         url = 'http://instagram.com/amaliaulman'
@@ -166,6 +283,36 @@ com,instagram)/amaliaulman 20141014162333 http://webenact.rhizome.org/all/201410
         assert(key_ts_res(res) == expected)
         assert(errs['source'] == "NotFoundException('http://webenact.rhizome.org/all/timemap/link/http://x-not-found-x.notfound/',)")
 
+    @pytest.mark.parametrize('params', [dict(url='http://iana.org/_css/*'),
+                                        dict(url='http://www.iana.org/', closest='20140126200930', limit=2)])
+    def test_sqlite_conn_closed(self, params):
+        source = self.all_sources['sqlite']
+        conns = []
+
+        def connect(filename):
+            conns.append(sqlite3.connect(filename))
+            return conns[-1]
+
+        with patch.object(SqliteIndexSource, '_connect', staticmethod(connect)):
+            res, errs = self.query_single_source(source, params)
+            res = list(res)
+
+        assert len(res) > 0
+        assert errs == {}
+        assert len(conns) == (2 if 'closest' in params else 1)
+
+        for conn in conns:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute('SELECT 1')
+
+    def test_sqlite_not_found(self):
+        source = SqliteIndexSource(os.path.join(self.root_dir, 'not-found.sqlite'))
+        res, errs = self.query_single_source(source, dict(url='http://iana.org/'))
+
+        assert list(res) == []
+        assert 'NotFoundException' in errs['source']
+        assert not os.path.isfile(os.path.join(self.root_dir, 'not-found.sqlite'))
+
     def test_file_not_found(self):
         source = FileIndexSource('testdata/not-found-x')
         url = 'http://x-not-found-x.notfound/'
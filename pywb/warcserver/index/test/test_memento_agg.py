@@ -156,8 +156,9 @@ class TestMemAgg(MementoOverrideTests, BaseTestClass):
         BaseAggregator.load_child_source = orig_source
 
         assert(to_json_list(res) == [])
-        assert(errs == {'local': 'timeout',
-                        'ait': 'timeout', 'bl': 'timeout', 'ia': 'timeout', 'rhiz': 'timeout'})
+
+        # 'local' not loaded, as iana.cdxj has no captures in the key range
+        assert(errs == {'ait': 'timeout', 'bl': 'timeout', 'ia': 'timeout', 'rhiz': 'timeout'})
 
 
     def _test_handler_output_cdxj(self):
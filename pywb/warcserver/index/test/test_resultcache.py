@@ -0,0 +1,226 @@
+from pywb.warcserver.index.resultcache import ResultCache
+from pywb.warcserver.index.aggregator import SimpleAggregator, DirectoryIndexSource
+from pywb.warcserver.index.indexsource import FileIndexSource, BaseIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.utils.wbexception import NotFoundException
+
+from pywb.warcserver.test.testutils import TEST_CDX_PATH, TempDirTests, BaseTestClass
+
+from mock import patch
+
+import os
+import shutil
+import time
+
+
+# ============================================================================
+class CountingSource(BaseIndexSource):
+    """ Source with no index version, counting loads
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.loads = 0
+
+    def load_index(self, params):
+        self.loads += 1
+        if not self.lines:
+            raise NotFoundException('no lines')
+
+        return (CDXObject(line) for line in self.lines)
+
+
+# ============================================================================
+class TestResultCache(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestResultCache, cls).setup_class()
+        cls.cdxj = os.path.join(cls.root_dir, 'iana.cdxj')
+        shutil.copy(TEST_CDX_PATH + 'iana.cdxj', cls.cdxj)
+
+    def query(self, agg, **params):
+        res, errs = agg(dict(params))
+        return [cdx['timestamp'] for cdx in res], errs
+
+    def test_cache_hit(self):
+        cache = ResultCache()
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=cache)
+
+        url = 'http://www.iana.org/_css/2013.1/screen.css'
+
+        res, errs = self.query(agg, url=url)
+        assert len(res) == 16
+        assert errs == {}
+
+        with patch.object(FileIndexSource, 'load_index') as load_index:
+            assert self.query(agg, url=url) == (res, {})
+            assert self.query(agg, url=url, output='json') == (res, {})
+            assert not load_index.called
+
+        # different query
+        assert self.query(agg, url=url, limit=1) == (res[:1], {})
+
+        stats = cache.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 2
+        assert stats['hit_ratio'] == 0.5
+        assert stats['count'] == 2
+
+        assert agg.get_stats({})['result_cache'] == stats
+
+    def test_cached_copies(self):
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=ResultCache())
+
+        res, errs = agg(dict(url='http://www.iana.org/', limit=1))
+        cdx = next(res)
+        cdx['recorder_skip'] = '1'
+        assert list(res) == []
+
+        for i in range(2):
+            res, errs = agg(dict(url='http://www.iana.org/', limit=1))
+            cdx = next(res)
+            assert 'recorder_skip' not in cdx
+            assert cdx['source'] == 'file'
+            cdx['recorder_skip'] = '1'
+
+    def test_partial_read(self):
+        cache = ResultCache()
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=cache)
+
+        url = 'http://www.iana.org/_css/2013.1/screen.css'
+
+        # only first capture read, and cached
+        res, errs = agg(dict(url=url))
+        first = next(res)['timestamp']
+
+        res, errs = self.query(agg, url=url)
+        assert res[0] == first
+        assert len(res) == 16
+
+        assert cache.stats()['reloads'] == 1
+
+        # now all cached
+        assert self.query(agg, url=url) == (res, {})
+        assert cache.stats()['reloads'] == 1
+
+    def test_invalidate_on_change(self):
+        filename = os.path.join(self.root_dir, 'change.cdxj')
+        shutil.copy(TEST_CDX_PATH + 'example2.cdxj', filename)
+
+        cache = ResultCache()
+        agg = SimpleAggregator({'dir': DirectoryIndexSource(self.root_dir)}, result_cache=cache)
+
+        assert self.query(agg, url='http://example.com/') == (['20160225042329'], {})
+
+        with open(filename, 'ab') as fh:
+            fh.write(b'com,example)/ 20170101000000 {"url": "http://example.com/"}\n')
+
+        assert self.query(agg, url='http://example.com/') == (['20160225042329', '20170101000000'], {})
+        assert cache.stats()['invalidations'] == 1
+
+        # new file in directory
+        shutil.copy(TEST_CDX_PATH + 'example2.cdxj', os.path.join(self.root_dir, 'new.cdxj'))
+        res, errs = self.query(agg, url='http://example.com/')
+        assert len(res) == 3
+
+        assert cache.stats()['invalidations'] == 2
+        assert cache.stats()['hits'] == 0
+
+        os.remove(filename)
+        os.remove(os.path.join(self.root_dir, 'new.cdxj'))
+
+    def test_ttl_no_version(self):
+        source = CountingSource([b'com,example)/ 20140101000000 {"url": "http://example.com/"}'])
+        agg = SimpleAggregator({'count': source}, result_cache=ResultCache(ttl=10))
+
+        now = time.time()
+        with patch('time.time', lambda: now):
+            self.query(agg, url='http://example.com/')
+            self.query(agg, url='http://example.com/')
+
+        assert source.loads == 1
+
+        with patch('time.time', lambda: now + 11):
+            assert self.query(agg, url='http://example.com/') == (['20140101000000'], {})
+
+        assert source.loads == 2
+
+    def test_errors_not_cached(self):
+        source = CountingSource([])
+        agg = SimpleAggregator({'count': source}, result_cache=ResultCache())
+
+        for i in range(2):
+            res, errs = self.query(agg, url='http://example.com/')
+            assert res == []
+            assert errs == {'count': "NotFoundException('no lines')"}
+
+        assert source.loads == 2
+
+    def test_closest_bucket(self):
+        cache = ResultCache(closest_bucket=3600)
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=cache)
+        no_cache = SimpleAggregator({'file': FileIndexSource(self.cdxj)})
+
+        url = 'http://www.iana.org/_css/2013.1/screen.css'
+
+        # same results as with no cache, sorted by requested closest
+        for closest in ('20140126200100', '20140126205959', '20140126203000'):
+            res = self.query(agg, url=url, closest=closest)
+            assert res == self.query(no_cache, url=url, closest=closest)
+
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 1
+
+        # params not changed
+        params = dict(url=url, closest='20140126205959')
+        agg(params)
+        assert params['closest'] == '20140126205959'
+
+        # rounded to middle of the hour
+        assert cache.round_closest('20140126205959') == '20140126203000'
+        assert cache.round_closest(None) is None
+
+        # not all captures cached, not shared
+        self.query(agg, url=url, closest='20140126200100', limit=1)
+        res = self.query(agg, url=url, closest='20140126205959', limit=1)
+        assert res == self.query(no_cache, url=url, closest='20140126205959', limit=1)
+        assert cache.stats()['misses'] == 3
+
+        self.query(agg, url=url, closest='20140126210000')
+        assert cache.stats()['misses'] == 4
+
+    def test_index_version_once(self):
+        cache = ResultCache()
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=cache)
+
+        params = dict(url='http://www.iana.org/')
+        with patch.object(FileIndexSource, 'get_index_version',
+                          return_value=(1, 2)) as get_index_version:
+            agg(params)
+            agg(params)
+
+        assert get_index_version.call_count == 1
+        assert params['_index_versions'] == {agg: (('file', (1, 2)),)}
+
+    def test_not_cached_resume_key(self):
+        cache = ResultCache()
+        agg = SimpleAggregator({'file': FileIndexSource(self.cdxj)}, result_cache=cache)
+
+        for i in range(2):
+            params = dict(url='http://www.iana.org/_css/*', limit=2, showResumeKey='true')
+            res, errs = agg(params)
+            assert len(list(res)) == 2
+            assert params['_resume_key']
+
+        assert cache.stats()['misses'] == 0
+
+    def test_init_from_config(self):
+        assert ResultCache.init_from_config(None) is None
+        assert ResultCache.init_from_config(False) is None
+
+        cache = ResultCache.init_from_config(True)
+        assert cache.stats()['max_size'] == ResultCache.DEFAULT_MAX_SIZE
+
+        cache = ResultCache.init_from_config({'size': 10, 'ttl': 5, 'closest_bucket': 60})
+        assert cache.stats()['max_size'] == 10
+        assert cache.ttl == 5
+        assert cache.closest_bucket == 60
@@ -0,0 +1,154 @@
+from pywb.warcserver.index.sourcemeta import SourceMeta, SourceMetaCache, get_query_host
+from pywb.warcserver.index.sourcemeta import load_text_meta, get_file_key
+from pywb.warcserver.index.aggregator import DirectoryIndexSource, SimpleAggregator
+from pywb.warcserver.index.indexsource import FileIndexSource
+from pywb.warcserver.index.binaryindex import write_binary_cdx
+
+from pywb.warcserver.test.testutils import TEST_CDX_PATH, TempDirTests, BaseTestClass
+
+from mock import patch
+
+import os
+import shutil
+import pytest
+
+
+# ============================================================================
+class TestSourceMeta(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestSourceMeta, cls).setup_class()
+        for name in ('iana.cdxj', 'example2.cdxj'):
+            shutil.copy(TEST_CDX_PATH + name, cls.root_dir)
+
+        # index with captures from com,example to org,iana
+        with open(os.path.join(cls.root_dir, 'both.cdxj'), 'wb') as out:
+            for name in ('example2.cdxj', 'iana.cdxj'):
+                with open(TEST_CDX_PATH + name, 'rb') as fh:
+                    out.write(fh.read())
+
+        write_binary_cdx(TEST_CDX_PATH + 'iana.cdxj',
+                         os.path.join(cls.root_dir, 'iana-bin.cdxb'))
+
+    def get_loaded(self, params, bloom=False):
+        loaded = []
+        orig_load_index = FileIndexSource.load_index
+
+        def load_index(source, params):
+            loaded.append(os.path.basename(source.filename_template))
+            return orig_load_index(source, params)
+
+        source = DirectoryIndexSource(self.root_dir, bloom=bloom)
+        with patch.object(FileIndexSource, 'load_index', load_index):
+            res, errs = SimpleAggregator({'dir': source})(params)
+            res = list(res)
+
+        assert errs == {}
+        return sorted(loaded), res
+
+    @pytest.mark.parametrize('key, end_key, host', [
+        (b'com,example)/', b'com,example)/!', b'com,example'),
+        (b'com,example)/path', b'com,example)/path~', b'com,example'),
+        (b'com,example)/', b'com,example*', b'com,example'),
+        (b'com,example)/', b'com,example-', b'com,example'),
+        (b'com,', b'com-', None),
+        (b'com,example', b'com,example~', None),
+        (b'a', b'~', None),
+    ])
+    def test_query_host(self, key, end_key, host):
+        assert get_query_host(key, end_key) == host
+
+    def load_meta(self, filename, bloom=False):
+        return load_text_meta(filename, get_file_key(filename), bloom)
+
+    def test_key_range(self):
+        meta = self.load_meta(TEST_CDX_PATH + 'iana.cdxj')
+
+        assert meta.first_line.startswith(b'org,iana)/ ')
+        assert meta.last_line.startswith(b'org,iana)/time-zones ')
+        assert meta.bloom is None
+
+        assert meta.may_contain(b'org,iana)/', b'org,iana)/!')
+        assert meta.may_contain(b'org,iana)/', b'org,iana-')
+        assert not meta.may_contain(b'com,example)/', b'com,example)/!')
+        assert not meta.may_contain(b'org,iana)/u', b'org,iana)/v')
+
+    def test_bloom(self):
+        meta = self.load_meta(TEST_CDX_PATH + 'iana.cdxj', bloom=True)
+
+        assert b'org' in meta.bloom
+        assert b'org,iana' in meta.bloom
+
+        # in key range, but no captures for host
+        assert meta.may_contain(b'org,iana)/', b'org,iana)/!')
+        assert not meta.may_contain(b'org,iana,www)/', b'org,iana,www)/!')
+
+    def test_not_surt_no_bloom(self):
+        assert SourceMeta.build_bloom([b'org,iana)/ 2014', b'http://example.com/ 2014']) is None
+
+    def test_cache_reload(self):
+        filename = os.path.join(self.root_dir, 'cache-test.cdxj')
+        with open(filename, 'wb') as fh:
+            fh.write(b'com,example)/ 20140101000000 {}\n')
+
+        cache = SourceMetaCache()
+        meta = cache.get(filename, load_text_meta)
+        assert cache.get(filename, load_text_meta) is meta
+        assert not meta.may_contain(b'org,iana)/', b'org,iana)/!')
+
+        with open(filename, 'ab') as fh:
+            fh.write(b'org,iana)/ 20140101000000 {}\n')
+
+        meta = cache.get(filename, load_text_meta)
+        assert meta.may_contain(b'org,iana)/', b'org,iana)/!')
+
+        os.remove(filename)
+
+        # removed file, entry dropped
+        with pytest.raises(OSError):
+            cache.get(filename, load_text_meta)
+
+        assert len(cache.metas) == 0
+
+    def test_cache_bounded(self):
+        filenames = []
+        for i in range(3):
+            filename = os.path.join(self.root_dir, 'bounded-{0}.cdxj'.format(i))
+            with open(filename, 'wb') as fh:
+                fh.write(b'com,example)/ 20140101000000 {}\n')
+
+            filenames.append(filename)
+
+        cache = SourceMetaCache(max_size=2)
+        for filename in filenames:
+            cache.get(filename, load_text_meta)
+
+        assert len(cache.metas) == 2
+        assert (filenames[0], False) not in cache.metas
+
+        for filename in filenames:
+            os.remove(filename)
+
+    def test_dir_skip_sources(self):
+        loaded, res = self.get_loaded({'url': 'example.com/'})
+
+        assert loaded == ['both.cdxj', 'example2.cdxj']
+        assert len(res) == 2
+
+    def test_dir_skip_sources_bloom(self):
+        # example.net in key range of both.cdxj, but not in any index
+        loaded, res = self.get_loaded({'url': 'http://example.net/'})
+        assert loaded == ['both.cdxj']
+        assert res == []
+
+        loaded, res = self.get_loaded({'url': 'http://example.net/'}, bloom=True)
+        assert loaded == []
+        assert res == []
+
+    def test_dir_binary_source_bloom(self):
+        source = DirectoryIndexSource(self.root_dir, bloom=True)
+        res, errs = SimpleAggregator({'dir': source})({'url': 'http://iana.org/', 'limit': 1})
+        res = list(res)
+
+        assert errs == {}
+        assert res[0]['timestamp'] == '20140126200624'
@@ -4,6 +4,8 @@ from pywb.warcserver.index.indexsource import FileIndexSource
 
 from pywb.warcserver.index.aggregator import SimpleAggregator, TimeoutMixin
 from pywb.warcserver.index.aggregator import GeventTimeoutAggregator, GeventTimeoutAggregator
+from pywb.warcserver.index.sourcestats import SourceStats
+from pywb.warcserver.index.resultcache import ResultCache
 
 from pywb.warcserver.test.testutils import to_json_list, TEST_CDX_PATH
 
@@ -109,3 +111,251 @@ class TestTimeouts(object):
 
         assert(errs == {'slower': 'timeout'})
 
+
+    def test_adaptive_deadline(self):
+        sources = {'fast': TimeoutFileSource(TEST_CDX_PATH + 'example2.cdxj', 0.05),
+                   'slow': TimeoutFileSource(TEST_CDX_PATH + 'dupes.cdxj', 0.2)
+                  }
+
+        agg = GeventTimeoutAggregator(sources, timeout=2.0,
+                                      adaptive_timeout={'min_samples': 2,
+                                                        'multiplier': 1.5,
+                                                        'min_timeout': 0.1})
+
+        for i in range(2):
+            res, errs = agg(dict(url='http://example.com/'))
+            assert(len(list(res)) == 3)
+            assert(errs == {})
+
+        assert(agg.get_source_deadline('fast') == 0.1)
+        assert(0.3 <= agg.get_source_deadline('slow') < 0.4)
+
+        # slow source now much slower, only waited for up to its deadline
+        sources['slow'].timeout = 1.0
+
+        start = time.time()
+        res, errs = agg(dict(url='http://example.com/'))
+        assert(time.time() - start < 0.8)
+
+        exp = [{'source': 'fast', 'timestamp': '20160225042329'}]
+        assert(to_json_list(res, fields=['source', 'timestamp']) == exp)
+        assert(errs == {'slow': 'timeout'})
+
+        stats = agg.get_stats({})['sources']
+        assert(stats['fast']['requests'] == 3)
+        assert(stats['fast']['timeouts'] == 0)
+        assert(stats['slow']['timeouts'] == 1)
+        assert(stats['slow']['state'] == 'closed')
+
+    def test_no_adaptive_deadline(self):
+        agg = GeventTimeoutAggregator(self.sources, timeout=1.0)
+        agg.get_source_stats('slow').add_latency(0.01)
+
+        assert(agg.get_source_deadline('slow') == 1.0)
+
+    def query_early_exit(self, early_exit, **params):
+        sources = {'local': TimeoutFileSource(TEST_CDX_PATH + 'example2.cdxj', 0.0),
+                   'remote': TimeoutFileSource(TEST_CDX_PATH + 'dupes.cdxj', 0.5)
+                  }
+
+        agg = GeventTimeoutAggregator(sources, timeout=2.0, early_exit=early_exit)
+
+        start = time.time()
+        res, errs = agg(dict(url='http://example.com/', **params))
+        res = to_json_list(res, fields=['source', 'timestamp'])
+        return res, errs, time.time() - start, agg
+
+    def test_early_exit_exact(self):
+        res, errs, elapsed, agg = self.query_early_exit(True, closest='20160225042329')
+
+        assert(elapsed < 0.4)
+        assert(res == [{'source': 'local', 'timestamp': '20160225042329'}])
+        assert(errs == {'remote': 'skipped'})
+
+        # skipped source not counted as timed out
+        assert(agg.get_stats({})['sources']['remote']['timeouts'] == 0)
+
+        # latency recorded once done in the background
+        time.sleep(0.6)
+        stats = agg.get_stats({})['sources']['remote']
+        assert(stats['samples'] == 1)
+        assert(stats['p50'] >= 0.5)
+
+    def test_early_exit_half_open_probe(self):
+        sources = {'local': TimeoutFileSource(TEST_CDX_PATH + 'example2.cdxj', 0.0),
+                   'remote': TimeoutFileSource(TEST_CDX_PATH + 'dupes.cdxj', 0.3)
+                  }
+
+        agg = GeventTimeoutAggregator(sources, timeout=1.0, early_exit=True,
+                                      t_count=1, t_duration=0.1)
+
+        agg.get_source_stats('remote').on_timeout(time.time())
+        time.sleep(0.2)
+
+        # probe skipped by early exit
+        res, errs = agg(dict(url='http://example.com/', closest='20160225042329'))
+        assert(errs == {'remote': 'skipped'})
+        assert(agg.get_stats({})['sources']['remote']['state'] == 'half_open')
+
+        # probe outcome recorded once done
+        time.sleep(0.4)
+        assert(agg.get_stats({})['sources']['remote']['state'] == 'closed')
+
+        res, errs = agg(dict(url='http://example.com/', closest='20140127171200'))
+        assert(len(list(res)) == 3)
+        assert(errs == {})
+
+    def test_early_exit_probe_too_slow(self):
+        sources = {'local': TimeoutFileSource(TEST_CDX_PATH + 'example2.cdxj', 0.0),
+                   'remote': TimeoutFileSource(TEST_CDX_PATH + 'dupes.cdxj', 0.4)
+                  }
+
+        agg = GeventTimeoutAggregator(sources, timeout=0.2, early_exit=True,
+                                      t_count=1, t_duration=0.1)
+
+        agg.get_source_stats('remote').on_timeout(time.time())
+        time.sleep(0.2)
+
+        res, errs = agg(dict(url='http://example.com/', closest='20160225042329'))
+        assert(errs == {'remote': 'skipped'})
+
+        # done after its deadline, counted as a timeout
+        time.sleep(0.5)
+        stats = agg.get_stats({})['sources']['remote']
+        assert(stats['state'] == 'open')
+        assert(stats['timeouts'] == 2)
+
+    def test_early_exit_not_close_enough(self):
+        res, errs, elapsed, agg = self.query_early_exit(True, closest='20140127171200')
+
+        assert(elapsed >= 0.5)
+        assert(res == [{'source': 'remote', 'timestamp': '20140127171200'},
+                       {'source': 'remote', 'timestamp': '20140127171251'},
+                       {'source': 'local', 'timestamp': '20160225042329'}])
+        assert(errs == {})
+
+    def test_early_exit_max_distance(self):
+        res, errs, elapsed, agg = self.query_early_exit({'max_distance': 86400 * 365 * 3},
+                                                        closest='20140127171200')
+
+        assert(elapsed < 0.4)
+        assert(res == [{'source': 'local', 'timestamp': '20160225042329'}])
+        assert(errs == {'remote': 'skipped'})
+
+    def test_no_early_exit(self):
+        # not a resource lookup
+        res, errs, elapsed, agg = self.query_early_exit(True, closest='20160225042329',
+                                                        mode='index')
+        assert(elapsed >= 0.5)
+        assert(len(res) == 3)
+
+        # no closest
+        res, errs, elapsed, agg = self.query_early_exit(True)
+        assert(elapsed >= 0.5)
+        assert(len(res) == 3)
+
+        # not enabled
+        res, errs, elapsed, agg = self.query_early_exit(None, closest='20160225042329')
+        assert(elapsed >= 0.5)
+        assert(len(res) == 3)
+
+    def test_half_open_probe_not_claimed_by_version_check(self):
+        sources = {'slow': TimeoutFileSource(TEST_CDX_PATH + 'example2.cdxj', 0.3)}
+
+        cache = ResultCache()
+        agg = GeventTimeoutAggregator(sources, timeout=0.1, t_count=1, t_duration=0.2,
+                                      result_cache=cache)
+
+        res, errs = agg(dict(url='http://example.com/'))
+        assert(errs == {'slow': 'timeout'})
+        assert(agg.get_stats({})['sources']['slow']['state'] == 'open')
+
+        time.sleep(0.3)
+        sources['slow'].timeout = 0.0
+
+        # version and source list checks do not use up the probe
+        assert(agg.get_index_version({}) is not None)
+        assert(list(agg.get_source_list({})['sources']) == ['slow'])
+
+        res, errs = agg(dict(url='http://example.com/'))
+        assert(len(list(res)) == 1)
+        assert(errs == {})
+
+        stats = agg.get_stats({})['sources']['slow']
+        assert(stats['state'] == 'closed')
+        assert(stats['requests'] == 2)
+
+
+# ============================================================================
+def test_source_stats_breaker():
+    stats = SourceStats(t_count=2, t_duration=10)
+
+    assert(stats.start_request(0))
+    stats.on_timeout(0)
+    assert(stats.state == 'closed')
+
+    # older timeouts not counted
+    stats.on_timeout(11)
+    assert(stats.state == 'closed')
+
+    stats.on_timeout(12)
+    assert(stats.state == 'open')
+    assert(not stats.start_request(20))
+
+    # single probe when half open
+    assert(stats.start_request(22))
+    assert(stats.state == 'half_open')
+    assert(not stats.start_request(22))
+
+    # probe released when done
+    stats.end_request(0.5)
+    assert(stats.state == 'half_open')
+    assert(stats.is_available(22))
+
+    # probe failed
+    stats.on_timeout(23)
+    assert(stats.state == 'open')
+    assert(not stats.start_request(30))
+
+    # probe succeeded
+    assert(stats.start_request(33))
+    stats.on_success()
+    assert(stats.state == 'closed')
+    assert(stats.start_request(33))
+    assert(stats.start_request(33))
+
+    assert(stats.stats()['requests'] == 5)
+    assert(stats.stats()['skipped'] == 3)
+    assert(stats.stats()['timeouts'] == 4)
+
+
+def test_source_stats_is_available():
+    stats = SourceStats(t_count=1, t_duration=10)
+    stats.on_timeout(0)
+
+    assert(not stats.is_available(5))
+    assert(stats.is_available(11))
+
+    # checking does not claim the probe
+    assert(stats.is_available(11))
+    assert(stats.state == 'open')
+    assert(stats.start_request(11))
+    assert(not stats.is_available(11))
+
+
+def test_source_stats_latency():
+    stats = SourceStats(alpha=0.5)
+    assert(stats.percentile(95) is None)
+    assert(stats.get_deadline(5.0, min_samples=1, multiplier=2.0, min_timeout=0.5) == 5.0)
+
+    for secs in range(1, 101):
+        stats.add_latency(secs / 100.0)
+
+    assert(stats.percentile(50) == 0.51)
+    assert(stats.percentile(95) == 0.95)
+    assert(stats.percentile(99) == 0.99)
+    assert(0.98 < stats.ewma < 1.0)
+
+    assert(stats.get_deadline(5.0, min_samples=100, multiplier=2.0, min_timeout=0.5) == 1.9)
+    assert(stats.get_deadline(1.0, min_samples=100, multiplier=2.0, min_timeout=0.5) == 1.0)
+    assert(stats.get_deadline(5.0, min_samples=101, multiplier=2.0, min_timeout=0.5) == 5.0)
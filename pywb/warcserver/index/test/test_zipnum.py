@@ -125,11 +125,16 @@ Exception: No Locations Found for: foo2
 from pywb import get_test_dir
 from pywb.warcserver.index.test.test_cdxops import cdx_ops_test, cdx_ops_test_data
 from pywb.warcserver.warcserver import init_index_agg
+from pywb.warcserver.index.zipnum import ZipNumIndexSource
+from pywb.warcserver.index.aggregator import SimpleAggregator
+from pywb.warcserver.index.query import CDXQuery
+from pywb.utils.loaders import BlockLoader, LocalFileLoader
 
 import shutil
 import tempfile
 import os
 import json
+import datetime
 
 import pytest
 
@@ -193,6 +198,363 @@ def test_zip_prefix_load():
 
 
 
+def test_zip_block_cache():
+    def query(source, url, **params):
+        params['url'] = url
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    no_cache_source = ZipNumIndexSource(test_zipnum)
+    exp = query(no_cache_source, 'iana.org/domains/*')
+    assert len(exp) == 9
+
+    source = ZipNumIndexSource(test_zipnum, {'block_cache_size': 100000})
+    assert query(source, 'iana.org/domains/*') == exp
+
+    stats = source.block_cache.stats()
+    num_blocks = stats['misses']
+    assert num_blocks > 0
+    assert stats['hits'] == 0
+    assert stats['count'] == num_blocks
+
+    # all blocks cached
+    assert query(source, 'iana.org/domains/*') == exp
+    stats = source.block_cache.stats()
+    assert stats['hits'] == num_blocks
+    assert stats['misses'] == num_blocks
+
+    # cache bounded by size
+    exp = query(no_cache_source, 'iana.org/', matchType='domain')
+    source = ZipNumIndexSource(test_zipnum, {'block_cache_size': 1600})
+    assert query(source, 'iana.org/', matchType='domain') == exp
+
+    stats = source.block_cache.stats()
+    assert stats['evictions'] > 0
+    assert stats['size'] <= 1600
+
+
+def test_zip_concurrent_fetch():
+    def query(source, url, **params):
+        params['url'] = url
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    exp = query(ZipNumIndexSource(test_zipnum), 'iana.org/', matchType='domain')
+    assert len(exp) == 46
+
+    # one block per group, fetched concurrently, without and with coalescing
+    for max_gap in (-1, 100000):
+        source = ZipNumIndexSource(test_zipnum, {'max_blocks': 1,
+                                                 'fetch_pool_size': 4,
+                                                 'fetch_max_gap': max_gap})
+
+        assert query(source, 'iana.org/', matchType='domain', pageSize=10) == exp
+
+    # concurrent fetch populates and reuses block cache
+    source = ZipNumIndexSource(test_zipnum, {'fetch_pool_size': 4,
+                                             'block_cache_size': 100000})
+
+    assert query(source, 'iana.org/', matchType='domain') == exp
+    num_blocks = source.block_cache.stats()['count']
+    assert num_blocks > 0
+
+    assert query(source, 'iana.org/', matchType='domain') == exp
+    assert source.block_cache.stats()['hits'] == num_blocks
+
+    # only uncached blocks fetched, split at cached blocks outside the max gap
+    for max_gap, exp_fetches in ((-1, 2), (0, 2), (100000, 1)):
+        source = ZipNumIndexSource(test_zipnum, {'fetch_pool_size': 4,
+                                                 'fetch_max_gap': max_gap,
+                                                 'block_cache_size': 100000})
+
+        idx_lines = list(source.compute_page_range(source.load_summary(),
+                                                    CDXQuery({'url': 'iana.org/', 'matchType': 'domain'})))
+
+        (blocks, ranges), = source.iter_block_groups(idx_lines[:3])
+        source.block_cache.put((blocks.part, blocks.offset + ranges[0], ranges[1]), b'cached')
+
+        fetches = []
+        def read_range(location, offset, length):
+            data = ZipNumIndexSource.read_range(source, location, offset, length)
+            fetches.append((offset, length))
+            return data
+
+        source.read_range = read_range
+
+        buffs, = source.fetch_span([(blocks, ranges)], CDXQuery({'url': 'iana.org/'}))
+        assert buffs[1] == b'cached'
+        assert len(fetches) == exp_fetches
+        assert sum(length for offset, length in fetches) == (blocks.length if exp_fetches == 1
+                                                             else blocks.length - ranges[1])
+
+        # only the missing blocks, now all cached
+        assert source.fetch_span([(blocks, ranges)], CDXQuery({'url': 'iana.org/'})) == [buffs]
+        assert len(fetches) == exp_fetches
+
+
+def test_zip_closest():
+    source = ZipNumIndexSource(test_zipnum)
+
+    def query(closest):
+        params = dict(url='iana.org/', closest=closest)
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [(cdx['timestamp'], cdx['url']) for cdx in cdx_iter]
+
+    # captures at same timestamp remain in index order, before or after closest
+    assert query('20140127171239') == [('20140127171238', 'http://iana.org'),
+                                       ('20140127171238', 'http://www.iana.org/'),
+                                       ('20140126200624', 'http://www.iana.org/')]
+
+    assert query('20140127171237') == [('20140127171238', 'http://iana.org'),
+                                       ('20140127171238', 'http://www.iana.org/'),
+                                       ('20140126200624', 'http://www.iana.org/')]
+
+    assert query('2013') == [('20140126200624', 'http://www.iana.org/'),
+                             ('20140127171238', 'http://iana.org'),
+                             ('20140127171238', 'http://www.iana.org/')]
+
+
+def test_zip_from_to_key_range():
+    source = ZipNumIndexSource(test_zipnum)
+    query = CDXQuery(dict(url='iana.org/', from_ts='20140127'))
+
+    res = [(cdx['timestamp'], cdx['url']) for cdx in source.load_index(query.params)]
+    assert res == [('20140127171238', 'http://iana.org'),
+                   ('20140127171238', 'http://www.iana.org/')]
+
+    query = CDXQuery(dict(url='iana.org/', to='20140126'))
+
+    res = [(cdx['timestamp'], cdx['url']) for cdx in source.load_index(query.params)]
+    assert res == [('20140126200624', 'http://www.iana.org/')]
+
+
+def test_zip_reverse():
+    source = ZipNumIndexSource(test_zipnum, {'max_blocks': 2})
+
+    def query(**params):
+        params['url'] = 'iana.org/'
+        params['matchType'] = 'domain'
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    # same results as reversing page, read backwards block by block
+    for page in range(3):
+        exp = query(page=page)
+        assert len(exp) > 0
+        assert query(page=page, reverse='true') == exp[::-1]
+        assert query(page=page, reverse='true', limit=2) == exp[::-1][:2]
+
+
+def test_zip_collapse_urlkey():
+    source = ZipNumIndexSource(test_zipnum, {'max_blocks': 2})
+
+    def query(**params):
+        params['url'] = 'iana.org/'
+        params['matchType'] = 'domain'
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    # same results as first capture of each urlkey, skipping blocks
+    for page in range(3):
+        exp = query(page=page)
+        urlkeys = [line.split(' ', 1)[0] for line in exp]
+        exp = [line for i, line in enumerate(exp)
+               if i == 0 or urlkeys[i] != urlkeys[i - 1]]
+
+        assert len(exp) > 0
+        assert query(page=page, collapse='urlkey') == exp
+
+
+def test_zip_columnar():
+    pytest.importorskip('numpy')
+
+    source = ZipNumIndexSource(test_zipnum)
+    columnar_source = ZipNumIndexSource(test_zipnum, {'columnar': True})
+
+    def query(source, **params):
+        params['url'] = 'iana.org/'
+        params['matchType'] = 'domain'
+        cdx_iter, errs = SimpleAggregator({'zip': source})(params)
+        return [cdx.to_text() for cdx in cdx_iter]
+
+    queries = [dict(filter='=status:200'),
+               dict(filter=['!=mime:text/html', '=status:200']),
+               dict(filter='mime:text/.*', from_ts='2014'),
+               dict(from_ts='201401262', to='20140127'),
+               dict(closest='20140126201054', limit=3),
+               dict(closest='20140126201054', limit=5, filter='=status:302'),
+               dict(collapse='urlkey', filter='!=status:200'),
+               dict(collapseTime=10, filter='=mime:text/html'),
+              ]
+
+    for params in queries:
+        exp = query(source, **params)
+        assert len(exp) > 0
+        assert query(columnar_source, **params) == exp
+
+
+def test_columnar_unknown_values():
+    pytest.importorskip('numpy')
+
+    from pywb.warcserver.index.columnar import ColumnarBlockFilter
+    from pywb.warcserver.index.cdxops import process_cdx
+    from pywb.warcserver.index.cdxobject import CDXObject
+
+    # status not a string, or under an alt name, not read by the columnar
+    # filter but may or may not match in regular processing
+    lines = [b'com,example)/ 20140101000000 {"status": 404}\n',
+             b'com,example)/ 20140101000001 {"s": "200"}\n',
+             b'com,example)/ 20140102000000 {"status": "200"}\n',
+             b'com,example)/a 20140103000000 {"statuscode": 200}\n',
+             b'com,example)/a 20140104000000 {"status": "200"}\n']
+
+    def query(columnar, **params):
+        params['url'] = 'example.com/'
+        params['matchType'] = 'prefix'
+        params['filter'] = '=status:200'
+        query = CDXQuery(params)
+
+        block = lines
+        if columnar:
+            block = ColumnarBlockFilter.from_query(query)(block)
+
+        cdx_iter = process_cdx((CDXObject(line.rstrip()) for line in block), query)
+        return [cdx['timestamp'] for cdx in cdx_iter]
+
+    exp = query(False, collapse='urlkey')
+    assert exp == ['20140102000000', '20140103000000']
+    assert query(True, collapse='urlkey') == exp
+
+    for limit in (1, 2, 3):
+        exp = query(False, closest='20140101000000', limit=limit)
+        assert exp == ['20140102000000', '20140103000000', '20140104000000'][:limit]
+        assert query(True, closest='20140101000000', limit=limit) == exp
+
+
+def test_columnar_timestamps_to_sec():
+    pytest.importorskip('numpy')
+
+    from pywb.warcserver.index.columnar import timestamps_to_sec
+    from warcio.timeutils import timestamp_to_sec
+    import numpy as np
+
+    timestamps = [b'20140126200624', b'19700101000000', b'20000229235959',
+                  b'19000101000000', b'29991231235959', b'20161301000000',
+                  b'20150229000000', b'18991231235959', b'2014012620062',
+                  b'2014012620062x']
+
+    secs, valid = timestamps_to_sec(np.array(timestamps, dtype=bytes))
+
+    assert valid.tolist() == [True] * 5 + [False] * 5
+
+    for timestamp, sec, is_valid in zip(timestamps, secs.tolist(), valid.tolist()):
+        if is_valid:
+            assert sec == timestamp_to_sec(timestamp.decode('utf-8'))
+
+
+def test_zip_summary_reload():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        summary = os.path.join(tmpdir, 'zipnum-sample.idx')
+        shutil.copy(test_zipnum, tmpdir)
+        shutil.copy(get_test_dir() + 'zipcdx/zipnum-sample.cdx.gz', tmpdir)
+        with open(os.path.join(tmpdir, 'zipnum-sample.loc'), 'wt') as fh:
+            fh.write('zipnum\tzipnum-sample.cdx.gz\n')
+
+        source = ZipNumIndexSource(summary, {'reload_interval': 0})
+
+        def query():
+            cdx_iter, errs = SimpleAggregator({'zip': source})({'url': 'iana.org/numbers'})
+            return [cdx['timestamp'] for cdx in cdx_iter]
+
+        assert query() == ['20140126200651']
+
+        summary_index = source.summary_index
+        assert len(summary_index) == 38
+        assert summary_index.get_line(0) == b'com,example)/ 20140127171200\tzipnum\t0\t275\t1'
+
+        # unchanged, not reloaded
+        assert query() == ['20140126200651']
+        assert source.summary_index is summary_index
+
+        # truncate summary to first block, reloaded
+        with open(summary, 'rb') as fh:
+            first_line = fh.readline()
+
+        with open(summary, 'wb') as fh:
+            fh.write(first_line)
+
+        assert query() == []
+        assert len(source.summary_index) == 1
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class StampTestLoader(LocalFileLoader):
+    """ Loads local files from a stamptest:// url, with a set stamp
+    """
+    stamp = None
+    loads = 0
+    stamp_checks = 0
+    cookie_makers = []
+
+    def __init__(self, **kwargs):
+        StampTestLoader.cookie_makers.append(kwargs.get('cookie_maker'))
+
+    def load(self, url, offset=0, length=-1):
+        StampTestLoader.loads += 1
+        return super(StampTestLoader, self).load(url[len('stamptest://'):], offset, length)
+
+    def get_stamp(self, url):
+        StampTestLoader.stamp_checks += 1
+        return StampTestLoader.stamp
+
+
+@pytest.mark.parametrize('stamp', ['"etag"', None])
+def test_zip_summary_remote_stamp(stamp):
+    tmpdir = tempfile.mkdtemp()
+    BlockLoader.loaders['stamptest'] = StampTestLoader
+    StampTestLoader.stamp = stamp
+    StampTestLoader.loads = 0
+    StampTestLoader.stamp_checks = 0
+    StampTestLoader.cookie_makers = []
+
+    try:
+        shutil.copy(test_zipnum, tmpdir)
+        shutil.copy(get_test_dir() + 'zipcdx/zipnum-sample.cdx.gz', os.path.join(tmpdir, 'zipnum'))
+
+        summary = 'stamptest://' + os.path.join(tmpdir, 'zipnum-sample.idx')
+        source = ZipNumIndexSource(summary, {'shard_index_loc': {'match': '^.*$', 'replace': tmpdir + '/'},
+                                             'cookie_maker': 'some=value'})
+
+        def query():
+            cdx_iter, errs = SimpleAggregator({'zip': source})({'url': 'iana.org/numbers'})
+            return [cdx['timestamp'] for cdx in cdx_iter]
+
+        # stamp checked with the summary loader, and its cookie
+        assert query() == ['20140126200651']
+        assert StampTestLoader.loads == 1
+        assert StampTestLoader.stamp_checks == 1
+        assert StampTestLoader.cookie_makers == ['some=value']
+
+        # within reload interval, not checked or reloaded
+        summary_index = source.summary_index
+        assert query() == ['20140126200651']
+        assert source.summary_index is summary_index
+        assert StampTestLoader.stamp_checks == 1
+
+        # interval expired: reloaded only if no stamp
+        source.reload_interval = datetime.timedelta(0)
+        assert query() == ['20140126200651']
+        assert StampTestLoader.stamp_checks == 2
+        assert (source.summary_index is summary_index) == (stamp is not None)
+
+    finally:
+        del BlockLoader.loaders['stamptest']
+        shutil.rmtree(tmpdir)
+
+
 def test_blocks_def_page_size():
     # Pages -- default page size
     res = zip_ops_test_data(url='http://iana.org/domains/example', matchType='exact', showNumPages=True)
@@ -2,22 +2,31 @@ import os
 import collections
 import itertools
 import logging
+from array import array
 from io import BytesIO
 import datetime
 import json
 import six
 
-from six.moves import map
+from six.moves import map, range
+from six.moves.urllib.request import url2pathname
 
 from warcio.bufferedreaders import gzip_decompressor
 
+from gevent.pool import Pool
+import gevent
+
 #from pywb.warcserver.index.cdxsource import CDXSource
 from pywb.warcserver.index.indexsource import BaseIndexSource
 from pywb.warcserver.index.cdxobject import IDXObject, CDXException, CDXObject
+from pywb.warcserver.index.cdxops import cdx_iter_closest
+from pywb.warcserver.index.columnar import ColumnarBlockFilter, HAS_NUMPY
 from pywb.warcserver.index.query import CDXQuery
 
-from pywb.utils.loaders import BlockLoader, read_last_line
-from pywb.utils.binsearch import iter_range, linearsearch, search
+from pywb.utils.loaders import BlockLoader
+from pywb.utils.cache import LRUCache
+from pywb.utils.sparseindex import OFFSET_TYPE
+from pywb.utils.binsearch import linearsearch, search
 
 
 #=================================================================
@@ -29,6 +38,95 @@ class ZipBlocks:
         self.count = count
 
 
+#=================================================================
+class ZipNumSummary(object):
+    """ In-memory copy of a ZipNum summary (.idx) file, stored as
+    parallel arrays of keys, part ids, offsets, lengths and linenos.
+
+    Each key is stored with its trailing tab, so that comparing a key
+    to a query key is equivalent to comparing the full summary line.
+    """
+    def __init__(self):
+        self.key_table = bytearray()
+        self.key_ends = array(OFFSET_TYPE)
+
+        self.parts = []
+        self._part_ids = {}
+
+        self.part_ids = array('I')
+        self.offsets = array(OFFSET_TYPE)
+        self.lengths = array(OFFSET_TYPE)
+        self.linenos = array(OFFSET_TYPE)
+
+    def add_line(self, idxline):
+        idx = IDXObject(idxline)
+
+        part_id = self._part_ids.get(idx['part'])
+        if part_id is None:
+            part_id = len(self.parts)
+            self.parts.append(idx['part'])
+            self._part_ids[idx['part']] = part_id
+
+        self.key_table.extend(idx['urlkey'].encode('utf-8') + b'\t')
+        self.key_ends.append(len(self.key_table))
+
+        self.part_ids.append(part_id)
+        self.offsets.append(idx['offset'])
+        self.lengths.append(idx['length'])
+
+        # 0 if no lineno
+        self.linenos.append(idx.get('lineno') or 0)
+
+    @classmethod
+    def load(cls, reader):
+        summary = cls()
+        try:
+            for line in reader:
+                if line.strip():
+                    summary.add_line(line)
+        finally:
+            reader.close()
+
+        summary.key_table = bytes(summary.key_table)
+        summary._part_ids = None
+        return summary
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_key(self, i):
+        start = self.key_ends[i - 1] if i > 0 else 0
+        return self.key_table[start:self.key_ends[i]]
+
+    def bisect(self, key):
+        """ Return index of first summary line >= key
+        """
+        lo = 0
+        hi = len(self)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def get_line(self, i):
+        """ Return summary line i, in the summary file format
+        """
+        fields = [self.get_key(i)[:-1],
+                  self.parts[self.part_ids[i]].encode('utf-8'),
+                  str(self.offsets[i]).encode('utf-8'),
+                  str(self.lengths[i]).encode('utf-8')]
+
+        if self.linenos[i]:
+            fields.append(str(self.linenos[i]).encode('utf-8'))
+
+        return b'\t'.join(fields)
+
+
 #=================================================================
 #TODO: see if these could be combined with warc path resolvers
 
@@ -99,6 +197,12 @@ class LocPrefixResolver(object):
 class ZipNumIndexSource(BaseIndexSource):
     DEFAULT_RELOAD_INTERVAL = 10  # in minutes
     DEFAULT_MAX_BLOCKS = 10
+    DEFAULT_BLOCK_CACHE_SIZE = 0  # in bytes, disabled by default
+    DEFAULT_FETCH_POOL_SIZE = 0  # concurrent block fetches, disabled by default
+    DEFAULT_FETCH_MAX_GAP = 16384  # in bytes, -1 to disable coalescing
+
+    supports_closest_seek = True
+    supports_reverse_seek = True
 
     def __init__(self, summary, config=None):
         self.max_blocks = self.DEFAULT_MAX_BLOCKS
@@ -109,6 +213,10 @@ class ZipNumIndexSource(BaseIndexSource):
         loc = None
         cookie_maker = None
         reload_ival = self.DEFAULT_RELOAD_INTERVAL
+        block_cache_size = self.DEFAULT_BLOCK_CACHE_SIZE
+        fetch_pool_size = self.DEFAULT_FETCH_POOL_SIZE
+        self.fetch_max_gap = self.DEFAULT_FETCH_MAX_GAP
+        columnar = False
 
         if config:
             loc = config.get('shard_index_loc')
@@ -118,6 +226,29 @@ class ZipNumIndexSource(BaseIndexSource):
 
             reload_ival = config.get('reload_interval', reload_ival)
 
+            block_cache_size = config.get('block_cache_size', block_cache_size)
+
+            fetch_pool_size = config.get('fetch_pool_size', fetch_pool_size)
+            self.fetch_max_gap = config.get('fetch_max_gap', self.fetch_max_gap)
+
+            columnar = config.get('columnar', columnar)
+
+        # LRU cache of decompressed blocks, keyed by (part, offset, length)
+        if block_cache_size:
+            self.block_cache = LRUCache(int(block_cache_size), size_func=len)
+        else:
+            self.block_cache = None
+
+        # if set, block groups of a page are fetched concurrently
+        if fetch_pool_size:
+            self.fetch_pool = Pool(size=int(fetch_pool_size))
+        else:
+            self.fetch_pool = None
+
+        # if set, blocks are pre-filtered with numpy, if available
+        self.columnar = columnar
+        if columnar and not HAS_NUMPY:
+            logging.warning('numpy not available, columnar zipnum filtering disabled')
 
         if isinstance(loc, dict):
             self.loc_resolver = LocPrefixResolver(summary, loc)
@@ -132,6 +263,11 @@ class ZipNumIndexSource(BaseIndexSource):
 
         self.blk_loader = BlockLoader(cookie_maker=cookie_maker)
 
+        # in-memory summary, loaded on first query
+        self.summary_index = None
+        self.summary_stamp = None
+        self.summary_check_time = None
+
 #    @staticmethod
 #    def reload_timed(timestamp, val, delta, func):
 #        now = datetime.datetime.now()
@@ -151,12 +287,143 @@ class ZipNumIndexSource(BaseIndexSource):
 
     def load_index(self, params):
         self.loc_resolver.load_loc()
-        return self._do_load_cdx(self.summary, CDXQuery(params))
+        summary = self.load_summary()
+        query = CDXQuery(params)
+
+        if params.get('_reverse_seek'):
+            return self._load_reverse_cdx(summary, query)
+
+        if params.get('_collapse_seek'):
+            return self._load_distinct_cdx(summary, query)
+
+        closest_key = self.get_closest_key(params)
+        if not closest_key:
+            return self._do_load_cdx(summary, query)
+
+        next_query = CDXQuery(dict(params))
+        next_query.set_key(closest_key, query.end_key)
+
+        return cdx_iter_closest(params['_closest_seek'],
+                                self._load_prev_cdx(summary, query, closest_key),
+                                self._do_load_cdx(summary, next_query))
+
+    def _load_prev_cdx(self, summary, query, end_key):
+        """ Load cdx lines where query.key <= line < end_key in reverse order,
+        reading backwards one block at a time, up to max_blocks blocks
+        """
+        if not len(summary):
+            return
+
+        prev_query = CDXQuery(dict(query.params))
+        prev_query.set_key(query.key, end_key)
+
+        first = max(summary.bisect(query.key) - 1, 0)
+        last = max(summary.bisect(end_key) - 1, 0)
+        first = max(first, last - self.max_blocks + 1)
 
-    def _do_load_cdx(self, filename, query):
-        reader = open(filename, 'rb')
+        for i in range(last, first - 1, -1):
+            for cdx in self._load_block_reverse(summary.get_line(i), prev_query):
+                yield cdx
+
+    def _load_reverse_cdx(self, summary, query):
+        """ Load cdx lines for the query page in reverse order,
+        reading backwards one block at a time
+        """
+        idx_lines = list(self.compute_page_range(summary, query))
+
+        for idx_line in reversed(idx_lines):
+            for cdx in self._load_block_reverse(idx_line, query):
+                yield cdx
+
+    def _load_distinct_cdx(self, summary, query):
+        """ Load first cdx line of each distinct urlkey for the query page,
+        skipping blocks which only contain the last loaded urlkey
+        """
+        idx_lines = list(self.compute_page_range(summary, query))
+        last_key = None
+
+        for i, idx_line in enumerate(idx_lines):
+            # next block also starts with last key, so no new keys in this block
+            if (last_key and i + 1 < len(idx_lines) and
+                idx_lines[i + 1].startswith(last_key + b' ')):
+                continue
+
+            for line in six.next(self.idx_to_cdx([idx_line], query)):
+                urlkey = line.split(b' ', 1)[0]
+                if urlkey != last_key:
+                    last_key = urlkey
+                    yield CDXObject(line)
+
+    def _load_block_reverse(self, idx_line, query):
+        block_iter = six.next(self.idx_to_cdx([idx_line], query))
+        block_iter = self.filter_lines(block_iter, query.params)
+        for line in reversed(list(block_iter)):
+            yield CDXObject(line)
+
+    def load_summary(self):
+        """ Load the summary into memory, or return the already loaded
+        summary if unchanged.
+
+        A local summary is checked for changes (by mtime and size) on
+        every query, a remote summary (by ETag or Last-Modified) only
+        once per reload interval. A remote summary with no such stamp
+        is kept until the reload interval expires, and then reloaded
+        """
+        now = datetime.datetime.now()
 
-        idx_iter = self.compute_page_range(reader, query)
+        if (self.summary_index is not None and not self._is_local_summary() and
+            now - self.summary_check_time < self.reload_interval):
+            return self.summary_index
+
+        self.summary_check_time = now
+
+        try:
+            stamp = self._get_summary_stamp()
+        except Exception as e:
+            if self.summary_index is None:
+                raise
+
+            logging.debug('Summary check failed, using loaded summary: ' + str(e))
+            return self.summary_index
+
+        # no stamp available, reload once the interval expired
+        if (self.summary_index is not None and stamp is not None and
+            stamp == self.summary_stamp):
+            return self.summary_index
+
+        logging.debug('Loading summary from: ' + self.summary)
+
+        self.summary_index = ZipNumSummary.load(self.blk_loader.load(self.summary))
+        self.summary_stamp = stamp
+        return self.summary_index
+
+    def get_index_version(self, params):
+        # remote summaries only checked once per reload interval
+        if not self._is_local_summary():
+            return None
+
+        try:
+            return self._get_summary_stamp()
+        except (IOError, OSError):
+            return None
+
+    def _is_local_summary(self):
+        return self.summary.startswith('file://') or '://' not in self.summary
+
+    def _get_summary_stamp(self):
+        if self._is_local_summary():
+            filename = self.summary
+            if filename.startswith('file://'):
+                filename = url2pathname(filename[len('file://'):])
+
+            stat = os.stat(filename)
+            return (stat.st_mtime, stat.st_size)
+
+        # eg. ETag, using the same loader profile and cookie as for loading
+        return self.blk_loader.get_stamp(self.summary)
+
+    def _do_load_cdx(self, summary, query):
+        idx_iter = self.compute_page_range(summary, query)
 
         if query.secondary_index_only:
             def gen_idx():
@@ -170,9 +437,16 @@ class ZipNumIndexSource(BaseIndexSource):
 
         blocks = self.idx_to_cdx(idx_iter, query)
 
+        block_filter = None
+        if self.columnar:
+            block_filter = ColumnarBlockFilter.from_query(query)
+
         def gen_cdx():
             for blk in blocks:
-                for cdx in blk:
+                if block_filter:
+                    blk = block_filter(blk)
+
+                for cdx in self.filter_lines(blk, query.params):
                     yield CDXObject(cdx)
 
         return gen_cdx()
@@ -185,60 +459,36 @@ class ZipNumIndexSource(BaseIndexSource):
         #return json.dumps(info) + '\n'
         return info
 
-    def compute_page_range(self, reader, query):
+    def compute_page_range(self, summary, query):
         pagesize = query.page_size
         if not pagesize:
             pagesize = self.max_blocks
         else:
             pagesize = int(pagesize)
 
-        last_line = None
+        num_lines = len(summary)
 
-        # Get End
-        end_iter = search(reader, query.end_key, prev_size=1)
+        # Get Start: line before first line >= key,
+        # or last line, as last block may still contain the key
+        first = max(summary.bisect(query.key) - 1, 0)
 
-        try:
-            end_line = six.next(end_iter)
-        except StopIteration:
-            last_line = read_last_line(reader)
-            end_line = last_line
-
-        # Get Start
-        first_iter = iter_range(reader,
-                                query.key,
-                                query.end_key,
-                                prev_size=1)
-
-        try:
-            first_line = six.next(first_iter)
-        except StopIteration:
-            if end_line == last_line and query.key >= last_line:
-                first_line = last_line
-            else:
-                reader.close()
-                if query.page_count:
-                    yield self._page_info(0, pagesize, 0)
-                    return
-                else:
-                    raise
+        # Get End: line before first line >= end_key, or last line
+        end = max(summary.bisect(query.end_key) - 1, 0)
 
-        first = IDXObject(first_line)
-
-        end = IDXObject(end_line)
+        if not num_lines or summary.get_key(first) >= query.end_key:
+            if query.page_count:
+                yield self._page_info(0, pagesize, 0)
+            return
 
-        try:
-            blocks = end['lineno'] - first['lineno']
-            total_pages = int(blocks / pagesize) + 1
-        except:
-            blocks = -1
-            total_pages = 1
+        blocks = end - first
+        total_pages = int(blocks / pagesize) + 1
 
         if query.page_count:
             # same line, so actually need to look at cdx
             # to determine if it exists
             if blocks == 0:
                 try:
-                    block_cdx_iter = self.idx_to_cdx([first_line], query)
+                    block_cdx_iter = self.idx_to_cdx([summary.get_line(first)], query)
                     block = six.next(block_cdx_iter)
                     cdx = six.next(block)
                 except StopIteration:
@@ -246,31 +496,18 @@ class ZipNumIndexSource(BaseIndexSource):
                     blocks = -1
 
             yield self._page_info(total_pages, pagesize, blocks + 1)
-            reader.close()
             return
 
         curr_page = query.page
         if curr_page >= total_pages or curr_page < 0:
             msg = 'Page {0} invalid: First Page is 0, Last Page is {1}'
-            reader.close()
             raise CDXException(msg.format(curr_page, total_pages - 1))
 
         startline = curr_page * pagesize
-        endline = startline + pagesize - 1
-        if blocks >= 0:
-            endline = min(endline, blocks)
-
-        if curr_page == 0:
-            yield first_line
-        else:
-            startline -= 1
-
-        idxiter = itertools.islice(first_iter, startline, endline)
-        for idx in idxiter:
-            yield idx
-
-        reader.close()
+        endline = min(startline + pagesize - 1, blocks)
 
+        for i in range(first + startline, first + endline + 1):
+            yield summary.get_line(i)
 
     def search_by_line_num(self, reader, line):  # pragma: no cover
         def line_cmp(line1, line2):
@@ -282,6 +519,18 @@ class ZipNumIndexSource(BaseIndexSource):
         yield six.next(line_iter)
 
     def idx_to_cdx(self, idx_iter, query):
+        block_groups = self.iter_block_groups(idx_iter)
+
+        if self.fetch_pool is not None:
+            return self.fetch_block_groups(list(block_groups), query)
+
+        return (self.block_to_cdx_iter(blocks, ranges, query)
+                for blocks, ranges in block_groups)
+
+    def iter_block_groups(self, idx_iter):
+        """ Group adjacent blocks in the same part, up to max_blocks,
+        yielding a ZipBlocks and list of block lengths for each group
+        """
         blocks = None
         ranges = []
 
@@ -298,7 +547,7 @@ class ZipNumIndexSource(BaseIndexSource):
 
             else:
                 if blocks:
-                    yield self.block_to_cdx_iter(blocks, ranges, query)
+                    yield blocks, ranges
 
                 blocks = ZipBlocks(idx['part'],
                                    idx['offset'],
@@ -308,20 +557,27 @@ class ZipNumIndexSource(BaseIndexSource):
                 ranges = [blocks.length]
 
         if blocks:
-            yield self.block_to_cdx_iter(blocks, ranges, query)
+            yield blocks, ranges
 
     def block_to_cdx_iter(self, blocks, ranges, query):
+        return self.try_locations(blocks.part, query,
+                                  self.load_blocks, blocks, ranges, query)
+
+    def try_locations(self, part, query, func, *args):
+        """ Call func(location, *args) for each location of part,
+        until one succeeds
+        """
         last_exc = None
         last_traceback = None
 
         try:
-            locations = self.loc_resolver(blocks.part, query)
+            locations = self.loc_resolver(part, query)
         except:
-            raise Exception('No Locations Found for: ' + blocks.part)
+            raise Exception('No Locations Found for: ' + part)
 
-        for location in self.loc_resolver(blocks.part, query):
+        for location in self.loc_resolver(part, query):
             try:
-                return self.load_blocks(location, blocks, ranges, query)
+                return func(location, *args)
             except Exception as exc:
                 last_exc = exc
                 import sys
@@ -331,42 +587,198 @@ class ZipNumIndexSource(BaseIndexSource):
             six.reraise(Exception, last_exc, last_traceback)
             #raise last_exc
         else:
-            raise Exception('No Locations Found for: ' + blocks.part)
+            raise Exception('No Locations Found for: ' + part)
+
+    def fetch_block_groups(self, block_groups, query):
+        """ Fetch and decompress all block groups concurrently, using the
+        fetch pool, and yield a line iterator for each group in order.
+
+        Groups in the same part separated by at most fetch_max_gap bytes
+        are coalesced into a single, widened range request
+        """
+        spans = []
+        for blocks, ranges in block_groups:
+            if spans:
+                last = spans[-1][-1][0]
+                last_end = last.offset + last.length
+                if (last.part == blocks.part and
+                    0 <= blocks.offset - last_end <= self.fetch_max_gap):
+                    spans[-1].append((blocks, ranges))
+                    continue
+
+            spans.append([(blocks, ranges)])
+
+        jobs = [self.fetch_pool.spawn(self.fetch_span, span, query)
+                for span in spans]
+
+        try:
+            for job in jobs:
+                for buffs in job.get():
+                    yield self._iter_bounded_lines(buffs, query)
+        finally:
+            gevent.killall(jobs, block=False)
+
+    def fetch_span(self, span, query):
+        """ Fetch all uncached blocks in a span of block groups, returning
+        list of decompressed block buffers for each group.
+
+        Uncached blocks are fetched with one range request for each run
+        of blocks separated by at most fetch_max_gap bytes, so cached
+        blocks are only fetched again if within a small enough gap
+        """
+        part = span[0][0].part
+        block_cache = self.block_cache
+
+        all_buffs = []
+        missing = []
+
+        for blocks, ranges in span:
+            buffs = []
+            offset = blocks.offset
+            for range_ in ranges:
+                buff = None
+                if block_cache is not None:
+                    buff = block_cache.get((part, offset, range_))
+
+                if buff is None:
+                    missing.append((len(all_buffs), len(buffs), offset, range_))
+
+                buffs.append(buff)
+                offset += range_
+
+            all_buffs.append(buffs)
+
+        if not missing:
+            return all_buffs
+
+        # [start, end, missing blocks] for each range request
+        fetches = []
+        max_gap = max(self.fetch_max_gap, 0)
+
+        for block in missing:
+            offset, range_ = block[2:]
+            if fetches and offset - fetches[-1][1] <= max_gap:
+                fetches[-1][1] = offset + range_
+                fetches[-1][2].append(block)
+            else:
+                fetches.append([offset, offset + range_, [block]])
+
+        for start, end, blocks in fetches:
+            data = self.try_locations(part, query, self.read_range, start, end - start)
+
+            for group_no, block_no, offset, range_ in blocks:
+                decomp = gzip_decompressor()
+                buff = decomp.decompress(data[offset - start:offset - start + range_])
+
+                if block_cache is not None:
+                    block_cache.put((part, offset, range_), buff)
+
+                all_buffs[group_no][block_no] = buff
+
+        return all_buffs
+
+    def read_range(self, location, offset, length):
+        if (logging.getLogger().getEffectiveLevel() <= logging.DEBUG):
+            msg = 'Fetching range {loc}:{offset}+{length}'
+            logging.debug(msg.format(loc=location, offset=offset, length=length))
+
+        reader = self.blk_loader.load(location, offset, length)
+        try:
+            data = []
+            remaining = length
+            while remaining > 0:
+                buff = reader.read(remaining)
+                if not buff:
+                    break
+
+                data.append(buff)
+                remaining -= len(buff)
+
+            return b''.join(data)
+        finally:
+            reader.close()
+
+    def _iter_bounded_lines(self, block_iter, query):
+        """ Chain lines from an iterator of blocks,
+        bounded by query.key and query.end_key
+        """
+        iter_ = itertools.chain.from_iterable(BytesIO(buff) for buff in block_iter)
+
+        # start bound
+        iter_ = linearsearch(iter_, query.key)
+
+        # end bound
+        iter_ = itertools.takewhile(lambda line: line < query.end_key, iter_)
+        return iter_
 
     def load_blocks(self, location, blocks, ranges, query):
         """ Load one or more blocks of compressed cdx lines, return
         a line iterator which decompresses and returns one line at a time,
         bounded by query.key and query.end_key
+
+        If the block cache is enabled, only blocks not already cached
+        are loaded, and newly decompressed blocks are added to the cache
         """
 
         if (logging.getLogger().getEffectiveLevel() <= logging.DEBUG):
             msg = 'Loading {b.count} blocks from {loc}:{b.offset}+{b.length}'
             logging.debug(msg.format(b=blocks, loc=location))
 
-        reader = self.blk_loader.load(location, blocks.offset, blocks.length)
+        block_cache = self.block_cache
+        end_offset = blocks.offset + blocks.length
+
+        def load_reader(offset):
+            return self.blk_loader.load(location, offset, end_offset - offset)
+
+        def is_cached(offset, range_):
+            return (block_cache is not None and
+                    (blocks.part, offset, range_) in block_cache)
+
+        # load eagerly from first uncached block to surface load errors here
+        reader = None
+        reader_offset = blocks.offset
+
+        for range_ in ranges:
+            if not is_cached(reader_offset, range_):
+                reader = load_reader(reader_offset)
+                break
 
-        def decompress_block(range_):
+            reader_offset += range_
+
+        def decompress_block(reader, range_):
             decomp = gzip_decompressor()
-            buff = decomp.decompress(reader.read(range_))
-            for line in BytesIO(buff):
-                yield line
+            return decomp.decompress(reader.read(range_))
 
-        def iter_blocks(reader):
+        def iter_blocks(reader, reader_offset):
+            offset = blocks.offset
             try:
-                for r in ranges:
-                    yield decompress_block(r)
+                for range_ in ranges:
+                    key = (blocks.part, offset, range_)
+                    buff = None
+                    if block_cache is not None:
+                        buff = block_cache.get(key)
+
+                    if buff is None:
+                        # not at this block, eg. skipped over cached blocks
+                        if not reader or reader_offset != offset:
+                            if reader:
+                                reader.close()
+                            reader = load_reader(offset)
+
+                        buff = decompress_block(reader, range_)
+                        reader_offset = offset + range_
+
+                        if block_cache is not None:
+                            block_cache.put(key, buff)
+
+                    offset += range_
+                    yield buff
             finally:
-                reader.close()
+                if reader:
+                    reader.close()
 
         # iterate over all blocks
-        iter_ = itertools.chain.from_iterable(iter_blocks(reader))
-
-        # start bound
-        iter_ = linearsearch(iter_, query.key)
-
-        # end bound
-        iter_ = itertools.takewhile(lambda line: line < query.end_key, iter_)
-        return iter_
+        return self._iter_bounded_lines(iter_blocks(reader, reader_offset), query)
 
     def __repr__(self):
         return 'ZipNumIndexSource({0}, {1})'.format(self.summary, self.config)
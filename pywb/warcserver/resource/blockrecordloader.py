@@ -3,16 +3,28 @@ from warcio.recordloader import ArcWarcRecordLoader
 
 from pywb.utils.loaders import BlockLoader
 from pywb.utils.io import BUFF_SIZE
+from pywb.utils.singleflight import SingleFlight
+
+from contextlib import closing
+from io import BytesIO
 
 
 #=================================================================
 class BlockArcWarcRecordLoader(ArcWarcRecordLoader):
+    DEFAULT_COALESCE_SIZE = 262144
+
     def __init__(self, loader=None, cookie_maker=None, block_size=BUFF_SIZE, *args, **kwargs):
         if not loader:
             loader = BlockLoader(cookie_maker=cookie_maker)
 
         self.loader = loader
         self.block_size = block_size
+
+        # concurrent loads of the same record, up to this size,
+        # share a single read
+        self.coalesce_size = kwargs.pop('coalesce_size', 0)
+        self.single_flight = SingleFlight() if self.coalesce_size else None
+
         super(BlockArcWarcRecordLoader, self).__init__(*args, **kwargs)
 
     def load(self, url, offset, length, no_record_parse=False):
@@ -24,7 +36,7 @@ class BlockArcWarcRecordLoader(ArcWarcRecordLoader):
         except:
             length = -1
 
-        stream = self.loader.load(url, int(offset), length)
+        stream = self.load_stream(url, int(offset), length)
         decomp_type = 'gzip'
 
         # Create decompressing stream
@@ -33,3 +45,17 @@ class BlockArcWarcRecordLoader(ArcWarcRecordLoader):
                                              block_size=self.block_size)
 
         return self.parse_record_stream(stream, no_record_parse=no_record_parse)
+
+    def load_stream(self, url, offset, length):
+        """ Open the raw record stream, or if coalescing, return a
+        buffer of the record read by this or a concurrent load
+        """
+        if not self.single_flight or length <= 0 or length > self.coalesce_size:
+            return self.loader.load(url, offset, length)
+
+        def read():
+            with closing(self.loader.load(url, offset, length)) as stream:
+                return stream.read()
+
+        buff, shared = self.single_flight((url, offset, length), read)
+        return BytesIO(buff)
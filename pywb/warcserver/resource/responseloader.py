@@ -12,6 +12,7 @@ from pywb.utils.io import StreamIter, compress_gzip_iter, call_release_conn
 from pywb.utils.format import ParamFormatter
 
 from pywb.warcserver.resource.resolvingloader import ResolvingLoader
+from pywb.warcserver.resource.blockrecordloader import BlockArcWarcRecordLoader
 from pywb.warcserver.resource.pathresolvers import DefaultResolverMixin
 
 from pywb.warcserver.http import DefaultAdapters
@@ -156,13 +157,18 @@ class BaseLoader(object):
 
 #=============================================================================
 class WARCPathLoader(DefaultResolverMixin, BaseLoader):
-    def __init__(self, paths, cdx_source):
+    def __init__(self, paths, cdx_source, coalesce_size=0):
         self.paths = paths
 
         self.resolvers = self.make_resolvers(self.paths)
 
+        loader_kwargs = {}
+        if coalesce_size:
+            loader_kwargs['record_loader'] = BlockArcWarcRecordLoader(coalesce_size=coalesce_size)
+
         self.resolve_loader = ResolvingLoader(self.resolvers,
-                                              no_record_parse=True)
+                                              no_record_parse=True,
+                                              **loader_kwargs)
 
         self.headers_parser = StatusAndHeadersParser([], verify=False)
 
@@ -224,6 +230,10 @@ class WARCPathLoader(DefaultResolverMixin, BaseLoader):
 
         return (warc_headers, http_headers_buff, payload.raw_stream)
 
+    def get_stats(self):
+        single_flight = getattr(self.resolve_loader.record_loader, 'single_flight', None)
+        return single_flight.stats() if single_flight else None
+
     def __str__(self):
         return  'WARCPathLoader'
 
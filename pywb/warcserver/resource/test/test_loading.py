@@ -300,9 +300,13 @@ from pywb.warcserver.resource.pathresolvers import DefaultResolverMixin
 
 from pywb.warcserver.index.cdxobject import CDXObject
 
+from pywb.utils.loaders import BlockLoader
+
 from pywb import get_test_dir
 from mock import patch
 
+import gevent
+
 
 #==============================================================================
 test_warc_dir = get_test_dir() + 'warcs/'
@@ -393,6 +397,50 @@ def print_strs(strings):
 
 
 
+#==============================================================================
+class SlowCountingLoader(object):
+    def __init__(self):
+        self.loads = 0
+        self.loader = BlockLoader()
+
+    def load(self, url, offset, length):
+        self.loads += 1
+        gevent.sleep(0.01)
+        return self.loader.load(url, offset, length)
+
+
+def load_concurrent(testloader, count=5):
+    path = test_warc_dir + 'example.warc.gz'
+    jobs = [gevent.spawn(testloader.load, path, '333', '1043') for i in range(count)]
+    gevent.joinall(jobs)
+
+    return [job.value.raw_stream.read() for job in jobs]
+
+
+def test_coalesced_record_loads():
+    loader = SlowCountingLoader()
+    testloader = BlockArcWarcRecordLoader(loader=loader, coalesce_size=2048)
+
+    bodies = load_concurrent(testloader)
+    assert loader.loads == 1
+    assert len(set(bodies)) == 1
+    assert b'Example Domain' in bodies[0]
+
+    assert testloader.single_flight.stats() == {'calls': 5, 'shared': 4, 'in_flight': 0}
+
+    # not cached once loaded
+    load_concurrent(testloader, 1)
+    assert loader.loads == 2
+
+
+def test_coalesced_record_loads_too_large():
+    loader = SlowCountingLoader()
+    testloader = BlockArcWarcRecordLoader(loader=loader, coalesce_size=1000)
+
+    bodies = load_concurrent(testloader)
+    assert loader.loads == 5
+    assert len(set(bodies)) == 1
+
 
 if __name__ == "__main__":
     import doctest
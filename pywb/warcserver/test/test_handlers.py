@@ -105,15 +105,15 @@ class TestBaseWarcServer(MementoOverrideTests, FakeRedisTests, BaseTestClass):
                                        '/urlagnost', '/urlagnost/postreq',
                                        '/invalid', '/invalid/postreq'])
 
-        assert res['/fallback'] == {'modes': ['list_sources', 'index', 'resource']}
+        assert res['/fallback'] == {'modes': ['list_sources', 'index', 'bulk', 'stats', 'resource']}
 
     def test_list_handlers(self):
         resp = self.testapp.get('/many')
-        assert resp.json == {'modes': ['list_sources', 'index', 'resource']}
+        assert resp.json == {'modes': ['list_sources', 'index', 'bulk', 'stats', 'resource']}
         assert 'ResErrors' not in resp.headers
 
         resp = self.testapp.get('/many/other')
-        assert resp.json == {'modes': ['list_sources', 'index', 'resource']}
+        assert resp.json == {'modes': ['list_sources', 'index', 'bulk', 'stats', 'resource']}
         assert 'ResErrors' not in resp.headers
 
     def test_list_errors(self):
@@ -474,6 +474,74 @@ host: www.youtube.com\
         assert resp.json == {'message': 'output=foobar not supported'}
         assert resp.text == resp.headers['ResErrors']
 
+    def test_index_resume_key(self):
+        url = '/many/index?url=http://www.iana.org/_css/*&sources=local&limit=2&showResumeKey=true'
+        resp = self.testapp.get(url)
+        resp.charset = 'utf-8'
+
+        lines = resp.text.split('\n')
+        assert len(lines) == 5
+        assert lines[0].startswith('org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 ')
+        assert lines[2] == ''
+        assert lines[4] == ''
+
+        url = '/many/index?url=http://www.iana.org/_css/*&sources=local&limit=2&output=json&resumeKey=' + lines[3]
+        resp = self.testapp.get(url)
+        resp.charset = 'utf-8'
+
+        cdxlist = list([json.loads(cdx) for cdx in resp.text.rstrip().split('\n')])
+        assert len(cdxlist) == 3
+        assert cdxlist[0]['timestamp'] == '20140126200930'
+        assert set(cdxlist[2].keys()) == {'resumeKey'}
+
+    def test_bulk_lookup(self):
+        lookups = [{'url': 'http://www.iana.org/_css/2013.1/fonts/inconsolata.otf', 'closest': '20140126201000'},
+                   {'url': 'http://example.com/'},
+                   {'url': 'http://not-found.error/'},
+                   {'url': 'http://www.iana.org/', 'filter': ['mime:text/html']},
+                   {'url': 'http://www.iana.org/_css/2013.1/fonts/inconsolata.otf', 'closest': 20140126201000}]
+
+        body = '\n'.join(json.dumps(lookup) for lookup in lookups)
+        resp = self.testapp.post('/many/bulk?sources=local&fields=urlkey,timestamp',
+                                 body, headers={'Content-Type': 'application/x-ndjson'})
+
+        assert resp.headers['Content-Type'] == 'application/x-ndjson'
+
+        resp.charset = 'utf-8'
+        res = [json.loads(line) for line in resp.text.rstrip().split('\n')]
+
+        assert res == [{'urlkey': 'org,iana)/_css/2013.1/fonts/inconsolata.otf', 'timestamp': '20140126200930'},
+                       {'urlkey': 'com,example)/', 'timestamp': '20130729195151'},
+                       {'url': 'http://not-found.error/', 'error': 'No Captures Found'},
+                       {'urlkey': 'org,iana)/', 'timestamp': '20140126200624'},
+                       {'urlkey': 'org,iana)/_css/2013.1/fonts/inconsolata.otf', 'timestamp': '20140126200930'}]
+
+    def test_error_bulk_lookup(self):
+        resp = self.testapp.get('/many/bulk?sources=local', status=400)
+        assert resp.json == {'message': 'A POST body with one json lookup per line is required'}
+
+        resp = self.testapp.post('/many/bulk?sources=local', '{"url": "http://example.com/"}\nfoo', status=400)
+        assert resp.json == {'message': 'Invalid bulk lookup on line 2'}
+
+    @patch('pywb.warcserver.handlers.IndexHandler.MAX_BULK_ENTRIES', 2)
+    @patch('pywb.warcserver.handlers.IndexHandler.MAX_BULK_BODY_SIZE', 100)
+    def test_error_bulk_lookup_limits(self):
+        line = '{"url": "http://example.com/"}\n'
+
+        resp = self.testapp.post('/many/bulk?sources=local', line * 3, status=400)
+        assert resp.json == {'message': 'Bulk lookup is over 2 lookups'}
+
+        resp = self.testapp.post('/many/bulk?sources=local', line * 4, status=400)
+        assert resp.json == {'message': 'Bulk lookup body is over 100 bytes'}
+
+        resp = self.testapp.post('/many/bulk?sources=local', line * 2)
+        assert len(resp.text.splitlines()) == 2
+
+    def test_error_invalid_resume_key(self):
+        resp = self.testapp.get('/many/index?url=http://www.iana.org/&sources=local&resumeKey=abc', status=400)
+
+        assert resp.json == {'message': 'Invalid resumeKey: abc'}
+
     @patch('pywb.warcserver.index.indexsource.MementoIndexSource.get_timegate_links', MementoOverrideTests.mock_link_header('select_not_found'))
     def test_error_local_not_found(self):
         resp = self.testapp.get('/many/resource?url=http://not-found.error/&sources=local', status=404)
@@ -29,7 +29,7 @@ class UpstreamMementoIndexSource(BaseIndexSource):
 
     def load_index(self, params):
         cdx = CDXObject()
-        cdx['urlkey'] = params.get('key').decode('utf-8')
+        cdx['urlkey'] = params.get('key').split(b' ', 1)[0].decode('utf-8')
 
         closest = params.get('closest')
         cdx['timestamp'] = closest if closest else timestamp_now()
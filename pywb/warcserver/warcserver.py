@@ -11,6 +11,12 @@ from pywb.warcserver.index.indexsource import FileIndexSource, RemoteIndexSource
 from pywb.warcserver.index.indexsource import MementoIndexSource, RedisIndexSource
 from pywb.warcserver.index.indexsource import LiveIndexSource, WBMementoIndexSource
 from pywb.warcserver.index.zipnum import ZipNumIndexSource
+from pywb.warcserver.index.binaryindex import BinaryIndexSource
+from pywb.warcserver.index.sqliteindex import SqliteIndexSource
+from pywb.warcserver.index.resultcache import ResultCache, NotFoundCache
+from pywb.warcserver.index.coalesce import QueryCoalescer
+
+from pywb.warcserver.resource.blockrecordloader import BlockArcWarcRecordLoader
 
 from pywb import DEFAULT_CONFIG
 
@@ -24,6 +30,8 @@ SOURCE_LIST = [LiveIndexSource,
                RedisMultiKeyIndexSource,
                MementoIndexSource,
                CacheDirectoryIndexSource,
+               BinaryIndexSource,
+               SqliteIndexSource,
                FileIndexSource,
                RemoteIndexSource,
                ZipNumIndexSource,
@@ -87,11 +95,17 @@ class WarcServer(BaseWarcServer):
         #indexes_templ = os.path.join('{coll}', 'indexes') + os.path.sep
         self.indexes_templ = self.AUTO_DIR_INDEX_PATH.replace('/', os.path.sep)
         dir_source = CacheDirectoryIndexSource(self.root_dir, self.indexes_templ)
+        dir_source.result_cache = ResultCache.init_from_config(self.config.get('result_cache'))
+
+        coalesce = self.config.get('coalesce')
+        dir_source.query_coalescer = QueryCoalescer.init_from_config(coalesce)
 
         self.archive_templ = self.AUTO_DIR_ARCHIVE_PATH.replace('/', os.path.sep)
         self.archive_templ = os.path.join(self.root_dir, self.archive_templ)
 
-        handler = DefaultResourceHandler(dir_source, self.archive_templ)
+        handler = DefaultResourceHandler(dir_source, self.archive_templ,
+                                         coalesce_size=get_coalesce_size(coalesce))
+        handler.fuzzy.not_found_cache = NotFoundCache.init_from_config(self.config.get('not_found_cache'))
 
         return handler
 
@@ -155,8 +169,24 @@ class WarcServer(BaseWarcServer):
         else:
             raise Exception('collection config must be string or dict')
 
+        agg_opts = {}
+        result_cache = self.config.get('result_cache')
+        not_found_cache = self.config.get('not_found_cache')
+        coalesce = self.config.get('coalesce')
+
+        if isinstance(coll_config, dict):
+            if coll_config.get('revisit_cache_size'):
+                agg_opts['revisit_cache_size'] = int(coll_config['revisit_cache_size'])
+
+            result_cache = coll_config.get('result_cache', result_cache)
+            not_found_cache = coll_config.get('not_found_cache', not_found_cache)
+            coalesce = coll_config.get('coalesce', coalesce)
+
+        agg_opts['result_cache'] = ResultCache.init_from_config(result_cache)
+        agg_opts['query_coalescer'] = QueryCoalescer.init_from_config(coalesce)
+
         if index:
-            agg = init_index_agg({name: index})
+            agg = init_index_agg({name: index}, **agg_opts)
 
         else:
             if not isinstance(coll_config, dict):
@@ -171,12 +201,17 @@ class WarcServer(BaseWarcServer):
                 raise Exception('no index, index_group or sequence found')
 
             timeout = int(coll_config.get('timeout', 0))
-            agg = init_index_agg(index_group, True, timeout)
+            agg_opts['adaptive_timeout'] = coll_config.get('adaptive_timeout')
+            agg_opts['early_exit'] = coll_config.get('early_exit')
+            agg = init_index_agg(index_group, True, timeout, **agg_opts)
 
         if not resource:
             resource = self.default_archive_paths
 
-        return DefaultResourceHandler(agg, resource)
+        handler = DefaultResourceHandler(agg, resource,
+                                         coalesce_size=get_coalesce_size(coalesce))
+        handler.fuzzy.not_found_cache = NotFoundCache.init_from_config(not_found_cache)
+        return handler
 
     def init_sequence(self, coll_name, seq_config):
         if not isinstance(seq_config, list):
@@ -215,6 +250,20 @@ def init_index_source(value, source_list=None):
     raise Exception('No Index Source Found for: ' + str(value))
 
 
+# ============================================================================
+def get_coalesce_size(config):
+    """ Max size of records for which concurrent loads share a single read,
+    from the 'coalesce' config, or 0 if not coalescing
+    """
+    if not config:
+        return 0
+
+    if not isinstance(config, dict):
+        config = {}
+
+    return int(config.get('max_record_size', BlockArcWarcRecordLoader.DEFAULT_COALESCE_SIZE))
+
+
 # ============================================================================
 def register_source(source_cls, end=False):
     if not end:
@@ -224,14 +273,15 @@ def register_source(source_cls, end=False):
 
 
 # ============================================================================
-def init_index_agg(source_configs, use_gevent=False, timeout=0, source_list=None):
+def init_index_agg(source_configs, use_gevent=False, timeout=0, source_list=None,
+                   **kwargs):
     sources = {}
     for n, v in iteritems(source_configs):
         sources[n] = init_index_source(v, source_list=source_list)
 
     if use_gevent:
-        return GeventTimeoutAggregator(sources, timeout=timeout)
+        return GeventTimeoutAggregator(sources, timeout=timeout, **kwargs)
     else:
-        return SimpleAggregator(sources)
+        return SimpleAggregator(sources, **kwargs)
 
 
@@ -448,6 +448,60 @@ class TestManagedColls(CollsDirMixin, BaseTestClass):
         # Nothing else to migrate
         main(['cdx-convert', migrate_dir])
 
+    def test_convert_binary_cdx(self):
+        """ Convert collection index to binary index, check replay
+        """
+        main(['init', 'binary'])
+        main(['add', 'binary', self._get_sample_warc('example.warc.gz')])
+
+        index_dir = os.path.join(self.root_dir, COLLECTIONS, 'binary', INDEX_DIR)
+        assert os.listdir(index_dir) == [INDEX_FILE]
+
+        @patch('pywb.manager.manager.get_input', lambda x: 'n')
+        def do_convert_no():
+            main(['cdx-binary', index_dir])
+
+        do_convert_no()
+        assert os.listdir(index_dir) == [INDEX_FILE]
+
+        main(['cdx-binary', '-f', index_dir])
+        assert os.listdir(index_dir) == ['index.cdxb']
+
+        self._create_app()
+        resp = self.testapp.get('/binary/20140103030321/http://example.com?example=1')
+        assert resp.status_int == 200
+
+        # Nothing else to convert
+        main(['cdx-binary', index_dir])
+
+    def test_sqlite_index(self):
+        """ Move collection index to sqlite, add more warcs, check replay
+        """
+        main(['init', 'sqlite'])
+        main(['add', 'sqlite', self._get_sample_warc('example.warc.gz')])
+
+        index_dir = os.path.join(self.root_dir, COLLECTIONS, 'sqlite', INDEX_DIR)
+
+        main(['sqlite', 'sqlite'])
+        assert os.listdir(index_dir) == ['index.sqlite']
+
+        # added to sqlite index
+        main(['add', 'sqlite', self._get_sample_warc('iana.warc.gz')])
+        assert os.listdir(index_dir) == ['index.sqlite']
+
+        self._create_app()
+        resp = self.testapp.get('/sqlite/20140103030321/http://example.com?example=1')
+        assert resp.status_int == 200
+
+        resp = self.testapp.get('/sqlite/20140126200624/http://www.iana.org/')
+        assert resp.status_int == 200
+
+        main(['reindex', 'sqlite'])
+        assert os.listdir(index_dir) == ['index.sqlite']
+
+        resp = self.testapp.get('/sqlite/20140126200624/http://www.iana.org/')
+        assert resp.status_int == 200
+
     def test_auto_index(self):
         main(['init', 'auto'])
         auto_dir = os.path.join(self.root_dir, COLLECTIONS, 'auto')